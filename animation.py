@@ -0,0 +1,173 @@
+# animation.py
+"""Meteor approach and impact animation, blitted over the cached base layer and encoded with imageio.
+
+Frames are drawn at ANIMATION_WIDTH on a figure whose background is the downscaled base layer:
+the background is rendered once, and every frame restores it and draws only the animated
+artists (trail, blast) plus the pre-sized meteor sprite. Importing this module imports matplotlib.
+"""
+import importlib.util
+
+import imageio.v3 as iio
+from matplotlib.patches import Circle
+import numpy as np
+from PIL import Image
+
+from figure_pool import FIGURES
+from map_render import MAP_DPI, METEOR_ZOOM, _axes_pixel_box, _meteor_master, meteor_sprite
+from map_style import MAP_EXTENT
+
+ANIMATION_WIDTH = 640  # pixels (why: a 1900 px base layer makes every frame 9x the work)
+ANIMATION_FPS = 30
+APPROACH_FRAMES = 40  # meteor travelling to the impact point
+BLAST_FRAMES = 24  # destruction radii expanding
+HOLD_FRAMES = 8  # final state before the clip loops
+FLASH_FRAMES = 8
+APPROACH_OFFSET = (24, 14)  # map units east and north of the impact the meteor enters from
+
+def clip_formats() -> tuple:
+    """Encodings available here: GIF always, MP4 when imageio has the PyAV plugin's backend."""
+    return ("gif", "mp4") if importlib.util.find_spec("av") else ("gif",)
+
+def approach_path(impact_pos: tuple, n: int=APPROACH_FRAMES) -> np.ndarray:
+    """(n, 2) meteor positions from the map edge side to the impact, accelerating."""
+    ix, iy = impact_pos
+    inicio = np.array([min(MAP_EXTENT[1], ix + APPROACH_OFFSET[0]), min(MAP_EXTENT[3], iy + APPROACH_OFFSET[1])])
+    t = (np.arange(n) / max(1, n - 1)) ** 2
+    return inicio + (np.array([ix, iy]) - inicio) * t[:, None]
+
+# --- Frames ---
+def _background(base_layer: dict, width: int) -> np.ndarray:
+    """Base layer resampled to `width` pixels, RGB; height rounded to even (why: H.264 needs it)."""
+    alto, ancho = base_layer["rgba"].shape[:2]
+    height = 2 * round(alto * width / ancho / 2)
+    return np.asarray(Image.fromarray(base_layer["rgba"]).convert('RGB').resize((width, height), Image.BILINEAR))
+
+def _paste_sprite(frame: np.ndarray, sprite: np.ndarray, cx: float, cy: float):
+    """Alpha-blend an RGBA sprite centered on pixel (cx, cy), clipped to the frame."""
+    alto, ancho = sprite.shape[:2]
+    top, left = round(cy - alto / 2), round(cx - ancho / 2)
+    y0, x0 = max(top, 0), max(left, 0)
+    y1, x1 = min(top + alto, frame.shape[0]), min(left + ancho, frame.shape[1])
+    if y0 >= y1 or x0 >= x1:
+        return
+    src = sprite[y0 - top:y1 - top, x0 - left:x1 - left].astype(np.uint16)
+    dst = frame[y0:y1, x0:x1, :3].astype(np.uint16)
+    a = src[..., 3:]
+    frame[y0:y1, x0:x1, :3] = ((src[..., :3] * a + dst * (255 - a) + 127) // 255).astype(np.uint8)
+
+def render_frames(base_layer: dict, impact_pos: tuple, r_total: float, r_partial: float,
+                  style: str='rocky', width: int=ANIMATION_WIDTH) -> np.ndarray:
+    """(frames, height, width, 4) uint8 RGBA: approach, impact flash, expanding radii, hold.
+
+    RGBA as the canvas holds it (why: an RGB copy of each frame costs more than drawing it).
+    """
+    fondo = _background(base_layer, width)
+    height = fondo.shape[0]
+    escala = width / base_layer["rgba"].shape[1]
+    dpi = MAP_DPI * escala  # (why: line widths and the sprite keep their size relative to the map)
+
+    # Pooled figure, not pyplot (why: this runs on worker threads)
+    with FIGURES.figure((width / dpi, height / dpi), dpi) as fig:
+        return _draw_frames(fig, base_layer, fondo, dpi, impact_pos, r_total, r_partial, style)
+
+def _draw_frames(fig, base_layer: dict, fondo: np.ndarray, dpi: float, impact_pos: tuple,
+                 r_total: float, r_partial: float, style: str) -> np.ndarray:
+    canvas = fig.canvas
+    fig.figimage(fondo, 0, 0)
+    ancho_base, alto_base = base_layer["rgba"].shape[1], base_layer["rgba"].shape[0]
+    left, top, right, bottom = _axes_pixel_box(base_layer)
+    ax = fig.add_axes((left / ancho_base, 1 - bottom / alto_base, (right - left) / ancho_base, (bottom - top) / alto_base))
+    ax.set_xlim(MAP_EXTENT[0], MAP_EXTENT[1])
+    ax.set_ylim(MAP_EXTENT[2], MAP_EXTENT[3])
+    ax.axis('off')
+    canvas.draw()
+    fondo_guardado = canvas.copy_from_bbox(fig.bbox)
+
+    # Animated artists, styled like the static overlay in map_render.draw_impact_overlay
+    ix, iy = impact_pos
+    camino = approach_path(impact_pos)
+    # Sprite pasted in numpy (why: an OffsetImage is resampled on every draw, even at zoom 1)
+    meteoro = meteor_sprite(style, round(_meteor_master(style).shape[1] * 1.2 * METEOR_ZOOM * dpi / 72))
+    pixeles = ax.transData.transform(camino)
+    estela, = ax.plot(camino[:1, 0], camino[:1, 1], 'r--', alpha=0.7, linewidth=2, animated=True)
+    marca, = ax.plot(ix, iy, 'X', color='red', markersize=15, markeredgecolor='white', animated=True)
+    destello = Circle((ix, iy), radius=0, facecolor='#fff3b0', edgecolor='none', animated=True)
+    parcial = Circle((ix, iy), radius=0, facecolor='orange', alpha=0.12, edgecolor='orange', linewidth=1, animated=True)
+    total = Circle((ix, iy), radius=0, facecolor='red', alpha=0.15, edgecolor='red', linewidth=1, animated=True)
+    for patch in (destello, parcial, total):
+        ax.add_patch(patch)
+
+    n_frames = APPROACH_FRAMES + BLAST_FRAMES + HOLD_FRAMES
+    frames = np.empty((n_frames,) + np.asarray(canvas.buffer_rgba()).shape, dtype=np.uint8)
+
+    def blit(k: int, artistas: tuple):
+        canvas.restore_region(fondo_guardado)
+        for artista in artistas:
+            ax.draw_artist(artista)
+        frames[k] = np.asarray(canvas.buffer_rgba())
+
+    for k, (x, y) in enumerate(camino):
+        estela.set_data([camino[0, 0], x], [camino[0, 1], y])
+        blit(k, (estela,))
+        px, py = pixeles[k]
+        _paste_sprite(frames[k], meteoro, px, frames.shape[1] - py)  # display y runs upwards
+
+    for k in range(BLAST_FRAMES + HOLD_FRAMES):
+        avance = 1 - (1 - min(1.0, (k + 1) / BLAST_FRAMES)) ** 3  # ease-out
+        parcial.set_radius(r_partial * avance)
+        total.set_radius(r_total * avance)
+        artistas = (parcial, total, marca)
+        if k < FLASH_FRAMES:
+            destello.set_radius(max(r_total, 1.0) * (0.5 + k / FLASH_FRAMES))
+            destello.set_alpha(0.8 * (1 - k / FLASH_FRAMES))
+            artistas = (destello,) + artistas
+        blit(APPROACH_FRAMES + k, artistas)
+    return frames
+
+# --- Encoding ---
+def _indexed_frames(frames: np.ndarray) -> tuple:
+    """(palette indices per frame, 768-byte palette) from one palette shared by the whole clip.
+
+    Pixels are mapped through a 6-bit-per-channel lookup table of the palette, built with a
+    single Pillow call, and only inside the box that changed since the previous frame (why:
+    per-frame quantize calls cost more than rendering the frames).
+    """
+    muestra = Image.fromarray(np.concatenate([frames[APPROACH_FRAMES - 1], frames[-1]])[..., :3])
+    paleta = muestra.quantize(256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+    niveles = np.arange(64, dtype=np.uint8) * 4 + 2  # centre of each 6-bit bucket
+    b, g, r = np.meshgrid(niveles, niveles, niveles, indexing='ij')
+    rejilla = np.stack([r, g, b], axis=-1).reshape(512, 512, 3)
+    tabla = np.asarray(Image.fromarray(rejilla).quantize(palette=paleta, dither=Image.Dither.NONE)).ravel()
+
+    # One uint32 per RGBA pixel: R | G << 8 | B << 16 on little-endian hosts
+    pixeles = frames.view('<u4')[..., 0]
+
+    def indices(v: np.ndarray) -> np.ndarray:
+        return tabla[((v & 0xFC) >> 2) | ((v & 0xFC00) >> 4) | ((v & 0xFC0000) >> 6)]
+
+    salida = np.empty(frames.shape[:3], dtype=np.uint8)
+    salida[0] = indices(pixeles[0])
+    for k in range(1, len(frames)):
+        salida[k] = salida[k - 1]
+        cambiado = pixeles[k] != pixeles[k - 1]
+        filas = np.flatnonzero(cambiado.any(axis=1))
+        if filas.size:
+            cols = np.flatnonzero(cambiado[filas[0]:filas[-1] + 1].any(axis=0))
+            region = (slice(filas[0], filas[-1] + 1), slice(cols[0], cols[-1] + 1))
+            salida[k][region] = indices(pixeles[k][region])
+    return salida, bytes(paleta.getpalette()[:768])
+
+def encode_clip(frames: np.ndarray, fmt: str='gif', fps: int=ANIMATION_FPS) -> bytes:
+    """Encode frames as a looping GIF or an H.264 MP4 with imageio."""
+    if fmt == "mp4":
+        return iio.imwrite("<bytes>", frames[..., :3], extension=".mp4", plugin="pyav", codec="h264", fps=fps)
+    indices, paleta = _indexed_frames(frames)
+    # "L" frames plus the palette (why: Pillow then maps each frame 1:1 instead of re-quantizing it)
+    return iio.imwrite("<bytes>", indices, extension=".gif", mode="L", palette=paleta,
+                       duration=1000 / fps, loop=0)
+
+def render_clip(base_layer: dict, result: dict, style: str='rocky', fmt: str='gif') -> bytes:
+    """Approach and impact clip of a simulation result."""
+    frames = render_frames(base_layer, result["punto_impacto"], result["radio_destruccion_total"],
+                           result["radio_destruccion_parcial"], style)
+    return encode_clip(frames, fmt)
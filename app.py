@@ -1,24 +1,31 @@
 # app.py
+"""Impact Simulator page. Run with `streamlit run app.py`.
+
+Importing this module has no side effects (the page is drawn by main()), and matplotlib,
+pandas, plotly and the 3D globe are imported only on the paths that draw with them.
+"""
 import streamlit as st
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
-from matplotlib.patches import Circle, Rectangle, Polygon, Ellipse
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
-import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import metadata
 from PIL import Image
-import io
 import os
+import base64
+import hashlib
+import json
+import time
 
-# --- Page config ---
-st.set_page_config(
-    page_title="Impact Simulator - China",
-    page_icon="🗺️",
-    layout="wide"
-)
+from impact_model import PROVINCE_TABLE, poblacion_china, simulate_impact_china
+from map_style import METEOR_STYLES
+from assets import CACHE_DIR, file_digest, fitted_size, image_at
+from county_model import COUNTIES_FILE
+import tracing
+from result_cache import ResultCache, clip_key, disk_dir_from_env, impact_png_key, result_key
+from shared_state import SESSION_MEMORY_BYTES, done_future, freeze, session_nbytes
+from risk_surface import GRID_LAT, GRID_LON, bucket_heatmap, diameter_bucket, get_risk_surface, lookup_total, nearest_province
 
 # --- Custom CSS ---
-st.markdown("""
+PAGE_CSS = """
 <style>
     .main-header {
         font-size: 3rem;
@@ -84,241 +91,101 @@ st.markdown("""
         margin: 1rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
-
-# --- Header ---
-st.markdown('<h1 class="main-header">Impact Simulator - China</h1>', unsafe_allow_html=True)
+"""
 
 # Asset file expected in the project directory
 MAPA_CHINA_FILE = "mapa_china.png"
 
-# --- Provinces population (thousands) ---
-poblacion_china = {
-    'guangdong': {
-        'nombre': 'Guangdong',
-        'poblacion': 126012,  # thousands (126M)
-        'coordenadas': {'x_min': 80, 'x_max': 95, 'y_min': 15, 'y_max': 25},
-        'descripcion': 'Most populous province in China'
-    },
-    'shandong': {
-        'nombre': 'Shandong',
-        'poblacion': 101527,
-        'coordenadas': {'x_min': 90, 'x_max': 105, 'y_min': 20, 'y_max': 30},
-        'descripcion': 'Eastern coastal province'
-    },
-    'henan': {
-        'nombre': 'Henan',
-        'poblacion': 99365,
-        'coordenadas': {'x_min': 75, 'x_max': 90, 'y_min': 25, 'y_max': 35},
-        'descripcion': 'Heart of Central China'
-    },
-    'jiangsu': {
-        'nombre': 'Jiangsu',
-        'poblacion': 84748,
-        'coordenadas': {'x_min': 95, 'x_max': 110, 'y_min': 10, 'y_max': 20},
-        'descripcion': 'Developed economic zone'
-    },
-    'sichuan': {
-        'nombre': 'Sichuan',
-        'poblacion': 83675,
-        'coordenadas': {'x_min': 55, 'x_max': 75, 'y_min': 20, 'y_max': 35},
-        'descripcion': 'Southwestern province'
-    },
-    'hebei': {
-        'nombre': 'Hebei',
-        'poblacion': 75919,
-        'coordenadas': {'x_min': 80, 'x_max': 95, 'y_min': 10, 'y_max': 20},
-        'descripcion': 'Surrounds Beijing'
-    },
-    'hunan': {
-        'nombre': 'Hunan',
-        'poblacion': 69185,
-        'coordenadas': {'x_min': 70, 'x_max': 85, 'y_min': 20, 'y_max': 30},
-        'descripcion': 'Central province'
-    },
-    'anhui': {
-        'nombre': 'Anhui',
-        'poblacion': 63236,
-        'coordenadas': {'x_min': 90, 'x_max': 105, 'y_min': 10, 'y_max': 20},
-        'descripcion': 'Eastern China'
-    },
-    'hubei': {
-        'nombre': 'Hubei',
-        'poblacion': 59172,
-        'coordenadas': {'x_min': 75, 'x_max': 90, 'y_min': 20, 'y_max': 30},
-        'descripcion': 'Central China'
-    },
-    'zhejiang': {
-        'nombre': 'Zhejiang',
-        'poblacion': 58500,
-        'coordenadas': {'x_min': 100, 'x_max': 115, 'y_min': 30, 'y_max': 40},
-        'descripcion': 'Developed east coast'
-    }
-}
-
-# --- Critical points (labels in English) ---
-puntos_criticos_china = {
-    'beijing': {'x': 92, 'y': 45, 'nombre': 'Beijing', 'tipo': 'capital'},
-    'shanghai': {'x': 102, 'y': 28, 'nombre': 'Shanghai', 'tipo': 'economic'},
-    'guangzhou': {'x': 87, 'y': 20, 'nombre': 'Guangzhou', 'tipo': 'economic'},
-    'shenzhen': {'x': 90, 'y': 18, 'nombre': 'Shenzhen', 'tipo': 'technology'},
-    'wuhan': {'x': 82, 'y': 30, 'nombre': 'Wuhan', 'tipo': 'industrial'},
-    'xian': {'x': 70, 'y': 38, 'nombre': "Xi'an", 'tipo': 'cultural'}
-}
+# Browser-side renderers load the map image from here when static serving is on
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+PLOTLY_RENDERER = "Plotly (interactive)"
+BROWSER_MAP_MAX_SIZE = (1280, 1024)  # largest map image sent to browser renderers (px)
+GLOBE_RENDERER = "3D globe"
+GLOBE_VIEW_SIZES = [300, 450, 600, 900]  # globe view heights (px) offered in the sidebar
+COUNTY_MODEL = "County polygons"
+BASE_LAYER_VERSION = 2  # bump when map_render's base map changes (invalidates cached layers)
+SESSION_TRACES = 20  # reruns a ?debug=1 session keeps of its own timings
 
 def load_china_image() -> Image.Image:
     """Load China map image or fallback to a generated sketch (user-facing messages in English)."""
     try:
         if os.path.exists(MAPA_CHINA_FILE):
-            imagen_china = Image.open(MAPA_CHINA_FILE)
+            # Decoded once into the asset cache; later processes memory-map it
+            imagen_china = Image.fromarray(image_at(MAPA_CHINA_FILE))
             st.success(f"China map loaded: {MAPA_CHINA_FILE}")
             return imagen_china
         else:
             st.warning(f"File {MAPA_CHINA_FILE} not found. Using a fallback map.")
+            from map_render import generate_fallback_map
             return generate_fallback_map()
     except Exception as e:
         st.error(f"Error loading China map: {e}")
+        from map_render import generate_fallback_map
         return generate_fallback_map()
 
-def generate_fallback_map() -> Image.Image:
-    """Generate a simplified China-like map as an image (why: ensures app works without external asset)."""
-    fig, ax = plt.subplots(figsize=(10, 8))
-    ax.set_facecolor('#1a1a2e')
-
-    china_outline = np.array([
-        [50, 10], [60, 15], [70, 20], [80, 25], [90, 30], [100, 35],
-        [110, 30], [115, 25], [120, 20], [115, 15], [105, 10],
-        [95, 5], [85, 10], [75, 15], [65, 20], [55, 15], [50, 10]
-    ])
-
-    polygon = Polygon(china_outline, closed=True, facecolor='#2c3e50',
-                      edgecolor='white', alpha=0.8, linewidth=2)
-    ax.add_patch(polygon)
-
-    # Rivers (decorative)
-    ax.plot([65, 85, 100], [35, 30, 25], 'b-', linewidth=3, alpha=0.6, label='Yangtze River')
-    ax.plot([55, 75, 90], [40, 35, 30], 'b-', linewidth=2, alpha=0.6, label='Yellow River')
-
-    ax.set_xlim(50, 120)
-    ax.set_ylim(5, 45)
-    ax.set_aspect('equal')
-    ax.axis('off')
-    ax.set_title('China Map - Impact Simulator', fontsize=16, color='white', pad=20)
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight',
-                facecolor='#1a1a2e', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
-    return Image.open(buf)
-
-def create_meteor(size: float) -> io.BytesIO:
-    """Create a small meteor image with gradient (why: better visual cue)."""
-    fig, ax = plt.subplots(figsize=(2, 2))
-    ax.set_xlim(0, 1)
-    ax.set_ylim(0, 1)
-
-    ax.add_patch(Circle((0.5, 0.5), 0.4, facecolor='#2F4F4F', edgecolor='#000000', linewidth=2, alpha=0.9))
-    ax.add_patch(Circle((0.5, 0.5), 0.3, facecolor='#654321', edgecolor='none', alpha=0.8))
-    ax.add_patch(Circle((0.5, 0.5), 0.2, facecolor='#8B4500', edgecolor='none', alpha=0.9))
-    ax.add_patch(Circle((0.5, 0.5), 0.1, facecolor='#8B0000', edgecolor='none', alpha=1.0))
-    ax.add_patch(Circle((0.35, 0.35), 0.05, facecolor='#FF4500', alpha=0.7))
-    for i in range(3):
-        ax.add_patch(Ellipse((0.8 - i*0.1, 0.5), 0.15, 0.08, angle=30, facecolor='#FF8C00', alpha=0.4 - i*0.1))
-
-    ax.set_aspect('equal')
-    ax.axis('off')
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight', pad_inches=0,
-                facecolor='none', transparent=True)
-    buf.seek(0)
-    plt.close(fig)
-    return buf
-
-def create_china_map(imagen_china: Image.Image, show_meteor: bool=False,
-                     impact_pos: tuple|None=None, meteor_size: float=1.0):
-    """Draw provinces, critical points, and optional meteor."""
-    fig, ax = plt.subplots(figsize=(10, 8))
-    ax.imshow(imagen_china, extent=[50, 120, 5, 45], alpha=0.8)
-
-    for provincia_id, provincia in poblacion_china.items():
-        coords = provincia['coordenadas']
-        ancho = coords['x_max'] - coords['x_min']
-        alto = coords['y_max'] - coords['y_min']
-
-        poblacion = provincia['poblacion']
-        if poblacion > 100000:
-            color, alpha = '#e74c3c', 0.4
-        elif poblacion > 80000:
-            color, alpha = '#e67e22', 0.35
-        elif poblacion > 60000:
-            color, alpha = '#f1c40f', 0.3
-        else:
-            color, alpha = '#27ae60', 0.25
-
-        rect = Rectangle((coords['x_min'], coords['y_min']), ancho, alto,
-                         facecolor=color, alpha=alpha, edgecolor=color, linewidth=2)
-        ax.add_patch(rect)
-
-        cx = (coords['x_min'] + coords['x_max']) / 2
-        cy = (coords['y_min'] + coords['y_max']) / 2
-
-        ax.text(cx, cy,
-                f"{provincia['nombre']}\n{provincia['poblacion']:,} thousand",
-                ha='center', va='center', fontsize=7, weight='bold',
-                bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.9))
-
-    for punto_id, punto in puntos_criticos_china.items():
-        if punto['tipo'] == 'capital':
-            marker, color = 's', 'red'
-        elif punto['tipo'] == 'economic':
-            marker, color = 'o', 'blue'
-        elif punto['tipo'] == 'technology':
-            marker, color = 'D', 'green'
-        elif punto['tipo'] == 'industrial':
-            marker, color = '^', 'orange'
-        else:
-            marker, color = 'v', 'purple'
-
-        ax.plot(punto['x'], punto['y'], marker=marker, color=color,
-                markersize=10, markeredgecolor='white', linewidth=2)
-        ax.text(punto['x'], punto['y'] + 2, punto['nombre'],
-                ha='center', va='bottom', fontsize=7, weight='bold',
-                bbox=dict(boxstyle="round,pad=0.2", facecolor='white', alpha=0.8))
-
-    if show_meteor and impact_pos:
-        mx = impact_pos[0]
-        my = min(45, impact_pos[1] + 20)
-
-        meteor_img = create_meteor(meteor_size)
-        img = plt.imread(meteor_img)
-        imagebox = OffsetImage(img, zoom=meteor_size * 0.08)
-        ab = AnnotationBbox(imagebox, (mx, my), frameon=False, pad=0)
-        ax.add_artist(ab)
-
-        ax.plot([mx, impact_pos[0]], [my, impact_pos[1]], 'r--', alpha=0.7, linewidth=2, label='Meteor Path')
-        ax.plot(impact_pos[0], impact_pos[1], 'X', color='red',
-                markersize=15, markeredgecolor='white', linewidth=2, label='Impact Point')
-
-    ax.set_xlim(50, 120)
-    ax.set_ylim(5, 45)
-    ax.set_aspect('equal')
-    ax.set_title('China Map - Impact Simulator\n(Provinces by population)', fontsize=16, fontweight='bold', pad=20)
-    ax.set_xlabel('East Longitude')
-    ax.set_ylabel('North Latitude')
-    ax.grid(False)
-
-    legend_elements = [
-        plt.Line2D([0], [0], marker='s', color='w', markerfacecolor='#e74c3c', markersize=10, label='>100M people', alpha=0.7),
-        plt.Line2D([0], [0], marker='s', color='w', markerfacecolor='#e67e22', markersize=10, label='80–100M people', alpha=0.7),
-        plt.Line2D([0], [0], marker='s', color='w', markerfacecolor='#f1c40f', markersize=10, label='60–80M people', alpha=0.7),
-        plt.Line2D([0], [0], marker='s', color='w', markerfacecolor='#27ae60', markersize=10, label='<60M people', alpha=0.7),
-        plt.Line2D([0], [0], marker='s', color='w', markerfacecolor='red', markersize=8, label='Capital'),
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='blue', markersize=8, label='Economic Center'),
-    ]
-    ax.legend(handles=legend_elements, loc='upper right', bbox_to_anchor=(1.15, 1), title="Legend")
-    return fig
+def map_asset_version(path: str=MAPA_CHINA_FILE) -> str:
+    """Version tag of an asset file (why: cached layers/engines are invalidated when the file changes)."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return "fallback"
+    return f"{path}:{info.st_mtime_ns}:{info.st_size}"
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def render_base_layer(_imagen_china: Image.Image, asset_version: str) -> dict:
+    """Static map raster, drawn with matplotlib once and then read from the disk cache.
+
+    (why: a fresh server process paints the default page without importing matplotlib)
+    """
+    origen = file_digest(MAPA_CHINA_FILE) if asset_version != "fallback" else "fallback"
+    clave = f"{origen}:{BASE_LAYER_VERSION}:{metadata.version('matplotlib')}"
+    cache_file = os.path.join(CACHE_DIR, f"base_layer_{hashlib.sha1(clave.encode()).hexdigest()[:12]}.npz")
+    if not os.path.exists(cache_file):
+        from map_render import render_base_layer as draw_base_layer
+        layer = draw_base_layer(_imagen_china)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{cache_file}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, rgba=layer["rgba"], png=np.frombuffer(layer["png"], dtype=np.uint8),
+                 bbox=layer["bbox"], figsize=layer["figsize"], ax_position=layer["ax_position"])
+        os.replace(tmp, cache_file)  # atomic (why: concurrent sessions may build at once)
+
+    with np.load(cache_file) as data:
+        return freeze({
+            "rgba": data["rgba"],
+            "png": data["png"].tobytes(),
+            "bbox": tuple(data["bbox"].tolist()),
+            "figsize": tuple(data["figsize"].tolist()),
+            "ax_position": tuple(data["ax_position"].tolist()),
+            "version": os.path.basename(cache_file)[len("base_layer_"):-len(".npz")],
+        })
+
+@st.cache_resource(show_spinner=False)
+def get_density_engine(asset_version: str) -> dict:
+    """Density-raster engine at full resolution, shared by all sessions."""
+    from density_model import build_density_engine, load_density
+    return freeze(build_density_engine(load_density()))
+
+@st.cache_resource(show_spinner=False)
+def get_county_engine(asset_version: str) -> dict:
+    """County polygons and their STR tree, shared by all sessions."""
+    from county_model import build_county_engine, load_counties
+    return freeze(build_county_engine(load_counties()))
+
+@st.cache_resource(show_spinner=False)
+def get_density_data_version(asset_version: str) -> str:
+    from density_model import data_version
+    return data_version()
+
+@st.cache_resource(show_spinner=False)
+def get_result_cache() -> ResultCache:
+    """Simulation results and impact maps shared by all sessions, and across restarts via disk."""
+    return ResultCache(disk_dir=disk_dir_from_env())
+
+@st.cache_resource(show_spinner=False)
+def get_ensemble_executor():
+    """One process pool per server process, shared by all sessions."""
+    from ensemble import make_executor
+    return make_executor()
 
 def format_energy(energia_megatones: float) -> tuple[str, str]:
     """Return (value_str, unit)."""
@@ -333,194 +200,368 @@ def format_energy(energia_megatones: float) -> tuple[str, str]:
     else:
         return f"{energia_megatones:.2f}", "MT"
 
-def simulate_impact_china(diameter: float, speed_kms: float, ix: float, iy: float, defenses: dict):
-    """Simple param model; reduction combines defenses (why: quick interactive demo, not physics-accurate)."""
-    masa = diameter ** 3 * 800
-    energia_joules = 0.5 * masa * (speed_kms * 1000) ** 2
-    energia_megatones = energia_joules / (4.184e15)
-
-    r_total = diameter * 20 / 1000
-    r_partial = r_total * 3
-
-    reduccion = 0
-    if defenses.get("laser"): reduccion += 0.3
-    if defenses.get("nuclear"): reduccion += 0.4
-    if defenses.get("tractor"): reduccion += 0.2
-    if defenses.get("shield"): reduccion += 0.1
-    reduccion = min(reduccion, 0.95)  # cap (why: avoid negative/zero edge cases)
-
-    r_total *= (1 - reduccion)
-    r_partial *= (1 - reduccion)
-    energia_final = energia_megatones * (1 - reduccion)
-    energia_mitigada = energia_megatones - energia_final
-
-    provincias_afectadas = {}
-    poblacion_total_afectada = 0
-
-    for provincia_id, provincia in poblacion_china.items():
-        coords = provincia['coordenadas']
-        cx = (coords['x_min'] + coords['x_max']) / 2
-        cy = (coords['y_min'] + coords['y_max']) / 2
-
-        distancia = float(np.sqrt((cx - ix) ** 2 + (cy - iy) ** 2))
-        if distancia <= r_total:
-            factor = 0.8
-        elif distancia <= r_partial:
-            factor = 0.4
-        else:
-            factor = 0.1
-
-        poblacion_real = int(provincia['poblacion'] * 1000)
-        afectada = int(poblacion_real * factor)
-
-        provincias_afectadas[provincia_id] = {
-            'province': provincia['nombre'],
-            'affected_population': afectada,
-            'impact_share_%': round(factor * 100, 1),
-            'distance_to_impact': round(distancia, 2),
-            'total_population': poblacion_real,
-            'description': provincia['descripcion'],
-        }
-        poblacion_total_afectada += afectada
-
-    return {
-        "energia_megatones": energia_megatones,
-        "energia_final": energia_final,
-        "energia_mitigada": energia_mitigada,
-        "reduccion": reduccion * 100,
-        "radio_destruccion_total": r_total,
-        "radio_destruccion_parcial": r_partial,
-        "poblacion_total_afectada": poblacion_total_afectada,
-        "provincias_afectadas": provincias_afectadas,
-        "punto_impacto": (ix, iy),
-    }
+# --- Shared resources ---
+DEFENSE_KEYS = {
+    "laser": "defensa_laser",
+    "nuclear": "desviacion_nuclear",
+    "tractor": "tractor_gravitatorio",
+    "shield": "escudo_atmosferico",
+}
 
-# --- Load map image ---
-imagen_china = load_china_image()
+@st.cache_resource(show_spinner=False)
+def get_china_image(asset_version: str) -> Image.Image:
+    """Map image decoded once per asset version and shared by all sessions."""
+    imagen = load_china_image()
+    imagen.load()  # decode now (why: lazy PIL reads from shared file handles are not thread-safe)
+    return imagen
+
+# cache_resource (why: cache_data unpickles a private copy of the PNG for every caller)
+@st.cache_resource(show_spinner=False, max_entries=64)
+def render_heatmap_png(asset_version: str, surface_version: str, bucket: int) -> bytes:
+    """PNG of the base map with the risk heatmap for one diameter bucket."""
+    from map_render import encode_png, render_heatmap_map
+    base_layer = render_base_layer(get_china_image(asset_version), asset_version)
+    return encode_png(render_heatmap_map(base_layer, bucket_heatmap(get_risk_surface(), bucket)))
+
+@st.cache_resource(show_spinner=False)
+def get_map_background_url(asset_version: str) -> str:
+    """Map image for browser renderers: a static-file URL when served, else a data URI.
+
+    Single-band maps get the same default colormap imshow applies, so both renderers match.
+    """
+    from map_render import colormap_rgba, encode_png
+    if os.path.exists(MAPA_CHINA_FILE):
+        imagen = Image.fromarray(image_at(MAPA_CHINA_FILE, fitted_size(MAPA_CHINA_FILE, BROWSER_MAP_MAX_SIZE)))
+    else:
+        imagen = get_china_image(asset_version)
+    png = encode_png(colormap_rgba(imagen), compress_level=9)
+
+    if st.get_option("server.enableStaticServing"):
+        nombre = f"mapa_china_{hashlib.sha1(png).hexdigest()[:12]}.png"
+        ruta = os.path.join(STATIC_DIR, nombre)
+        if not os.path.exists(ruta):
+            os.makedirs(STATIC_DIR, exist_ok=True)
+            with open(ruta, 'wb') as f:
+                f.write(png)
+        return f"app/static/{nombre}"
+    return "data:image/png;base64," + base64.b64encode(png).decode()
+
+@st.cache_resource(show_spinner=False)
+def get_plotly_base(asset_version: str) -> dict:
+    """Static plotly map (background, provinces, critical points) shared by all sessions."""
+    from plotly_map import base_figure
+    return base_figure(get_map_background_url(asset_version))
+
+@st.cache_resource(show_spinner=False)
+def get_globe(mesh_version: str, texture_version: str) -> dict:
+    """Globe levels of detail, loaded from the disk cache once per process."""
+    from globe import load_globe
+    return load_globe()
+
+def show_globe(result: dict|None, view_px: int, key: str):
+    """Globe at the lightest level of detail that fits `view_px` (rotation and zoom stay in the browser)."""
+    from globe import GLOBE_MESH_FILE, GLOBE_TEXTURE_FILE, globe_figure, select_lod
+    globo = get_globe(map_asset_version(GLOBE_MESH_FILE), map_asset_version(GLOBE_TEXTURE_FILE))
+    lod = select_lod(globo, view_px)
+    st.plotly_chart(globe_figure(globo, lod, result, view_px), use_container_width=True, key=key)
+    st.caption(f"Globe detail: {len(globo['lods'][lod]['faces']):,} faces")
+
+@st.cache_resource(show_spinner=False)
+def get_simulation_executor() -> ThreadPoolExecutor:
+    """Worker threads for simulations (why: the script thread is released while one runs)."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="simulate")
+
+@st.cache_resource(show_spinner=False)
+def get_animation_executor() -> ThreadPoolExecutor:
+    """One worker for approach clips (why: encoding is CPU-bound; parallel clips only slow each other)."""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="animate")
+
+def selected_defenses() -> dict:
+    """Defense checkboxes from session state, keyed as simulate_impact_china expects."""
+    return {name: bool(st.session_state.get(key)) for name, key in DEFENSE_KEYS.items()}
+
+def entry_inputs() -> tuple|None:
+    """(angle, density) of the atmospheric entry model, None when it is off."""
+    if not st.session_state.get("fisica_entrada"):
+        return None
+    return (st.session_state["angulo_entrada"], st.session_state["densidad_meteoro"])
+
+def import_simulation_modules(params: dict):
+    """Import the lazily loaded modules run_simulation needs, on the script thread.
+
+    (why: the project directory is only guaranteed on sys.path while the script runs; under
+    AppTest a worker importing density_model or map_render for the first time fails)
+    """
+    if params["modelo"] == "Density raster":
+        import density_model  # noqa: F401
+    if params["modelo"] == COUNTY_MODEL:
+        import county_model  # noqa: F401
+    if params["renderer"] not in (PLOTLY_RENDERER, GLOBE_RENDERER):
+        import map_render  # noqa: F401
+        if params["animar"]:
+            import animation  # noqa: F401
+    if params["entrada"]:
+        import entry_model  # noqa: F401
+
+@tracing.traced("simulation")
+def run_simulation(params: dict, asset_version: str) -> dict:
+    """Model run plus impact-map PNG for one set of inputs (executes on a worker thread).
+
+    Both come from the shared result cache when any session already asked for them.
+    """
+    cache = get_result_cache()
+    entradas = (params["diametro"], params["velocidad"], params["x"], params["y"], params["defensas"])
+    fisica = params["entrada"]
+
+    def entry():
+        """Atmospheric entry of this meteor (only integrated on a cache miss)."""
+        if not fisica:
+            return None
+        from entry_model import simulate_entry_batch
+        with tracing.span("simulation.entry"):
+            return simulate_entry_batch(params["diametro"], params["velocidad"], *fisica)
+
+    with tracing.span("simulation.model"):
+        if params["modelo"] == "Density raster":
+            from density_model import DENSITY_FILE, simulate_impact_density
+            version_densidad = map_asset_version(DENSITY_FILE)
+            clave = result_key(params["modelo"], *entradas, get_density_data_version(version_densidad), fisica)
+            result = cache.get_or_compute(
+                clave, lambda: simulate_impact_density(get_density_engine(version_densidad), *entradas, entry()))
+        elif params["modelo"] == COUNTY_MODEL:
+            from county_model import simulate_impact_counties
+            motor = get_county_engine(map_asset_version(COUNTIES_FILE))
+            clave = result_key(params["modelo"], *entradas, motor["table"]["version"], fisica)
+            result = cache.get_or_compute(clave, lambda: simulate_impact_counties(motor, *entradas, entry()))
+        else:
+            clave = result_key(params["modelo"], *entradas, PROVINCE_TABLE["version"], fisica)
+            result = cache.get_or_compute(clave, lambda: simulate_impact_china(*entradas, entry()))
+
+    if params["renderer"] in (PLOTLY_RENDERER, GLOBE_RENDERER):
+        return {"params": params, "result": result, "impact_png": None}  # drawn in the browser
+
+    impact_png = render_impact_png(result, params["estilo"], asset_version)
+    animacion = None
+    if params["animar"]:
+        animacion = get_animation_executor().submit(run_animation, result, params["estilo"], asset_version)
+    return {"params": params, "result": result, "impact_png": impact_png, "animacion": animacion}
+
+def render_impact_png(result: dict, style: str, asset_version: str) -> bytes:
+    """Impact map with radii, from the shared cache or composited on the cached base layer."""
+    from map_render import encode_png, render_impact_map
+    cache = get_result_cache()
+    base_layer = render_base_layer(get_china_image(asset_version), asset_version)
+    clave_png = impact_png_key(result, style, base_layer["version"])
+    impact_png = cache.get(clave_png)
+    if impact_png is None:
+        with tracing.span("simulation.overlay"):
+            impact_map = render_impact_map(base_layer, result["punto_impacto"], meteor_size=1.2,
+                                           r_total=result["radio_destruccion_total"],
+                                           r_partial=result["radio_destruccion_parcial"], style=style)
+        with tracing.span("simulation.encode_png"):
+            impact_png = encode_png(impact_map)
+        cache.put(clave_png, impact_png)
+    return impact_png
+
+@tracing.traced("animation")
+def run_animation(result: dict, style: str, asset_version: str) -> dict:
+    """Approach clip of a result, shared through the result cache (executes on the animation worker)."""
+    from animation import clip_formats, encode_clip, render_frames
+    formato = clip_formats()[-1]  # MP4 when PyAV is installed (why: smaller and smoother than GIF)
+    base_layer = render_base_layer(get_china_image(asset_version), asset_version)
+
+    def render():
+        with tracing.span("animation.frames"):
+            frames = render_frames(base_layer, result["punto_impacto"], result["radio_destruccion_total"],
+                                   result["radio_destruccion_parcial"], style)
+        with tracing.span("animation.encode"):
+            return encode_clip(frames, formato)
+
+    clip = get_result_cache().get_or_compute(clip_key(result, style, base_layer["version"], formato), render)
+    return {"format": formato, "data": clip}
+
+def simulation_pending(tarea) -> bool:
+    """True while a simulation, or the approach clip it started, is still running."""
+    if tarea is None:
+        return False
+    if not tarea.done():
+        return True
+    animacion = tarea.result().get("animacion") if tarea.exception() is None else None
+    return animacion is not None and not animacion.done()
+
+def release_simulation(simulacion: dict):
+    """The same finished simulation without its image bytes, which are fetched again when shown."""
+    liviana = dict(simulacion, impact_png=None)
+    animacion = simulacion.get("animacion")
+    if animacion is not None and animacion.exception() is None:
+        liviana["animacion"] = done_future(dict(animacion.result(), data=None))
+    return done_future(liviana)
+
+def enforce_session_budget() -> int:
+    """Bytes only this session keeps alive; past SESSION_MEMORY_BYTES its finished simulation
+    drops the impact map and clip (why: the shared result cache holds them, or redraws them).
+    """
+    compartidos = get_result_cache().object_ids()
+    uso = sum(session_nbytes(st.session_state, compartidos).values())
+    tarea = st.session_state.get("simulacion")
+    if uso > SESSION_MEMORY_BYTES and tarea is not None and not simulation_pending(tarea) \
+            and tarea.exception() is None and tarea.result()["impact_png"] is not None:
+        st.session_state["simulacion"] = release_simulation(tarea.result())
+        uso = sum(session_nbytes(st.session_state, compartidos).values())
+    st.session_state["memoria_sesion"] = uso
+    return uso
 
 # --- Sidebar controls ---
-with st.sidebar:
+@st.fragment
+@tracing.traced("sidebar")
+def sidebar_controls():
+    """Sidebar widgets; slider ticks rerun only this fragment."""
     st.header("Simulation Controls")
 
     st.subheader("Meteor")
-    diametro = st.slider("Diameter (meters)", 100, 5000, 1000)
-    velocidad = st.slider("Speed (km/s)", 10, 100, 50)
+    diametro = st.slider("Diameter (meters)", 100, 5000, 1000, key="diametro")
+    st.slider("Speed (km/s)", 10, 100, 50, key="velocidad")
+    st.selectbox("Meteor sprite", list(METEOR_STYLES), format_func=str.capitalize, key="estilo_meteoro")
+    st.checkbox("Animate approach", value=True, key="animar_impacto",
+                help="Meteor approach and blast clip after SIMULATE (Matplotlib renderer).")
+    if st.checkbox("Atmospheric entry physics", key="fisica_entrada",
+                   help="Integrate drag, ablation and pancake breakup through the atmosphere: airburst or "
+                        "ground impact, with blast radii scaled by the energy released."):
+        st.slider("Entry angle (degrees)", 5, 90, 45, key="angulo_entrada")
+        st.slider("Density (kg/m³)", 500, 8000, 3000, 100, key="densidad_meteoro",
+                  help="Ice ~1000, porous rock ~1500, stony ~3000, iron ~7800.")
 
     st.subheader("Impact Point in China")
-    punto_impacto_x = st.slider("East Longitude", 50, 120, 85)
-    punto_impacto_y = st.slider("North Latitude", 5, 45, 25)
-
-    nearest_province = "Sea / Unpopulated Area"
-    min_dist = float('inf')
-    for provincia_id, provincia in poblacion_china.items():
-        coords = provincia['coordenadas']
-        cx = (coords['x_min'] + coords['x_max']) / 2
-        cy = (coords['y_min'] + coords['y_max']) / 2
-        dist = float(np.sqrt((cx - punto_impacto_x)**2 + (cy - punto_impacto_y)**2))
-        if dist < min_dist:
-            min_dist = dist
-            nearest_province = provincia['nombre']
-
-    st.info(f"Nearest province: {nearest_province}")
+    punto_impacto_x = st.slider("East Longitude", 50, 120, 85, key="punto_impacto_x")
+    punto_impacto_y = st.slider("North Latitude", 5, 45, 25, key="punto_impacto_y")
+
+    with tracing.span("sidebar.nearest_province"):
+        risk_surface = get_risk_surface()
+        provincia_cercana = nearest_province(risk_surface, punto_impacto_x, punto_impacto_y)
+
+    st.info(f"Nearest province: {provincia_cercana}")
+
+    st.subheader("Population Model")
+    modelos = ["Province centroids", "Density raster"]
+    if os.path.exists(COUNTIES_FILE):
+        modelos.append(COUNTY_MODEL)
+    st.radio("Affected population from", modelos, key="modelo_poblacion",
+             help="Density raster sums mapa_densidad.png cells inside the destruction disks. County polygons "
+                  f"weights each unit of {COUNTIES_FILE} by its area inside them.")
 
     st.subheader("Defense Systems")
     col1, col2 = st.columns(2)
     with col1:
-        defensa_laser = st.checkbox("Laser")
-        desviacion_nuclear = st.checkbox("Nuclear")
+        st.checkbox("Laser", key="defensa_laser")
+        st.checkbox("Nuclear", key="desviacion_nuclear")
     with col2:
-        tractor_gravitatorio = st.checkbox("Tractor")
-        escudo_atmosferico = st.checkbox("Shield")
-
-# --- Provinces info ---
-st.subheader("China Provinces – Population Data")
-cols = st.columns(3)
-for i, (provincia_id, provincia) in enumerate(poblacion_china.items()):
-    with cols[i % 3]:
-        st.markdown(f"""
-        <div class="district-card">
-            <h4>{provincia['nombre']}</h4>
-            <p>{provincia['poblacion']:,} thousand inhabitants</p>
-            <p>{provincia['poblacion'] * 1000:,} people</p>
-            <p>{provincia['descripcion']}</p>
-        </div>
-        """, unsafe_allow_html=True)
-
-# --- Base map ---
-st.subheader("China Map – Provinces & Critical Points")
-fig_base = create_china_map(imagen_china)
-st.pyplot(fig_base, use_container_width=True)
-
-# --- Simulate button ---
-col1, col2, col3 = st.columns([1, 2, 1])
-with col2:
-    if st.button("SIMULATE IMPACT IN CHINA", use_container_width=True, type="primary"):
-        with st.spinner("Calculating trajectory and impact..."):
-            time.sleep(1.5)
-
-        defensas = {
-            "laser": defensa_laser,
-            "nuclear": desviacion_nuclear,
-            "tractor": tractor_gravitatorio,
-            "shield": escudo_atmosferico
-        }
-
-        result = simulate_impact_china(
-            diameter=diametro,
-            speed_kms=velocidad,
-            ix=punto_impacto_x,
-            iy=punto_impacto_y,
-            defenses=defensas
+        st.checkbox("Tractor", key="tractor_gravitatorio")
+        st.checkbox("Shield", key="escudo_atmosferico")
+
+    defensas_activas = tuple(selected_defenses().values())
+    with tracing.span("sidebar.estimate"):
+        afectados_estimados = lookup_total(risk_surface, punto_impacto_x, punto_impacto_y, diametro, defensas_activas)
+    st.caption(f"Estimated affected population: {afectados_estimados:,}")
+    mostrar_heatmap = st.checkbox("Risk heatmap overlay", key="mostrar_heatmap")
+    renderer = st.radio("Map renderer", ["Matplotlib", PLOTLY_RENDERER, GLOBE_RENDERER], key="renderer",
+                        help="Plotly draws the map in the browser with hover, pan and zoom.")
+    if renderer == GLOBE_RENDERER:
+        st.select_slider("Globe view size (px)", options=GLOBE_VIEW_SIZES, value=600, key="globo_px")
+
+    st.subheader("Ensemble Mode")
+    modo_ensemble = st.checkbox("Monte Carlo ensemble", key="modo_ensemble")
+    if modo_ensemble:
+        st.slider("Diameter range (meters)", 100, 5000, (500, 1500), key="rango_diametro")
+        st.slider("Speed range (km/s)", 10, 100, (30, 70), key="rango_velocidad")
+        st.slider("Impact error σ major (degrees)", 0.0, 10.0, 2.0, 0.1, key="sigma_mayor")
+        st.slider("Impact error σ minor (degrees)", 0.0, 10.0, 1.0, 0.1, key="sigma_menor")
+        st.slider("Error ellipse angle (degrees)", 0, 180, 0, key="angulo_elipse")
+        st.select_slider("Samples", options=[10_000, 50_000, 100_000, 250_000, 1_000_000],
+                         value=100_000, key="n_muestras")
+        st.number_input("Casualty threshold (millions)", min_value=0, value=100, step=10, key="umbral_millones")
+        st.number_input("Seed", min_value=0, value=42, step=1, key="semilla")
+
+    st.subheader("Defense Sweep")
+    modo_barrido = st.checkbox("Sweep all defense combinations", key="modo_barrido",
+                               help="Every defense combination over the whole diameter × speed range.")
+    if modo_barrido:
+        st.number_input("Affected population limit (millions)", min_value=0, value=200, step=10,
+                        key="limite_barrido")
+
+    # Main-page layout depends on these; anything else stays a fragment-only rerun
+    barrido = None
+    if modo_barrido:
+        barrido = (punto_impacto_x, punto_impacto_y, diametro, st.session_state["velocidad"],
+                   st.session_state["limite_barrido"])
+    vista = (mostrar_heatmap, modo_ensemble,
+             diameter_bucket(diametro, defensas_activas) if mostrar_heatmap else None, renderer,
+             st.session_state["globo_px"] if renderer == GLOBE_RENDERER else None, barrido)
+    anterior = st.session_state.get("vista_principal")
+    st.session_state["vista_principal"] = vista
+    if anterior is not None and anterior != vista:
+        st.rerun(scope="app")
+
+# --- Simulation results ---
+def show_simulation(simulacion: dict):
+    """Energy summary, impact map and result tables for a finished simulation."""
+    result = simulacion["result"]
+
+    # Energy summary
+    val_ini, unit_ini = format_energy(result["energia_megatones"])
+    val_fin, unit_fin = format_energy(result["energia_final"])
+    val_mit, unit_mit = format_energy(result["energia_mitigada"])
+
+    # Airburst or ground impact, when the atmospheric entry model ran (.get: older cached results)
+    linea_entrada = ""
+    entrada = result.get("entrada")
+    if entrada is not None:
+        val_exp, unit_exp = format_energy(entrada["energia_explosion"])
+        if entrada["airburst"]:
+            linea_entrada = f"<div><b>Airburst</b> at {entrada['altitud_km']:.1f} km: {val_exp} {unit_exp} released</div>"
+        else:
+            linea_entrada = (f"<div><b>Ground impact</b> at {entrada['velocidad_final']:.1f} km/s: "
+                             f"{val_exp} {unit_exp} released</div>")
+
+    st.markdown(f"""
+    <div class="energy-section">
+        <div><b>Initial Impact Energy</b></div>
+        <div class="energy-metric">{val_ini} {unit_ini}</div>
+        <div><b>Mitigated</b>: {val_mit} {unit_mit} &nbsp; | &nbsp; <b>Reduction</b>: {result["reduccion"]:.0f}%</div>
+        <div><b>Final Energy</b>: {val_fin} {unit_fin}</div>
+        {linea_entrada}
+    </div>
+    """, unsafe_allow_html=True)
+
+    if result["reduccion"] >= 50:
+        st.markdown(
+            f'<div class="mitigation-success">✅ Significant mitigation achieved. '
+            f'Destruction radii reduced to '
+            f'<b>{result["radio_destruccion_total"]:.2f}</b> (total) and '
+            f'<b>{result["radio_destruccion_parcial"]:.2f}</b> (partial) map units.</div>',
+            unsafe_allow_html=True
+        )
+    else:
+        st.markdown(
+            f'<div class="impact-warning">⚠️ High impact risk. '
+            f'Destruction radii estimated at '
+            f'<b>{result["radio_destruccion_total"]:.2f}</b> (total) and '
+            f'<b>{result["radio_destruccion_parcial"]:.2f}</b> (partial) map units.</div>',
+            unsafe_allow_html=True
         )
 
-        # Energy summary
-        val_ini, unit_ini = format_energy(result["energia_megatones"])
-        val_fin, unit_fin = format_energy(result["energia_final"])
-        val_mit, unit_mit = format_energy(result["energia_mitigada"])
-
-        st.markdown(f"""
-        <div class="energy-section">
-            <div><b>Initial Impact Energy</b></div>
-            <div class="energy-metric">{val_ini} {unit_ini}</div>
-            <div><b>Mitigated</b>: {val_mit} {unit_mit} &nbsp; | &nbsp; <b>Reduction</b>: {result["reduccion"]:.0f}%</div>
-            <div><b>Final Energy</b>: {val_fin} {unit_fin}</div>
-        </div>
-        """, unsafe_allow_html=True)
-
-        if result["reduccion"] >= 50:
-            st.markdown(
-                f'<div class="mitigation-success">✅ Significant mitigation achieved. '
-                f'Destruction radii reduced to '
-                f'<b>{result["radio_destruccion_total"]:.2f}</b> (total) and '
-                f'<b>{result["radio_destruccion_parcial"]:.2f}</b> (partial) map units.</div>',
-                unsafe_allow_html=True
-            )
+    with tracing.span("results.map"):
+        if simulacion["params"]["renderer"] == GLOBE_RENDERER:
+            show_globe(result, simulacion["params"]["globo_px"], key="globo_impacto")
+        elif simulacion["params"]["renderer"] == PLOTLY_RENDERER:
+            from plotly_map import china_map_figure
+            figura = china_map_figure(get_plotly_base(map_asset_version()), result)
+            st.plotly_chart(figura, use_container_width=True, key="mapa_impacto", config={"scrollZoom": True})
         else:
-            st.markdown(
-                f'<div class="impact-warning">⚠️ High impact risk. '
-                f'Destruction radii estimated at '
-                f'<b>{result["radio_destruccion_total"]:.2f}</b> (total) and '
-                f'<b>{result["radio_destruccion_parcial"]:.2f}</b> (partial) map units.</div>',
-                unsafe_allow_html=True
-            )
-
-        # Impact map with radii
-        fig = create_china_map(imagen_china, show_meteor=True,
-                               impact_pos=result["punto_impacto"], meteor_size=1.2)
-        ax = fig.axes[0]
-        ix, iy = result["punto_impacto"]
-
-        circ_total = Circle((ix, iy), radius=result["radio_destruccion_total"],
-                            facecolor='red', alpha=0.15, edgecolor='red', linewidth=1)
-        circ_partial = Circle((ix, iy), radius=result["radio_destruccion_parcial"],
-                              facecolor='orange', alpha=0.12, edgecolor='orange', linewidth=1)
-        ax.add_patch(circ_partial)
-        ax.add_patch(circ_total)
-        ax.text(ix, iy - 2, "Impact", ha='center', va='top',
-                bbox=dict(boxstyle="round,pad=0.2", facecolor='white', alpha=0.8), fontsize=8)
-        st.pyplot(fig, use_container_width=True)
-
-       # Results table
+            show_impact_clip(simulacion)
+
+    with tracing.span("results.table"):
+        import pandas as pd
+        # Results table
         df = pd.DataFrame.from_dict(result["provincias_afectadas"], orient='index')
         df_sorted = df.sort_values(by="affected_population", ascending=False)
 
@@ -534,3 +575,330 @@ with col2:
         top5 = df_sorted.head(5)[["province", "affected_population", "impact_share_%", "distance_to_impact"]]
         st.markdown("### Top 5 Most Affected Provinces")
         st.table(top5.style.format({'affected_population': '{:,}', 'distance_to_impact': '{:.2f}', 'impact_share_%': '{:.1f}'}))
+
+def show_impact_clip(simulacion: dict):
+    """Approach clip once encoded; the static impact map until then or without animation.
+
+    Images a released simulation no longer holds come back from the shared cache (or are redrawn).
+    """
+    params = simulacion["params"]
+    animacion = simulacion.get("animacion")
+    if animacion is None or not animacion.done() or animacion.exception() is not None:
+        impact_png = simulacion["impact_png"]
+        if impact_png is None:
+            impact_png = render_impact_png(simulacion["result"], params["estilo"], map_asset_version())
+        st.image(impact_png, use_container_width=True)
+        if animacion is not None and not animacion.done():
+            st.caption("Rendering approach animation...")
+        elif animacion is not None:
+            st.caption(f"Approach animation failed: {animacion.exception()}")
+        return
+    clip = animacion.result()
+    if clip["data"] is None:
+        clip = run_animation(simulacion["result"], params["estilo"], map_asset_version())
+    if clip["format"] == "mp4":
+        st.video(clip["data"], format="video/mp4", autoplay=True, loop=True, muted=True)
+    else:
+        st.image(clip["data"], use_container_width=True)
+
+@tracing.traced("simulation_section")
+def simulation_section():
+    """SIMULATE button and results; polls the workers while a simulation or its clip is pending."""
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        if st.button("SIMULATE IMPACT IN CHINA", use_container_width=True, type="primary"):
+            params = {
+                "diametro": st.session_state["diametro"],
+                "velocidad": st.session_state["velocidad"],
+                "x": st.session_state["punto_impacto_x"],
+                "y": st.session_state["punto_impacto_y"],
+                "defensas": selected_defenses(),
+                "modelo": st.session_state["modelo_poblacion"],
+                "estilo": st.session_state["estilo_meteoro"],
+                "renderer": st.session_state["renderer"],
+                "globo_px": st.session_state.get("globo_px"),
+                "animar": st.session_state["animar_impacto"],
+                "entrada": entry_inputs(),
+            }
+            import_simulation_modules(params)
+            st.session_state["simulacion"] = get_simulation_executor().submit(
+                run_simulation, params, map_asset_version())
+            st.rerun(scope="app")  # re-register this fragment with polling on
+
+    tarea = st.session_state.get("simulacion")
+    if tarea is None:
+        return
+    if not tarea.done():
+        st.info("Calculating trajectory and impact...")
+        return
+    if st.session_state.get("sondeo_simulacion") and not simulation_pending(tarea):
+        st.rerun(scope="app")  # finished: re-register without polling
+    show_simulation(tarea.result())
+
+# --- Monte Carlo ensemble ---
+@st.fragment
+@tracing.traced("ensemble")
+def ensemble_section():
+    """RUN ENSEMBLE button and streamed results; clicks rerun only this fragment."""
+    st.markdown("### Monte Carlo Ensemble")
+    if not st.button("RUN ENSEMBLE", use_container_width=True):
+        return
+    import pandas as pd
+    from ensemble import exceedance_probability, run_ensemble
+    ss = st.session_state
+    config = {
+        "diameter_range": ss["rango_diametro"],
+        "speed_range": ss["rango_velocidad"],
+        "impact": (ss["punto_impacto_x"], ss["punto_impacto_y"]),
+        "sigma": (ss["sigma_mayor"], ss["sigma_menor"]),
+        "angle_deg": ss["angulo_elipse"],
+        "defenses": selected_defenses(),
+    }
+    if entry_inputs():
+        config["entry"] = {"density": ss["densidad_meteoro"]}
+    n_muestras = ss["n_muestras"]
+    umbral_millones = ss["umbral_millones"]
+    progreso = st.progress(0.0, text="Sampling impacts...")
+    metrica_slot = st.empty()
+    tabla_slot = st.empty()
+    curva_slot = st.empty()
+
+    # Each finished chunk refreshes the placeholders (why: results stream in while the pool runs)
+    for resumen in run_ensemble(config, n_muestras, seed=int(ss["semilla"]), executor=get_ensemble_executor()):
+        progreso.progress(resumen["n"] / n_muestras, text=f"{resumen['n']:,} / {n_muestras:,} samples")
+
+        prob = exceedance_probability(resumen, umbral_millones * 1_000_000)
+        metrica_slot.metric(f"P(total affected ≥ {umbral_millones:,}M)", f"{prob:.1%}",
+                            help=f"Airbursts: {resumen['airburst_fraction']:.1%} of samples, entry angles "
+                                 "drawn from an isotropic flux." if "entry" in config else None)
+
+        df_bandas = pd.DataFrame.from_dict(resumen["provincias"], orient='index')
+        tabla_slot.dataframe(df_bandas.sort_values(by="p50", ascending=False), use_container_width=True)
+
+        curva = resumen["exceedance"]
+        df_curva = pd.DataFrame({
+            "total affected (millions)": curva["poblacion"] / 1_000_000,
+            "exceedance probability": curva["probabilidad"],
+        })
+        curva_slot.line_chart(df_curva, x="total affected (millions)", y="exceedance probability")
+
+# --- Defense sweep ---
+def pareto_figure(barrido: dict) -> dict:
+    """Residual energy against defense count for all 16 combinations, Pareto front joined."""
+    from defense_sweep import combination_label, pareto_front
+    energia = barrido["residual_energy"][:, 0, 0]
+    frente = pareto_front(barrido["n_defenses"], energia)
+    orden = np.flatnonzero(frente)[np.argsort(barrido["n_defenses"][frente])]
+    etiquetas = [combination_label(n) for n in range(len(energia))]
+    return {
+        "data": [
+            {"type": "scatter", "mode": "markers", "name": "Combination",
+             "x": barrido["n_defenses"].tolist(), "y": energia.tolist(), "text": etiquetas,
+             "marker": {"color": "#95a5a6", "size": 9},
+             "hovertemplate": "%{text}<br>%{y:,.1f} MT<extra></extra>"},
+            {"type": "scatter", "mode": "lines+markers", "name": "Pareto front",
+             "x": barrido["n_defenses"][orden].tolist(), "y": energia[orden].tolist(),
+             "text": [etiquetas[n] for n in orden],
+             "marker": {"color": "#e74c3c", "size": 11}, "line": {"color": "#e74c3c"},
+             "hovertemplate": "%{text}<br>%{y:,.1f} MT<extra></extra>"},
+        ],
+        "layout": {
+            "xaxis": {"title": {"text": "defenses deployed"}, "dtick": 1},
+            "yaxis": {"title": {"text": "residual energy (MT)"}},
+            "height": 360,
+            "margin": {"l": 10, "r": 10, "t": 10, "b": 40},
+        },
+    }
+
+def sweep_grid_figure(barrido: dict, minimo: np.ndarray) -> dict:
+    """Defenses needed per (diameter, speed); gaps where no combination meets the limit."""
+    from defense_sweep import combination_label
+    n_defensas = np.where(minimo >= 0, barrido["n_defenses"][minimo], np.nan)
+    etiquetas = np.array([combination_label(n) for n in range(len(barrido["n_defenses"]))] + ["Not reachable"])
+    return {
+        "data": [{
+            "type": "heatmap", "x": barrido["speeds"].tolist(), "y": barrido["diameters"].tolist(),
+            "z": n_defensas.tolist(), "text": etiquetas[minimo].tolist(),
+            "zmin": 0, "zmax": int(barrido["n_defenses"].max()), "colorscale": "YlOrRd",
+            "colorbar": {"title": {"text": "defenses"}, "dtick": 1},
+            "hovertemplate": "%{y} m at %{x} km/s<br>%{text}<extra></extra>",
+        }],
+        "layout": {
+            "xaxis": {"title": {"text": "speed (km/s)"}},
+            "yaxis": {"title": {"text": "diameter (m)"}},
+            "height": 420,
+            "margin": {"l": 10, "r": 10, "t": 10, "b": 40},
+        },
+    }
+
+@tracing.traced("sweep")
+def sweep_section(ix: float, iy: float, diametro: float, velocidad: float, limite_millones: float):
+    """Minimum defense set for the current meteor, its Pareto view and the full-grid answer."""
+    from defense_sweep import combination_label, minimum_defenses, sweep_defenses
+    st.markdown("### Defense Sweep")
+    limite = limite_millones * 1_000_000
+    inicio = time.perf_counter()
+    with tracing.span("sweep.model"):
+        rejilla = sweep_defenses(ix, iy)
+        minimo = minimum_defenses(rejilla, limite)
+        actual = sweep_defenses(ix, iy, diametro, velocidad)
+        eleccion = int(minimum_defenses(actual, limite)[0, 0])
+    milisegundos = (time.perf_counter() - inicio) * 1000
+
+    if eleccion < 0:
+        st.warning(f"No defense combination keeps affected population below {limite_millones:,}M "
+                   f"for a {diametro} m meteor at {velocidad} km/s.")
+    else:
+        valor, unidad = format_energy(actual["residual_energy"][eleccion, 0, 0])
+        st.success(f"Minimum defenses below {limite_millones:,}M affected: **{combination_label(eleccion)}** "
+                   f"({actual['affected'][eleccion, 0, 0]:,} affected, {valor} {unidad} residual energy)")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Defenses vs residual energy (current meteor)**")
+        st.plotly_chart(pareto_figure(actual), use_container_width=True, key="pareto_defensas")
+    with col2:
+        st.markdown("**Defenses needed across diameter × speed**")
+        st.plotly_chart(sweep_grid_figure(rejilla, minimo), use_container_width=True, key="rejilla_defensas")
+    n = rejilla["affected"].size
+    st.caption(f"{n:,} model runs ({len(rejilla['n_defenses'])} combinations × {len(rejilla['diameters'])} "
+               f"diameters × {len(rejilla['speeds'])} speeds) in {milisegundos:.0f} ms")
+
+# --- Performance debug ---
+def waterfall_figure(traza: dict) -> dict:
+    """Horizontal bars per span, offset by their start within the rerun."""
+    filas = tracing.waterfall(traza)
+    return {
+        "data": [{
+            "type": "bar", "orientation": "h",
+            "y": [name for name, _, _ in filas],
+            "x": [duracion for _, _, duracion in filas],
+            "base": [inicio for _, inicio, _ in filas],
+            "hovertemplate": "%{y}: %{x:.2f} ms<extra></extra>",
+        }],
+        "layout": {
+            "xaxis": {"title": {"text": "ms since rerun start"}},
+            "yaxis": {"autorange": "reversed"},
+            "height": 80 + 24 * len(filas),
+            "margin": {"l": 10, "r": 10, "t": 10, "b": 40},
+        },
+    }
+
+def keep_session_trace(traza: dict|None):
+    """Keep this session's own trace (why: with IMPACT_TRACE off, tracing keeps none of them)."""
+    if traza is not None and not traza["shared"]:
+        st.session_state["trazas_sesion"] = st.session_state.get("trazas_sesion", [])[-(SESSION_TRACES - 1):] + [traza]
+
+def debug_panel(traza: dict|None):
+    """Sidebar waterfall of the last rerun, per-stage percentiles and trace export.
+
+    Cross-session figures (result-cache counters, pooled stages, every session's traces) only
+    when the server runs with IMPACT_TRACE=1; otherwise a visitor sees and records their own session.
+    """
+    with st.sidebar.expander("Performance debug", expanded=True):
+        if tracing.enabled():
+            st.caption("Recording every session (IMPACT_TRACE=1).")
+            cache = get_result_cache().stats()
+            st.caption(f"Result cache: {cache['hits']:,} memory hits, {cache['disk_hits']:,} disk hits, "
+                       f"{cache['misses']:,} misses ({cache['hit_rate']:.0%}), {cache['entries']:,} entries, "
+                       f"{cache['bytes'] / 2**20:.1f} MB, {cache['evictions']:,} evictions")
+        else:
+            st.checkbox("Record this session's stage timings", key="trazado")
+        st.caption(f"This session: {st.session_state.get('memoria_sesion', 0) / 2**20:.2f} MB "
+                   f"of a {SESSION_MEMORY_BYTES / 2**20:.0f} MB budget")
+        if traza is None:
+            st.caption("Timings appear from the next rerun.")
+            return
+        st.caption(f"This rerun: {(traza['end'] - traza['start']) / 1e6:.1f} ms")
+        st.plotly_chart(waterfall_figure(traza), use_container_width=True, key="waterfall")
+
+        propias = None if tracing.enabled() else st.session_state.get("trazas_sesion", [])
+        stats = tracing.stage_stats(propias)
+        if stats:
+            import pandas as pd
+            st.dataframe(pd.DataFrame.from_dict(stats, orient='index').sort_values(by="p95_ms", ascending=False),
+                         use_container_width=True)
+        st.download_button("Download trace (JSON)", json.dumps(tracing.export_trace_events(propias)),
+                           file_name="impact_trace.json", mime="application/json")
+
+# --- Page ---
+def main():
+    """Draw the page; Streamlit runs this module as __main__ on every rerun."""
+    # Closed at the end of main(); a ?debug=1 session may record its own reruns
+    tracing.begin_trace("rerun", session=st.session_state.get("trazado", False))
+
+    st.set_page_config(
+        page_title="Impact Simulator - China",
+        page_icon="🗺️",
+        layout="wide"
+    )
+    st.markdown(PAGE_CSS, unsafe_allow_html=True)
+
+    # --- Header ---
+    st.markdown('<h1 class="main-header">Impact Simulator - China</h1>', unsafe_allow_html=True)
+
+    # --- Load map image ---
+    with tracing.span("page.map_image"):
+        asset_version = map_asset_version()
+        imagen_china = get_china_image(asset_version)
+
+    with st.sidebar:
+        sidebar_controls()
+
+    # --- Provinces info ---
+    st.subheader("China Provinces – Population Data")
+    with tracing.span("page.province_cards"):
+        cols = st.columns(3)
+        for i, (provincia_id, provincia) in enumerate(poblacion_china.items()):
+            with cols[i % 3]:
+                st.markdown(f"""
+                <div class="district-card">
+                    <h4>{provincia['nombre']}</h4>
+                    <p>{provincia['poblacion']:,} thousand inhabitants</p>
+                    <p>{provincia['poblacion'] * 1000:,} people</p>
+                    <p>{provincia['descripcion']}</p>
+                </div>
+                """, unsafe_allow_html=True)
+
+    # --- Base map ---
+    st.subheader("China Map – Provinces & Critical Points")
+    mostrar_heatmap, modo_ensemble, bucket_heatmap_actual, renderer, globo_px, barrido = st.session_state["vista_principal"]
+    with tracing.span("page.base_map"):
+        if renderer == GLOBE_RENDERER:
+            show_globe(None, globo_px, key="globo_base")
+            if mostrar_heatmap:
+                st.caption("The risk heatmap is drawn on the 2D maps only.")
+        elif renderer == PLOTLY_RENDERER:
+            from plotly_map import china_map_figure, heatmap_trace
+            capa_riesgo = None
+            if mostrar_heatmap:
+                capa_riesgo = heatmap_trace(bucket_heatmap(get_risk_surface(), bucket_heatmap_actual), GRID_LON, GRID_LAT)
+            st.plotly_chart(china_map_figure(get_plotly_base(asset_version), heatmap=capa_riesgo),
+                            use_container_width=True, key="mapa_base", config={"scrollZoom": True})
+        elif mostrar_heatmap:
+            st.image(render_heatmap_png(asset_version, get_risk_surface()["version"], bucket_heatmap_actual),
+                     use_container_width=True)
+        else:
+            st.image(render_base_layer(imagen_china, asset_version)["png"], use_container_width=True)
+
+    # --- Simulate button ---
+    tarea = st.session_state.get("simulacion")
+    st.session_state["sondeo_simulacion"] = simulation_pending(tarea)
+    st.fragment(simulation_section, run_every=0.25 if st.session_state["sondeo_simulacion"] else None)()
+
+    if modo_ensemble:
+        ensemble_section()
+
+    if barrido is not None:
+        sweep_section(*barrido)
+
+    enforce_session_budget()
+
+    # --- Performance debug panel (?debug=1) ---
+    traza = tracing.end_trace()
+    if st.query_params.get("debug") == "1":
+        keep_session_trace(traza)
+        debug_panel(traza)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# assets.py
+"""Map and texture images as memory-mapped, tiled mip pyramids.
+
+Each source image is decoded once into levels that halve in size down to a single tile,
+saved under .cache keyed by the file's content hash; a changed file gets a new key and its
+stale pyramid is removed. Levels are stored as (tiles_y, tiles_x, TILE, TILE[, bands]) so a crop
+reads only the tiles it overlaps, and the OS page cache shares them between sessions.
+Renderers ask for "extent E at W x H pixels" and are served from the smallest level that
+still has that many pixels.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+import numpy as np
+from PIL import Image
+
+TILE = 256
+CACHE_DIR = ".cache"
+PIPELINE_VERSION = 1  # bump when the pyramid layout changes (invalidates cached pyramids)
+
+_lock = threading.Lock()
+_pyramids = {}  # (path, mtime_ns, size) -> pyramid, shared by all sessions
+
+def file_digest(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+def _decode(path: str) -> Image.Image:
+    imagen = Image.open(path)
+    imagen.load()
+    # Keep one band for grayscale maps (why: renderers colormap them, and it is 1/4 the bytes)
+    return imagen if imagen.mode in ('L', 'RGB', 'RGBA') else imagen.convert('RGBA')
+
+def _to_tiles(pixels: np.ndarray) -> np.ndarray:
+    h, w = pixels.shape[:2]
+    ty, tx = -(-h // TILE), -(-w // TILE)
+    padded = np.zeros((ty * TILE, tx * TILE) + pixels.shape[2:], dtype=np.uint8)
+    padded[:h, :w] = pixels
+    return padded.reshape(ty, TILE, tx, TILE, *pixels.shape[2:]).swapaxes(1, 2)
+
+def _pyramid_dir(path: str, digest: str, cache_dir: str) -> str:
+    # Full file name (why: earth_texture.jpg and earth_texture.png must not evict each other)
+    return os.path.join(cache_dir, f"mip_{os.path.basename(path)}_{digest}_v{PIPELINE_VERSION}")
+
+def build_pyramid(path: str, cache_dir: str=CACHE_DIR) -> str:
+    """Decode `path` and write its tiled levels; returns the pyramid directory."""
+    digest = file_digest(path)
+    destino = _pyramid_dir(path, digest, cache_dir)
+    if os.path.isdir(destino):
+        return destino
+
+    imagen = _decode(path)
+    tmp = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    niveles = []
+    while True:
+        pixels = np.asarray(imagen)
+        np.save(os.path.join(tmp, f"level{len(niveles)}.npy"), _to_tiles(pixels))
+        niveles.append(list(pixels.shape[:2]))
+        if max(imagen.size) <= TILE:
+            break
+        imagen = imagen.reduce(2)  # 2x2 box filter
+    with open(os.path.join(tmp, "meta.json"), 'w') as f:
+        json.dump({"source": os.path.basename(path), "mode": imagen.mode, "levels": niveles}, f)
+
+    try:
+        os.rename(tmp, destino)  # atomic (why: concurrent sessions may build at once)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # another process won the race
+    # Pyramids of earlier versions of this file are stale now
+    viejas = re.compile(rf"mip_{re.escape(os.path.basename(path))}_[0-9a-f]{{12}}_v\d+")
+    for nombre in os.listdir(cache_dir):
+        ruta = os.path.join(cache_dir, nombre)
+        if viejas.fullmatch(nombre) and ruta != destino:
+            shutil.rmtree(ruta, ignore_errors=True)
+    return destino
+
+def load_pyramid(path: str, cache_dir: str=CACHE_DIR) -> dict:
+    """Memory-mapped pyramid of `path`, built on first use and rebuilt when the file changes."""
+    info = os.stat(path)
+    clave = (os.path.abspath(path), info.st_mtime_ns, info.st_size)
+    with _lock:
+        pyramid = _pyramids.get(clave)
+        if pyramid is None:
+            directorio = build_pyramid(path, cache_dir)
+            with open(os.path.join(directorio, "meta.json")) as f:
+                meta = json.load(f)
+            pyramid = {
+                "path": path,
+                "mode": meta["mode"],
+                "shapes": [tuple(shape) for shape in meta["levels"]],
+                "tiles": [np.load(os.path.join(directorio, f"level{n}.npy"), mmap_mode='r')
+                          for n in range(len(meta["levels"]))],
+            }
+            for vieja in [k for k in _pyramids if k[0] == clave[0]]:
+                del _pyramids[vieja]
+            _pyramids[clave] = pyramid
+        return pyramid
+
+def read_region(pyramid: dict, level: int, box: tuple) -> np.ndarray:
+    """Pixels (left, top, right, bottom) of a level, assembled from only the tiles they overlap."""
+    left, top, right, bottom = box
+    tiles = pyramid["tiles"][level]
+    bloque = tiles[top // TILE:-(-bottom // TILE), left // TILE:-(-right // TILE)]
+    ty, tx = bloque.shape[:2]
+    pixels = bloque.swapaxes(1, 2).reshape(ty * TILE, tx * TILE, *bloque.shape[4:])
+    y0, x0 = top // TILE * TILE, left // TILE * TILE
+    return pixels[top - y0:bottom - y0, left - x0:right - x0]
+
+def extent_fraction(extent: tuple, source_extent: tuple) -> tuple:
+    """(left, top, right, bottom) image fractions of a map extent (x0, x1, y0, y1), y pointing up."""
+    sx0, sx1, sy0, sy1 = source_extent
+    x0, x1, y0, y1 = extent
+    return ((x0 - sx0) / (sx1 - sx0), (sy1 - y1) / (sy1 - sy0),
+            (x1 - sx0) / (sx1 - sx0), (sy1 - y0) / (sy1 - sy0))
+
+def fitted_size(path: str, max_size: tuple, cache_dir: str=CACHE_DIR) -> tuple:
+    """(width, height) of `path` scaled down, keeping its aspect, to fit inside `max_size`."""
+    h, w = load_pyramid(path, cache_dir)["shapes"][0]
+    escala = min(1.0, max_size[0] / w, max_size[1] / h)
+    return max(1, round(w * escala)), max(1, round(h * escala))
+
+def image_at(path: str, size: tuple|None=None, region: tuple=(0.0, 0.0, 1.0, 1.0),
+             cache_dir: str=CACHE_DIR) -> np.ndarray:
+    """`region` (image fractions) of `path` resampled to `size` = (width, height) pixels.
+
+    Served from the smallest level with at least `size` pixels over the region; None returns
+    the region at full resolution.
+    """
+    pyramid = load_pyramid(path, cache_dir)
+    level = 0
+    if size is not None:
+        h0, w0 = pyramid["shapes"][0]
+        ancho, alto = (region[2] - region[0]) * w0, (region[3] - region[1]) * h0
+        while (level + 1 < len(pyramid["shapes"]) and
+               ancho / 2 ** (level + 1) >= size[0] and alto / 2 ** (level + 1) >= size[1]):
+            level += 1
+
+    h, w = pyramid["shapes"][level]
+    box = (int(np.floor(region[0] * w)), int(np.floor(region[1] * h)),
+           max(int(np.ceil(region[2] * w)), 1), max(int(np.ceil(region[3] * h)), 1))
+    box = (max(box[0], 0), max(box[1], 0), min(box[2], w), min(box[3], h))
+    pixels = read_region(pyramid, level, box)
+    if size is None or pixels.shape[1::-1] == tuple(size):
+        return np.array(pixels)  # copy out of the memory map
+    return np.asarray(Image.fromarray(pixels).resize(tuple(size), Image.LANCZOS))
@@ -0,0 +1,206 @@
+# batch.py
+"""Headless batch runs: scenario files in, per-province results streamed out.
+
+    python batch.py escenarios.csv resultados.parquet --workers 4 --chunk-size 50000
+
+Scenario columns are diameter (m), speed (km/s), ix, iy and either a `defenses` column
+("laser+shield", empty for none) or one 0/1 column per defense name. Chunks run in worker
+processes and are written in input order as they finish; at most 2 * workers chunks are held
+in memory, so file size does not bound the run.
+"""
+import argparse
+from collections import deque
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from ensemble import make_executor
+from impact_model import DEFENSE_NAMES, PROVINCE_TABLE, simulate_impact_batch
+
+SCENARIO_COLUMNS = ("diameter", "speed", "ix", "iy")
+DEFENSE_SEPARATOR = "+"
+DEFAULT_CHUNK_SIZE = 50000
+
+def read_scenarios(path: str, chunk_size: int=DEFAULT_CHUNK_SIZE):
+    """Yield DataFrame chunks of a CSV or Parquet scenario file."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for lote in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield lote.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+def _defense_names(columna: pd.Series) -> pd.Series:
+    return columna.fillna("").astype(str).str.lower().str.replace(" ", "", regex=False)
+
+def unknown_defenses(nombres: pd.Series) -> set:
+    """Names in normalized `defenses` values that are not in DEFENSE_NAMES."""
+    return {token for valor in nombres.unique() for token in valor.split(DEFENSE_SEPARATOR)
+            if token} - set(DEFENSE_NAMES)
+
+def scenario_problems(path: str, chunk_size: int=DEFAULT_CHUNK_SIZE) -> list:
+    """Missing columns and unknown defense names of a scenario file, read before any run.
+
+    Only the header and the `defenses` column are read (why: a bad name deep in a large
+    file would otherwise stop the run after writing part of the output).
+    """
+    parquet = path.endswith('.parquet')
+    if parquet:
+        import pyarrow.parquet as pq
+        columnas = pq.ParquetFile(path).schema_arrow.names
+    else:
+        columnas = list(pd.read_csv(path, nrows=0).columns)
+    faltan = [c for c in SCENARIO_COLUMNS if c not in columnas]
+    if faltan:
+        return [f"missing columns {faltan}"]
+    if "defenses" not in columnas:
+        return []
+
+    if parquet:
+        lotes = (lote.to_pandas() for lote in
+                 pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=["defenses"]))
+    else:
+        lotes = pd.read_csv(path, usecols=["defenses"], dtype=str, chunksize=chunk_size)
+    desconocidas = set()
+    for lote in lotes:
+        desconocidas |= unknown_defenses(_defense_names(lote["defenses"]))
+    return [f"unknown defenses {sorted(desconocidas)}; expected {DEFENSE_NAMES}"] if desconocidas else []
+
+def parse_defenses(chunk: pd.DataFrame) -> np.ndarray:
+    """(M, 4) defense mask from a `defenses` name list or per-defense 0/1 columns."""
+    if "defenses" not in chunk:
+        return np.column_stack([chunk[name].fillna(0).astype(bool).to_numpy() if name in chunk
+                                else np.zeros(len(chunk), dtype=bool) for name in DEFENSE_NAMES])
+
+    nombres = _defense_names(chunk["defenses"])
+    desconocidas = unknown_defenses(nombres)
+    if desconocidas:
+        raise ValueError(f"Unknown defenses {sorted(desconocidas)}; expected {DEFENSE_NAMES}")
+    # Sentinel separators on both ends so 'laser' never matches inside another name
+    rodeadas = DEFENSE_SEPARATOR + nombres + DEFENSE_SEPARATOR
+    return np.column_stack([rodeadas.str.contains(DEFENSE_SEPARATOR + name + DEFENSE_SEPARATOR,
+                                                  regex=False).to_numpy() for name in DEFENSE_NAMES])
+
+def evaluate_chunk(first_row: int, inputs: dict, defenses: np.ndarray) -> pd.DataFrame:
+    """One output row per scenario: inputs, energy, radii and affected people per province."""
+    batch = simulate_impact_batch(inputs["diameter"], inputs["speed"], inputs["ix"], inputs["iy"],
+                                  defenses, PROVINCE_TABLE)
+    columnas = {
+        "scenario": np.arange(first_row, first_row + len(inputs["diameter"]), dtype=np.int64),
+        **inputs,
+        "energy_megatons": batch["energia_megatones"],
+        "reduction_%": batch["reduccion"],
+        "total_radius": batch["radio_destruccion_total"],
+        "partial_radius": batch["radio_destruccion_parcial"],
+        "total_affected": batch["poblacion_total_afectada"],
+    }
+    for j, provincia_id in enumerate(PROVINCE_TABLE["ids"]):
+        columnas[f"affected_{provincia_id}"] = batch["poblacion_afectada"][:, j]
+    return pd.DataFrame(columnas)
+
+class ResultWriter:
+    """Appends result chunks to a CSV or Parquet file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        self._file = None
+
+    def write(self, df: pd.DataFrame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tabla = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, tabla.schema)
+            self._writer.write_table(tabla)
+        else:
+            primera = self._file is None
+            if primera:
+                self._file = open(self.path, 'w', newline='')
+            df.to_csv(self._file, header=primera, index=False)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+def run_batch(input_path: str, output_path: str, workers: int|None=None,
+              chunk_size: int=DEFAULT_CHUNK_SIZE, progress=None) -> dict:
+    """Evaluate every scenario in `input_path` and stream the results to `output_path`.
+
+    `progress`, if given, is called with the number of rows written after each chunk.
+    """
+    workers = workers or os.cpu_count() or 1
+    executor = make_executor(workers)
+    max_pendientes = 2 * workers
+    writer = ResultWriter(output_path)
+    pendientes = deque()
+    filas = 0
+    inicio = time.perf_counter()
+
+    def escribir(df: pd.DataFrame):
+        nonlocal filas
+        writer.write(df)
+        filas += len(df)
+        if progress is not None:
+            progress(filas)
+
+    try:
+        siguiente = 0
+        for chunk in read_scenarios(input_path, chunk_size):
+            faltan = [c for c in SCENARIO_COLUMNS if c not in chunk]
+            if faltan:
+                raise ValueError(f"Scenario file is missing columns {faltan}")
+            inputs = {c: chunk[c].to_numpy(dtype=np.float64) for c in SCENARIO_COLUMNS}
+            args = (siguiente, inputs, parse_defenses(chunk))
+            siguiente += len(chunk)
+            if executor is None:
+                escribir(evaluate_chunk(*args))
+                continue
+            pendientes.append(executor.submit(evaluate_chunk, *args))
+            # Write in input order; waiting on the oldest chunk bounds what is held in memory
+            if len(pendientes) >= max_pendientes:
+                escribir(pendientes.popleft().result())
+        while pendientes:
+            escribir(pendientes.popleft().result())
+    finally:
+        for future in pendientes:
+            future.cancel()
+        writer.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    segundos = time.perf_counter() - inicio
+    return {"rows": filas, "seconds": segundos, "rows_per_second": filas / segundos if segundos else 0.0}
+
+def main(argv: list|None=None) -> int:
+    parser = argparse.ArgumentParser(description="Run meteor impact scenarios without the Streamlit app.")
+    parser.add_argument("input", help="scenario file (.csv or .parquet)")
+    parser.add_argument("output", help="results file (.csv or .parquet)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: CPU count; 1 runs in-process)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="scenarios per chunk")
+    parser.add_argument("--quiet", action="store_true", help="no progress on stderr")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        parser.error(f"{args.input} does not exist")
+    problemas = scenario_problems(args.input, args.chunk_size)
+    if problemas:
+        parser.error(f"{args.input}: " + "; ".join(problemas))
+    progress = None if args.quiet else (lambda n: print(f"\r{n:,} scenarios", end="", file=sys.stderr))
+    stats = run_batch(args.input, args.output, args.workers, args.chunk_size, progress)
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"{stats['rows']:,} scenarios in {stats['seconds']:.1f} s "
+          f"({stats['rows_per_second']:,.0f}/s) -> {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+# bench.py
+"""Latency benchmarks for the model, the map renderers and full-page reruns.
+
+    python bench.py -o bench.json                   # run everything, save JSON
+    python bench.py --only model. --only render.    # subset by name prefix
+    python bench.py --compare bench.json new.json   # flag regressions (exit 1)
+    python bench.py --only startup.                 # cold-start report
+    python bench.py --only counties.                # county polygons at 3k and 30k units
+    python bench.py --only model.entry              # atmospheric entry, single and 20k batch
+
+Page benchmarks drive app.py headlessly through Streamlit's AppTest harness. Medians over
+LATENCY_BUDGETS_MS fail the run, so the interactive path has hard budgets. Startup
+benchmarks run each sample in a fresh interpreter, break `import app` down by module and
+fail when the default page loads any of STARTUP_DEFERRED_MODULES.
+"""
+import argparse
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "app.py")
+
+DEFAULT_THRESHOLD = 0.10  # relative slowdown of the median that counts as a regression
+MIN_DELTA_MS = 0.05  # ignore regressions smaller than this (timer noise on µs benchmarks)
+ENTRY_BATCH = 20000  # meteors in the entry model's batch benchmark, one ensemble chunk
+
+# Median budgets for what a user waits on (ms)
+LATENCY_BUDGETS_MS = {
+    "page.rerun": 1000,
+    "page.simulate": 3000,
+    "model.simulate_impact_china": 1,
+    "model.defense_sweep": 100,
+    "model.entry.airburst": 100,
+    "model.entry.batch_20k": 6000,
+    "render.animation_clip": 1000,
+    "counties.30k.impact_small": 50,
+    "counties.30k.impact_large": 250,
+    "startup.import_app": 1500,
+    "startup.first_paint": 3000,
+}
+
+# Heavy packages the default page must not import (why: each adds 0.1-0.8 s to a cold start)
+STARTUP_DEFERRED_MODULES = ("matplotlib", "pandas", "pyarrow", "scipy", "trimesh")
+
+def measure(fn, repeat: int, warmup: int=1) -> dict:
+    """Wall-clock stats in ms over `repeat` calls after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    muestras = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        muestras.append((time.perf_counter() - t0) * 1000)
+    return summarize(muestras)
+
+def summarize(muestras: list) -> dict:
+    """n/min/median/p95/mean of durations in ms."""
+    muestras = sorted(muestras)
+    repeat = len(muestras)
+    return {
+        "n": repeat,
+        "min_ms": muestras[0],
+        "median_ms": statistics.median(muestras),
+        "p95_ms": muestras[min(repeat - 1, round(0.95 * (repeat - 1)))],
+        "mean_ms": statistics.fmean(muestras),
+    }
+
+# --- Benchmarks ---
+def model_benchmarks(app) -> dict:
+    from defense_sweep import minimum_defenses, sweep_defenses
+
+    import numpy as np
+    from entry_model import isotropic_angles, simulate_entry_batch
+
+    defensas = {"laser": True, "nuclear": False, "tractor": True, "shield": False}
+    rng = np.random.default_rng(0)
+    meteoros = (rng.uniform(100, 5000, ENTRY_BATCH), rng.uniform(10, 100, ENTRY_BATCH),
+                isotropic_angles(rng, ENTRY_BATCH), rng.choice([1000.0, 1500.0, 3000.0, 7800.0], ENTRY_BATCH))
+    return {
+        "model.defense_sweep": (lambda: minimum_defenses(sweep_defenses(105, 35), 200e6), 50),
+        "model.simulate_impact_china": (lambda: app.simulate_impact_china(500, 20, 105, 35, defensas), 2000),
+        "model.format_energy": (lambda: app.format_energy(123.456), 20000),
+        # Airburst (stony, 100 m) and ground impact (iron); then one ensemble chunk's worth
+        "model.entry.airburst": (lambda: simulate_entry_batch(100, 20, 45, 3000), 50),
+        "model.entry.ground": (lambda: simulate_entry_batch(500, 20, 45, 7800), 50),
+        "model.entry.batch_20k": (lambda: simulate_entry_batch(*meteoros), 3),
+    }
+
+def render_benchmarks(app) -> dict:
+    import animation
+    from figure_pool import FIGURES
+    import map_render
+
+    imagen = app.load_china_image()
+    version = app.map_asset_version()
+    base_layer = app.render_base_layer(imagen, version)
+    resultado = app.simulate_impact_china(500, 20, 105, 35, {})
+
+    def china_map(show_meteor: bool):
+        # Rasterized the way st.pyplot does (why: building the figure alone skips the real cost)
+        fig = map_render.create_china_map(imagen, show_meteor, (105, 35) if show_meteor else None, 1.2)
+        fig.savefig(io.BytesIO(), format='png', dpi=map_render.MAP_DPI, bbox_inches='tight')
+        FIGURES.release(fig)
+
+    def clip_frames():
+        return animation.render_frames(base_layer, (105, 35), resultado["radio_destruccion_total"],
+                                       resultado["radio_destruccion_parcial"])
+
+    frames = clip_frames()
+
+    def impact_map():
+        rgba = map_render.render_impact_map(base_layer, (105, 35), 1.2, resultado["radio_destruccion_total"],
+                                            resultado["radio_destruccion_parcial"], 'rocky')
+        return map_render.encode_png(rgba)
+
+    return {
+        "render.create_meteor": (lambda: map_render.create_meteor(1.0), 10),
+        "render.create_china_map.base": (lambda: china_map(False), 5),
+        "render.create_china_map.impact": (lambda: china_map(True), 5),
+        "render.render_base_layer": (lambda: map_render.render_base_layer(imagen), 3),
+        "render.render_impact_map": (impact_map, 10),
+        "render.animation_frames": (clip_frames, 5),
+        "render.animation_encode": (lambda: animation.encode_clip(frames), 5),
+        "render.animation_clip": (lambda: animation.encode_clip(clip_frames()), 5),
+        "assets.load_china_image": (lambda: app.load_china_image().load(), 10),
+        "assets.base_layer_cache": (lambda: app.render_base_layer.__wrapped__(imagen, version), 10),
+        "assets.generate_fallback_map": (map_render.generate_fallback_map, 5),
+    }
+
+def page_benchmarks(repeat: int) -> dict:
+    """First run, plain rerun and SIMULATE-to-result latency of the whole script."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_FILE, default_timeout=120)
+    resultados = {"page.first_run": measure(at.run, repeat=1, warmup=0)}
+    resultados["page.rerun"] = measure(at.run, repeat)
+
+    diametros = iter(range(100, 100 + 20 * (repeat + 1), 10))  # two measured loops
+
+    def simulate():
+        # A new diameter each time so no layer of caching turns this into a replay
+        next(w for w in at.sidebar.slider if w.key == "diametro").set_value(next(diametros))
+        next(w for w in at.button if w.label.startswith("SIMULATE")).click().run()
+        # Until the results show and, when animating, the clip has replaced the static map
+        while not at.dataframe or at.session_state["sondeo_simulacion"]:
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+            time.sleep(0.01)
+            at.run()
+
+    animar = at.sidebar.checkbox(key="animar_impacto")
+    animar.uncheck().run()
+    resultados["page.simulate"] = measure(simulate, repeat)
+    animar.check().run()
+    resultados["page.simulate.animated"] = measure(simulate, repeat)
+    return resultados
+
+# Run in a fresh interpreter from APP_DIR; each prints one JSON line
+_IMPORT_APP_CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+print(json.dumps({"ms": (time.perf_counter() - t0) * 1000, "modules": sorted(sys.modules)}))
+"""
+_FIRST_PAINT_CHILD = """
+import json, logging, sys, time, warnings
+t0 = time.perf_counter()
+logging.disable(logging.WARNING)
+warnings.filterwarnings('ignore')
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+print(json.dumps({"ms": (time.perf_counter() - t0) * 1000, "modules": sorted(sys.modules),
+                  "error": at.exception[0].message if at.exception else None}))
+"""
+
+def _child(code: str, *args: str) -> dict:
+    salida = subprocess.run([sys.executable, "-c", code, *args], cwd=APP_DIR,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+def import_breakdown() -> dict:
+    """{module: cumulative ms} of what `import app` pulls in directly, from `python -X importtime`."""
+    salida = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=APP_DIR,
+                            capture_output=True, text=True, check=True).stderr
+    modulos = {}
+    for linea in salida.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        _, acumulado, nombre = linea.split("|")
+        # Two spaces of indent per nesting level; level 1 is what app.py imports itself
+        if acumulado.strip().isdigit() and len(nombre) - len(nombre.lstrip()) == 3:
+            modulos[nombre.strip()] = int(acumulado) / 1000
+    return dict(sorted(modulos.items(), key=lambda kv: -kv[1]))
+
+def startup_benchmarks(repeat: int) -> tuple:
+    """Cold `import app` and time to the end of the first script run, each in a fresh process.
+
+    Returns (results, report) where the report holds the import breakdown and any
+    STARTUP_DEFERRED_MODULES the default page loaded.
+    """
+    importar, pintar, cargados = [], [], set()
+    for _ in range(repeat):
+        importar.append(_child(_IMPORT_APP_CHILD)["ms"])
+        primera = _child(_FIRST_PAINT_CHILD, APP_FILE)
+        if primera["error"]:
+            raise RuntimeError(primera["error"])
+        pintar.append(primera["ms"])
+        cargados.update(m.split(".")[0] for m in primera["modules"])
+    resultados = {"startup.import_app": summarize(importar), "startup.first_paint": summarize(pintar)}
+    informe = {
+        "imports": import_breakdown(),
+        "eager_heavy_modules": sorted(cargados & set(STARTUP_DEFERRED_MODULES)),
+    }
+    return resultados, informe
+
+# Synthetic county layers the polygon model is measured on
+COUNTY_SIZES = (3000, 30000)
+
+def county_benchmarks() -> tuple:
+    """Parse, cached load and per-impact latency of the county model, with and without its STR tree.
+
+    Returns (results, report) where the report holds per-size unit, edge, file and engine sizes
+    plus how many units the index leaves as candidates.
+    """
+    import tempfile
+
+    from county_model import (build_county_engine, engine_nbytes, load_counties, nearby_units,
+                              parse_counties, simulate_impact_counties, synthetic_counties)
+
+    resultados, informe = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in COUNTY_SIZES:
+            ruta = os.path.join(tmp, f"condados_{n}.geojson")
+            with open(ruta, 'w') as f:
+                json.dump(synthetic_counties(n), f)
+            with open(ruta) as f:
+                texto = f.read()
+            prefijo = f"counties.{n // 1000}k"
+            resultados[f"{prefijo}.parse"] = measure(lambda: parse_counties(json.loads(texto)), 1, warmup=0)
+            resultados[f"{prefijo}.load_cached"] = measure(lambda: load_counties(ruta, cache_dir=tmp), 5)
+            tabla = load_counties(ruta, cache_dir=tmp)
+            motor = build_county_engine(tabla)
+            resultados[f"{prefijo}.build_index"] = measure(lambda: build_county_engine(tabla), 5)
+            sin_indice = build_county_engine(tabla, index=False)
+            candidatos = {}
+            # 100 m: radii of 2 and 6 map units; 1000 m: 20 and 60 (most of the map)
+            for etiqueta, diametro in (("small", 100), ("large", 1000)):
+                resultados[f"{prefijo}.impact_{etiqueta}"] = measure(
+                    lambda: simulate_impact_counties(motor, diametro, 20, 85, 25, {}), 20)
+                resultados[f"{prefijo}.impact_{etiqueta}.no_index"] = measure(
+                    lambda: simulate_impact_counties(sin_indice, diametro, 20, 85, 25, {}), 20)
+                candidatos[etiqueta] = len(nearby_units(motor, 85, 25, diametro * 20 / 1000 * 3))
+            informe[prefijo] = {
+                "units": len(tabla["ids"]),
+                "edges": len(tabla["vertices"]),
+                "geojson_mb": len(texto) / 2**20,
+                "engine_mb": engine_nbytes(motor) / 2**20,
+                "candidates": candidatos,
+            }
+    return resultados, informe
+
+# Prefixes of the benchmark names each group produces (why: skip a group's setup when unselected)
+BENCHMARK_GROUPS = (
+    (("model.",), model_benchmarks),
+    (("render.", "assets."), render_benchmarks),
+)
+
+def run_benchmarks(only: list|None=None, page_repeat: int=10, startup_repeat: int=5) -> dict:
+    os.chdir(APP_DIR)  # the app opens its assets by relative path
+    sys.path.insert(0, APP_DIR)
+    import app
+
+    def wanted(name: str) -> bool:
+        return not only or any(name.startswith(prefix) for prefix in only)
+
+    def group_wanted(prefixes: tuple) -> bool:
+        return not only or any(p.startswith(o) or o.startswith(p) for p in prefixes for o in only)
+
+    resultados = {}
+    for prefixes, grupo in BENCHMARK_GROUPS:
+        if not group_wanted(prefixes):
+            continue
+        for name, (fn, repeat) in grupo(app).items():
+            if wanted(name):
+                resultados[name] = measure(fn, repeat)
+                print(f"{name:36s} {resultados[name]['median_ms']:10.3f} ms", file=sys.stderr)
+    if group_wanted(("page.",)):
+        for name, stats in page_benchmarks(page_repeat).items():
+            if wanted(name):
+                resultados[name] = stats
+                print(f"{name:36s} {stats['median_ms']:10.3f} ms", file=sys.stderr)
+    run = {"meta": _meta(), "results": resultados}
+    if group_wanted(("startup.",)):
+        startup, run["startup"] = startup_benchmarks(startup_repeat)
+        for name, stats in startup.items():
+            if wanted(name):
+                resultados[name] = stats
+                print(f"{name:36s} {stats['median_ms']:10.3f} ms", file=sys.stderr)
+        for modulo, ms in list(run["startup"]["imports"].items())[:10]:
+            print(f"  import {modulo:29s} {ms:10.3f} ms", file=sys.stderr)
+    if group_wanted(("counties.",)):
+        condados, run["counties"] = county_benchmarks()
+        for name, stats in condados.items():
+            if wanted(name):
+                resultados[name] = stats
+                print(f"{name:36s} {stats['median_ms']:10.3f} ms", file=sys.stderr)
+        for prefijo, info in run["counties"].items():
+            print(f"  {prefijo}: {info['units']:,} units, {info['edges']:,} edges, "
+                  f"{info['engine_mb']:.1f} MB engine, {info['geojson_mb']:.1f} MB GeoJSON, "
+                  f"candidates {info['candidates']}", file=sys.stderr)
+    return run
+
+def _meta() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+# --- Checks ---
+def check_budgets(results: dict, budgets: dict=LATENCY_BUDGETS_MS) -> list:
+    """Names whose median is over budget, as (name, median_ms, budget_ms)."""
+    return [(name, results[name]["median_ms"], budget)
+            for name, budget in budgets.items() if name in results and results[name]["median_ms"] > budget]
+
+def compare(base: dict, new: dict, threshold: float=DEFAULT_THRESHOLD, min_delta_ms: float=MIN_DELTA_MS) -> list:
+    """One row per benchmark present in both runs: (name, base_ms, new_ms, ratio, regressed)."""
+    filas = []
+    for name in sorted(set(base["results"]) & set(new["results"])):
+        antes = base["results"][name]["median_ms"]
+        despues = new["results"][name]["median_ms"]
+        ratio = despues / antes if antes else float('inf')
+        regresion = ratio > 1 + threshold and despues - antes > min_delta_ms
+        filas.append((name, antes, despues, ratio, regresion))
+    return filas
+
+def main(argv: list|None=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the impact simulator.")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--only", action="append", metavar="PREFIX",
+                        help="run only benchmarks whose name starts with PREFIX (repeatable)")
+    parser.add_argument("--page-repeat", type=int, default=10, help="samples per page benchmark")
+    parser.add_argument("--startup-repeat", type=int, default=5, help="fresh processes per startup benchmark")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative median slowdown flagged as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        filas = compare(base, new, args.threshold)
+        print(f"{'benchmark':36s} {'base ms':>10s} {'new ms':>10s} {'ratio':>7s}")
+        for name, antes, despues, ratio, regresion in filas:
+            print(f"{name:36s} {antes:10.3f} {despues:10.3f} {ratio:7.2f}{'  REGRESSION' if regresion else ''}")
+        fallos = sum(regresion for *_, regresion in filas)
+        resultados = new["results"]
+    else:
+        logging.disable(logging.WARNING)  # "no script run context" noise outside `streamlit run`
+        warnings.filterwarnings('ignore')
+        run = run_benchmarks(args.only, args.page_repeat, args.startup_repeat)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(run, f, indent=2)
+        else:
+            json.dump(run, sys.stdout, indent=2)
+            print()
+        fallos = 0
+        resultados = run["results"]
+        for modulo in run.get("startup", {}).get("eager_heavy_modules", []):
+            print(f"EAGER IMPORT {modulo}: loaded by the default page", file=sys.stderr)
+            fallos += 1
+
+    for name, mediana, budget in check_budgets(resultados):
+        print(f"OVER BUDGET {name}: median {mediana:.3f} ms > {budget} ms", file=sys.stderr)
+        fallos += 1
+    return 1 if fallos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+# checks.py
+"""Correctness checks for what bench.py, loadtest.py and soak.py only time.
+
+    python checks.py                                # every check
+    python checks.py --only counties.               # subset by name prefix
+    python checks.py -o checks.json                 # save what each check measured as JSON
+
+Every check is seeded and runs in seconds. It returns what it measured plus a list of
+failures, one line per check is printed, and the run exits 1 if any check failed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+SEED = 0
+
+# --- County geometry and index ---
+_COUNTY_LAYER = {}
+
+def county_layer(n_units: int=3000) -> dict:
+    """Parsed synthetic county layer, built once per run."""
+    from county_model import parse_counties, synthetic_counties
+    if n_units not in _COUNTY_LAYER:
+        _COUNTY_LAYER[n_units] = parse_counties(synthetic_counties(n_units, seed=SEED))
+    return _COUNTY_LAYER[n_units]
+
+def unit_edges(table: dict, unidades: np.ndarray) -> tuple:
+    """(a, b, group) edges of the given units, grouped 0..len(unidades)-1."""
+    inicio = table["edge_offsets"][unidades]
+    longitud = table["edge_offsets"][unidades + 1] - inicio
+    aristas = np.concatenate([np.arange(s, s + n) for s, n in zip(inicio, longitud)])
+    grupo = np.repeat(np.arange(len(unidades)), longitud)
+    return table["vertices"][aristas], table["vertices"][table["siguiente"][aristas]], grupo
+
+def inside_rings(px: np.ndarray, py: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Even-odd point-in-polygon over a unit's edges (holes included)."""
+    dentro = np.zeros(len(px), dtype=bool)
+    for (ax, ay), (bx, by) in zip(a, b):
+        cruza = (ay > py) != (by > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_corte = ax + (bx - ax) * (py - ay) / (by - ay)
+        dentro ^= cruza & (px < x_corte)
+    return dentro
+
+def check_circle_area() -> tuple:
+    """circle_polygon_area against Monte Carlo, and against closed forms where the disk or unit is whole."""
+    from county_model import circle_polygon_area, parse_counties
+    rng = np.random.default_rng(SEED)
+    table = county_layer()
+    # A concave unit with a hole, given clockwise (why: exercises the parser's ring orientation)
+    estrella = [[10 + (4 if k % 2 else 9) * np.cos(k * np.pi / 6), 10 + (4 if k % 2 else 9) * np.sin(k * np.pi / 6)]
+                for k in range(12, 0, -1)]
+    hueco = [[9, 9], [11, 9], [11, 11], [9, 11]]
+    especial = parse_counties({"type": "FeatureCollection", "features": [
+        {"properties": {"population": 1}, "geometry": {"type": "Polygon", "coordinates": [estrella, hueco]}}]})
+
+    n_puntos = 200_000
+    desvios, fallos = [], []
+    casos = [(table, u) for u in rng.choice(len(table["area"]), 40, replace=False)] + [(especial, 0)] * 10
+    for tabla, u in casos:
+        a, b, grupo = unit_edges(tabla, np.array([u]))
+        x0, y0, x1, y1 = tabla["bounds"][u]
+        lado = max(x1 - x0, y1 - y0)
+        cx, cy = rng.uniform(x0, x1), rng.uniform(y0, y1)
+        r = rng.uniform(0.1, 0.8) * lado
+        exacta = circle_polygon_area(cx, cy, r, a, b, grupo, 1)[0]
+
+        px, py = rng.uniform(x0, x1, n_puntos), rng.uniform(y0, y1, n_puntos)
+        p = np.mean(inside_rings(px, py, a, b) & ((px - cx) ** 2 + (py - cy) ** 2 <= r * r))
+        caja = (x1 - x0) * (y1 - y0)
+        sigma = caja * np.sqrt(max(p * (1 - p), 1 / n_puntos) / n_puntos)
+        desvios.append(abs(exacta - p * caja) / sigma)
+        if desvios[-1] > 5:
+            fallos.append(f"unit {u}: exact {exacta:.6g} vs Monte Carlo {p * caja:.6g} ({desvios[-1]:.1f} sigma)")
+
+    # Closed forms: a disk covering the unit, and a disk inside it
+    error_cerrado = 0.0
+    for tabla, u in casos[:10] + casos[-1:]:
+        a, b, grupo = unit_edges(tabla, np.array([u]))
+        x0, y0, x1, y1 = tabla["bounds"][u]
+        cubre = circle_polygon_area((x0 + x1) / 2, (y0 + y1) / 2, 10 * max(x1 - x0, y1 - y0), a, b, grupo, 1)[0]
+        error_cerrado = max(error_cerrado, abs(cubre - tabla["area"][u]) / tabla["area"][u])
+    a, b, grupo = unit_edges(especial, np.array([0]))
+    dentro = circle_polygon_area(13, 10, 1.0, a, b, grupo, 1)[0]  # clear of the hole and the star's waist
+    error_cerrado = max(error_cerrado, abs(dentro - np.pi) / np.pi)
+    if error_cerrado > 1e-9:
+        fallos.append(f"closed-form areas off by {error_cerrado:.3g} (relative)")
+    return {"cases": len(casos), "points": n_puntos, "max_sigma": max(desvios),
+            "closed_form_rel_error": error_cerrado}, fallos
+
+def check_str_tree() -> tuple:
+    """query_str_tree and nearby_units against the linear _overlaps scan."""
+    from county_model import NODE_SIZE, _overlaps, build_county_engine, build_str_tree, nearby_units, query_str_tree
+    rng = np.random.default_rng(SEED)
+    capas = {"counties_3k": county_layer()["bounds"]}
+    # Random boxes, a count that does not fill the last node, and clustered small ones
+    centros = rng.uniform(0, 100, (1237, 2))
+    lados = rng.uniform(0.1, 5, (1237, 2))
+    capas["random_1237"] = np.column_stack([centros - lados, centros + lados])
+    grupos = rng.normal(50, 3, (2500, 2))
+    capas["clustered_2500"] = np.column_stack([grupos, grupos + 0.05])
+
+    consultas = 0
+    fallos = []
+    for nombre, bounds in capas.items():
+        x0, y0 = bounds[:, :2].min(axis=0)
+        x1, y1 = bounds[:, 2:].max(axis=0)
+        cajas = []
+        for _ in range(300):
+            cx, cy = rng.uniform(x0 - 5, x1 + 5), rng.uniform(y0 - 5, y1 + 5)
+            mx, my = rng.exponential(0.05 * (x1 - x0)), rng.exponential(0.05 * (y1 - y0))
+            cajas.append((cx - mx, cy - my, cx + mx, cy + my))
+        cajas += [(x0, y0, x1, y1), (x1 + 1, y1 + 1, x1 + 2, y1 + 2), (x0, y0, x0, y0)]  # all, none, a corner
+        for node_size in (4, NODE_SIZE):
+            niveles = build_str_tree(bounds, node_size)
+            for caja in cajas:
+                consultas += 1
+                arbol = np.sort(query_str_tree(niveles, bounds, caja, node_size))
+                lineal = np.flatnonzero(_overlaps(bounds, caja))
+                if not np.array_equal(arbol, lineal):
+                    fallos.append(f"{nombre}, node size {node_size}, box {np.round(caja, 3).tolist()}: "
+                                  f"{len(arbol)} from the tree, {len(lineal)} from the scan")
+        motor = build_county_engine({"bounds": bounds, "poblacion": np.zeros(len(bounds), dtype=np.int64)})
+        for caja in cajas:
+            consultas += 1
+            ix, iy, radio = (caja[0] + caja[2]) / 2, (caja[1] + caja[3]) / 2, (caja[2] - caja[0]) / 2
+            if not np.array_equal(nearby_units(motor, ix, iy, radio),
+                                  np.flatnonzero(_overlaps(bounds, (ix - radio, iy - radio, ix + radio, iy + radio)))):
+                fallos.append(f"{nombre}: nearby_units({ix:.3f}, {iy:.3f}, {radio:.3f}) differs from the scan")
+    return {"layers": list(capas), "queries": consultas}, fallos[:20]
+
+def check_county_engine() -> tuple:
+    """Indexed county_overlap against exact geometry over every unit, for 200 random impacts."""
+    from county_model import build_county_engine, circle_polygon_area, county_overlap
+    from density_model import DENSITY_EXTENT
+    rng = np.random.default_rng(SEED)
+    table = county_layer()
+    motor = build_county_engine(table)
+    todas = np.arange(len(table["area"]))
+    a, b, grupo = unit_edges(table, todas)
+    x0, x1, y0, y1 = DENSITY_EXTENT
+
+    error = 0.0
+    fallos = []
+    for k in range(200):
+        ix, iy = rng.uniform(x0, x1), rng.uniform(y0, y1)
+        r_total = rng.uniform(0.2, 8)
+        r_partial = 3 * r_total
+        unidades, area_total, area_parcial = county_overlap(motor, ix, iy, r_total, r_partial)
+        for r, area in ((r_total, area_total), (r_partial, area_parcial)):
+            indexada = np.zeros(len(todas))
+            indexada[unidades] = area
+            exacta = circle_polygon_area(ix, iy, r, a, b, grupo, len(todas))
+            desvio = np.max(np.abs(indexada - exacta) / table["area"])
+            error = max(error, desvio)
+            if desvio > 1e-9:
+                fallos.append(f"impact {k} at ({ix:.2f}, {iy:.2f}), r {r:.2f}: unit areas off by {desvio:.3g}")
+    return {"impacts": 200, "units": len(todas), "max_rel_error": error}, fallos[:20]
+
+def check_plotly_models() -> tuple:
+    """Every model's result draws on the plotly map; province tooltips show affected rows only where they exist."""
+    from county_model import build_county_engine, simulate_impact_counties
+    from density_model import build_density_engine, load_density, simulate_impact_density
+    from impact_model import PROVINCE_TABLE, simulate_impact_china
+    from plotly_map import base_figure, china_map_figure
+    base = base_figure("data:,")
+    simple = [trace["text"] for trace in base["provinces"]]
+    entradas = (2000, 25, 100, 30, {"laser": True})
+    modelos = {
+        "China": lambda: simulate_impact_china(*entradas),
+        "Density raster": lambda: simulate_impact_density(build_density_engine(load_density(), factor=4), *entradas),
+        "County polygons": lambda: simulate_impact_counties(build_county_engine(county_layer()), *entradas),
+    }
+    fallos = []
+    con_filas = {}
+    for nombre, simulate in modelos.items():
+        result = simulate()
+        try:
+            figura = china_map_figure(base, result)
+        except Exception as e:
+            fallos.append(f"{nombre}: china_map_figure raised {type(e).__name__}: {e}")
+            continue
+        textos = [trace["text"] for trace in figura["data"][:len(simple)]]
+        con_filas[nombre] = sum("Affected" in texto for texto in textos)
+        for j, provincia_id in enumerate(PROVINCE_TABLE["ids"]):
+            esperado = provincia_id in result["provincias_afectadas"]
+            if ("Affected" in textos[j]) != esperado or not textos[j].startswith(simple[j]):
+                fallos.append(f"{nombre}: tooltip of {provincia_id} is {textos[j]!r}")
+    return {"affected_tooltips": con_filas, "provinces": len(simple)}, fallos[:20]
+
+# --- Result cache ---
+def shape(valor):
+    """Nested types of a value, to compare what each cache tier hands out."""
+    from collections.abc import Mapping
+    if isinstance(valor, Mapping):
+        return {key: shape(v) for key, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [type(valor).__name__] + [shape(v) for v in valor]
+    return type(valor).__name__
+
+def thaw(valor):
+    """Plain dicts, lists and Python scalars from a frozen or freshly computed value."""
+    from collections.abc import Mapping
+    if isinstance(valor, Mapping):
+        return {key: thaw(v) for key, v in valor.items()}
+    if isinstance(valor, (list, tuple, np.ndarray)):
+        return [thaw(v) for v in valor]
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+def check_cache_memory() -> tuple:
+    """Byte bound, LRU eviction order and oversized values of the memory tier."""
+    from result_cache import ResultCache
+    rng = np.random.default_rng(SEED)
+    fallos = []
+    cache = ResultCache(max_bytes=5000)
+    for k in range(5):
+        cache.put(("k", k), bytes(1000))
+    cache.get(("k", 0))  # now the most recent
+    cache.put(("k", 5), bytes(1000))
+    presentes = [k for k in range(6) if cache.get(("k", k)) is not None]
+    if presentes != [0, 2, 3, 4, 5]:
+        fallos.append(f"after touching key 0 and adding key 5, memory holds {presentes} (expected [0, 2, 3, 4, 5])")
+    if cache.stats()["evictions"] != 1:
+        fallos.append(f"{cache.stats()['evictions']} evictions for one entry over the bound")
+
+    grande = cache.put(("grande",), bytes(6000))
+    if grande != bytes(6000) or cache.get(("grande",)) is not None or cache.stats()["evictions"] != 1:
+        fallos.append("a value over max_bytes was kept, or evicted others, or not handed back")
+
+    # Random sizes and keys: the bound holds and `bytes` is what the entries add up to
+    cache = ResultCache(max_bytes=50_000)
+    for _ in range(2000):
+        cache.put(("r", int(rng.integers(200))), bytes(int(rng.integers(1, 8000))))
+        if rng.random() < 0.3:
+            cache.get(("r", int(rng.integers(200))))
+        stats = cache.stats()
+        suma = sum(size for _, size in cache._entries.values())
+        if stats["bytes"] > cache.max_bytes or stats["bytes"] != suma:
+            fallos.append(f"{stats['bytes']} bytes counted, {suma} held, bound {cache.max_bytes}")
+            break
+    return {"random_puts": 2000, "evictions": cache.stats()["evictions"], "entries": cache.stats()["entries"]}, fallos
+
+def check_cache_tiers() -> tuple:
+    """A model result is equal, read-only and of the same nested types fresh, from memory and from disk."""
+    import tempfile
+    from impact_model import DEFENSE_NAMES, DEFENSE_REDUCTION, simulate_impact_china
+    from result_cache import ResultCache, result_key
+    fallos = []
+    defensas = {"laser": True, "nuclear": False}
+    original = simulate_impact_china(1500, 20, 95, 32, defensas)
+    if not np.isclose(original["reduccion"], 100 * DEFENSE_REDUCTION[DEFENSE_NAMES.index("laser")]):
+        fallos.append(f"the laser did not reach the model: reduction {original['reduccion']}")
+    clave = result_key("China", 1500, 20, 95, 32, defensas, "checks")
+    with tempfile.TemporaryDirectory() as carpeta:
+        cache = ResultCache(disk_dir=carpeta)
+        fresco = cache.get_or_compute(clave, lambda: original)
+        memoria = cache.get(clave)
+        otro = ResultCache(disk_dir=carpeta)  # a restart, or another process
+        disco = otro.get(clave)
+        if otro.stats()["disk_hits"] != 1:
+            fallos.append(f"no disk hit after a restart: {otro.stats()}")
+        promovido = otro.get(clave)
+        if otro.stats()["hits"] != 1:
+            fallos.append("a disk hit was not promoted to memory")
+
+        # Switched-off names share the entry; another active set is another key and misses
+        if result_key("China", 1500, 20, 95, 32, {"laser": True}, "checks") != clave:
+            fallos.append("a switched-off defense changes the key")
+        otra = result_key("China", 1500, 20, 95, 32, {"laser": True, "nuclear": True}, "checks")
+        if otra == clave or otro.get(otra) is not None or otro.stats()["misses"] != 1:
+            fallos.append("another defense set shares the key or hits the cache")
+
+        # NaN distances compare unequal to themselves, so the two sides are compared as JSON text
+        if json.dumps(thaw(original), sort_keys=True) != json.dumps(thaw(disco), sort_keys=True):
+            fallos.append("the disk tier does not give back the computed values")
+        formas = {nombre: shape(v) for nombre, v in
+                  (("fresh", fresco), ("memory", memoria), ("disk", disco), ("promoted", promovido))}
+        for nombre, forma in formas.items():
+            if forma != formas["fresh"]:
+                fallos.append(f"{nombre} hit differs in nested types from the fresh value")
+        for nombre, valor in (("fresh", fresco), ("disk", disco)):
+            try:
+                valor["punto_impacto"] = (0, 0)
+                fallos.append(f"{nombre} value can be changed in place")
+            except TypeError:
+                pass
+        if memoria is not fresco:
+            fallos.append("a memory hit is not the stored object")
+    return {"keys": len(original), "punto_impacto": formas["disk"]["punto_impacto"][0]}, fallos
+
+def check_cache_disk_prune() -> tuple:
+    """The disk tier stays under its bound, dropping its oldest entries down to 3/4 of it."""
+    import tempfile
+    from result_cache import ResultCache
+    fallos = []
+    with tempfile.TemporaryDirectory() as carpeta:
+        cache = ResultCache(max_bytes=0, disk_dir=carpeta, max_disk_bytes=10_000)
+        inicio = time.time() - 1000
+        for k in range(40):
+            cache.put(("d", k), bytes(1000))
+            t = inicio + k  # (why: writes within one mtime tick would leave the order to the file system)
+            os.utime(cache._path(("d", k), ".bin"), (t, t))
+            total = sum(e.stat().st_size for e in os.scandir(carpeta))
+            if total > cache.max_disk_bytes:
+                fallos.append(f"after write {k}: {total} bytes on disk, bound {cache.max_disk_bytes}")
+        presentes = [k for k in range(40) if os.path.exists(cache._path(("d", k), ".bin"))]
+        if not presentes or presentes != list(range(presentes[0], 40)):
+            fallos.append(f"pruning kept {presentes}, not the newest entries")
+        leidos = [k for k in presentes if ResultCache(max_bytes=0, disk_dir=carpeta).get(("d", k)) == bytes(1000)]
+        if leidos != presentes:
+            fallos.append("entries left on disk do not read back")
+    return {"written": 40, "kept": len(presentes), "bytes_kept": total}, fallos
+
+# --- Seeded ensembles ---
+ENSEMBLE_CONFIG = {"diameter_range": (200, 3000), "speed_range": (11, 40), "impact": (95, 32),
+                   "sigma": (8, 3), "angle_deg": 30, "defenses": {"laser": True, "shield": True}}
+
+def final_summary(config: dict, n: int, seed: int, executor=None) -> str:
+    """Last summary of an ensemble run as canonical JSON (arrays as lists)."""
+    from ensemble import run_ensemble
+    for resumen in run_ensemble(config, n, seed=seed, chunk_size=7000, executor=executor):
+        pass
+    return json.dumps(resumen, sort_keys=True, default=lambda a: a.tolist())
+
+def check_ensemble_seed() -> tuple:
+    """A seed fixes the ensemble: rerun, across a process pool and with the entry model, and only it."""
+    from ensemble import make_executor
+    fallos = []
+    n = 30_000  # five chunks, the last one short
+    configs = {"impact": ENSEMBLE_CONFIG, "entry": {**ENSEMBLE_CONFIG, "entry": {"density": 3000}}}
+    executor = make_executor(2)  # (why: finishes chunks out of order even on one core)
+    try:
+        for nombre, config in configs.items():
+            serie = final_summary(config, n, seed=7)
+            if final_summary(config, n, seed=7) != serie:
+                fallos.append(f"{nombre}: two serial runs with seed 7 differ")
+            if final_summary(config, n, seed=7, executor=executor) != serie:
+                fallos.append(f"{nombre}: the process pool's summary differs from the serial one")
+            if final_summary(config, n, seed=8) == serie:
+                fallos.append(f"{nombre}: seeds 7 and 8 give the same summary")
+            if final_summary({**config, "defenses": {}}, n, seed=7) == serie:
+                fallos.append(f"{nombre}: switching the defenses off leaves the summary unchanged")
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return {"samples": n, "configs": list(configs)}, fallos
+
+CHECKS = {
+    "counties.circle_area": check_circle_area,
+    "counties.str_tree": check_str_tree,
+    "counties.engine_exact": check_county_engine,
+    "counties.plotly": check_plotly_models,
+    "cache.memory": check_cache_memory,
+    "cache.tiers": check_cache_tiers,
+    "cache.disk_prune": check_cache_disk_prune,
+    "ensemble.seed": check_ensemble_seed,
+}
+
+# --- Driver ---
+def main(argv: list|None=None) -> int:
+    parser = argparse.ArgumentParser(description="Correctness checks for the impact simulator.")
+    parser.add_argument("--only", action="append", metavar="PREFIX", help="run checks whose name starts with PREFIX")
+    parser.add_argument("-o", "--output", help="write what each check measured as JSON to this file")
+    args = parser.parse_args(argv)
+
+    resultados = {}
+    fallidos = 0
+    for nombre, check in CHECKS.items():
+        if args.only and not any(nombre.startswith(prefijo) for prefijo in args.only):
+            continue
+        t0 = time.perf_counter()
+        medido, fallos = check()
+        segundos = time.perf_counter() - t0
+        fallidos += bool(fallos)
+        resultados[nombre] = {"measured": medido, "failures": fallos, "seconds": segundos}
+        print(f"{'FAIL' if fallos else 'ok':4s} {nombre:32s} {segundos:5.1f} s  {json.dumps(medido, default=float)}")
+        for fallo in fallos:
+            print(f"     {fallo}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(resultados, f, indent=2, default=float)
+    return 1 if fallidos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+# county_model.py
+"""County-level population engine over real polygon geometry.
+
+Units come from a GeoJSON FeatureCollection in map units (Polygon or MultiPolygon features with
+`population`, optional `name` and `province` properties), parsed once into flat edge arrays and
+cached as .npz keyed by the file hash. An STR-packed bounding-box tree prunes each impact to the
+units near the partial destruction disk; their overlap with both disks is the exact
+circle-polygon intersection area, and affected people are weighted by those area fractions.
+
+    python county_model.py synth condados.geojson --units 3000   # synthetic layer for demos/benchmarks
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from impact_model import (FACTOR_OUTSIDE, FACTOR_PARTIAL, FACTOR_TOTAL, PROVINCE_TABLE,
+                          defense_mask, entry_summary, simulate_impact_batch)
+
+COUNTIES_FILE = "condados.geojson"
+CACHE_DIR = ".cache"
+LOADER_VERSION = 1  # bump when the parsed layout changes (invalidates cached .npz files)
+NODE_SIZE = 16  # children per STR-tree node
+
+# Result row for units outside the partial destruction disk
+REST_ID = 'resto'
+REST_NAME = 'Units outside the blast'
+REST_DESCRIPTION = 'Every unit the destruction disks do not reach'
+
+# --- Loading ---
+def _signed_area(ring: np.ndarray) -> float:
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+def _polygons(geometry: dict) -> list:
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    raise ValueError(f"Unsupported geometry type {geometry['type']!r}")
+
+def parse_counties(geojson: dict) -> dict:
+    """Columnar unit table from a FeatureCollection; holes are stored clockwise so areas subtract."""
+    ids, nombres, provincias, poblacion = [], [], [], []
+    anillos, ring_unit = [], []
+    for n, feature in enumerate(geojson["features"]):
+        props = feature.get("properties") or {}
+        if "population" not in props:
+            raise ValueError(f"Feature {n} has no 'population' property")
+        unit_id = str(props.get("id", feature.get("id", n)))
+        ids.append(unit_id)
+        nombres.append(str(props.get("name", unit_id)))
+        provincias.append(str(props.get("province", "")))
+        poblacion.append(int(props["population"]))
+        for poligono in _polygons(feature["geometry"]):
+            for k, coords in enumerate(poligono):
+                ring = np.asarray(coords, dtype=np.float64)[:, :2]
+                if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+                    ring = ring[:-1]  # GeoJSON repeats the first point
+                if len(ring) < 3:
+                    continue
+                # Exterior counter-clockwise, holes clockwise
+                if (_signed_area(ring) > 0) != (k == 0):
+                    ring = ring[::-1]
+                anillos.append(ring)
+                ring_unit.append(len(ids) - 1)
+
+    n_units = len(ids)
+    longitudes = np.array([len(r) for r in anillos], dtype=np.int64)
+    vertices = np.concatenate(anillos) if anillos else np.zeros((0, 2))
+    ring_start = np.concatenate([[0], np.cumsum(longitudes)[:-1]]).astype(np.int64)
+    # Index of each vertex's successor in its own ring (why: edges without a copy of every end point)
+    siguiente = np.arange(len(vertices), dtype=np.int64) + 1
+    ultimos = ring_start + longitudes - 1
+    siguiente[ultimos] = ring_start
+    edge_unit = np.repeat(np.array(ring_unit, dtype=np.int64), longitudes)
+
+    x0 = np.full(n_units, np.inf)
+    y0 = np.full(n_units, np.inf)
+    x1 = np.full(n_units, -np.inf)
+    y1 = np.full(n_units, -np.inf)
+    np.minimum.at(x0, edge_unit, vertices[:, 0])
+    np.minimum.at(y0, edge_unit, vertices[:, 1])
+    np.maximum.at(x1, edge_unit, vertices[:, 0])
+    np.maximum.at(y1, edge_unit, vertices[:, 1])
+
+    # Shoelace per edge summed per unit; area-weighted centroid from the same cross products
+    a, b = vertices, vertices[siguiente]
+    cruz = a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1]
+    area = 0.5 * np.bincount(edge_unit, cruz, minlength=n_units)
+    area_segura = np.where(area > 0, area, 1.0)
+    cx = np.bincount(edge_unit, (a[:, 0] + b[:, 0]) * cruz, minlength=n_units) / (6 * area_segura)
+    cy = np.bincount(edge_unit, (a[:, 1] + b[:, 1]) * cruz, minlength=n_units) / (6 * area_segura)
+
+    # Units own contiguous edge ranges (why: a candidate's edges are one slice)
+    orden = np.argsort(edge_unit, kind='stable')
+    inverso = np.empty_like(orden)
+    inverso[orden] = np.arange(len(orden))
+    return {
+        "ids": np.array(ids),
+        "nombres": np.array(nombres),
+        "provincias": np.array(provincias),
+        "poblacion": np.array(poblacion, dtype=np.int64),
+        "vertices": vertices[orden],
+        "siguiente": inverso[siguiente[orden]],
+        "edge_offsets": np.concatenate([[0], np.cumsum(np.bincount(edge_unit, minlength=n_units))]).astype(np.int64),
+        "bounds": np.column_stack([x0, y0, x1, y1]),
+        "area": area,
+        "cx": cx,
+        "cy": cy,
+    }
+
+def load_counties(path: str=COUNTIES_FILE, cache_dir: str=CACHE_DIR) -> dict:
+    """Unit table of `path`, parsed on first use and loaded from the .npz cache afterwards."""
+    with open(path, 'rb') as f:
+        datos = f.read()
+    digest = hashlib.sha1(datos).hexdigest()[:12]
+    cache_file = os.path.join(cache_dir, f"condados_{digest}_v{LOADER_VERSION}.npz")
+    if not os.path.exists(cache_file):
+        table = parse_counties(json.loads(datos))
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{cache_file}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, **table)
+        os.replace(tmp, cache_file)  # atomic (why: concurrent sessions may build at once)
+
+    with np.load(cache_file) as data:
+        table = {key: data[key] for key in data.files}
+    table["version"] = f"{digest}_v{LOADER_VERSION}"
+    return table
+
+# --- STR tree ---
+def _str_order(bounds: np.ndarray, node_size: int) -> np.ndarray:
+    """Sort-Tile-Recursive order: x slices of whole nodes, each sorted by y."""
+    cx = (bounds[:, 0] + bounds[:, 2]) / 2
+    cy = (bounds[:, 1] + bounds[:, 3]) / 2
+    n_nodes = -(-len(bounds) // node_size)
+    por_franja = int(np.ceil(np.sqrt(n_nodes))) * node_size
+    por_x = np.argsort(cx, kind='stable')
+    franja = np.arange(len(bounds)) // por_franja
+    return por_x[np.lexsort((cy[por_x], franja))]
+
+def build_str_tree(bounds: np.ndarray, node_size: int=NODE_SIZE) -> list:
+    """Levels bottom-up; each is (order, node_bounds) where node i holds order[i*size:(i+1)*size]."""
+    niveles = []
+    items = bounds
+    while True:
+        orden = _str_order(items, node_size)
+        n_nodes = -(-len(items) // node_size)
+        agrupados = np.full((n_nodes * node_size, 4), np.nan)
+        agrupados[:len(items)] = items[orden]
+        agrupados = agrupados.reshape(n_nodes, node_size, 4)
+        nodos = np.column_stack([np.nanmin(agrupados[..., 0], axis=1), np.nanmin(agrupados[..., 1], axis=1),
+                                 np.nanmax(agrupados[..., 2], axis=1), np.nanmax(agrupados[..., 3], axis=1)])
+        niveles.append((orden, nodos))
+        if n_nodes == 1:
+            return niveles
+        items = nodos
+
+def _overlaps(bounds: np.ndarray, box: tuple) -> np.ndarray:
+    return ((bounds[:, 0] <= box[2]) & (bounds[:, 2] >= box[0]) &
+            (bounds[:, 1] <= box[3]) & (bounds[:, 3] >= box[1]))
+
+def query_str_tree(niveles: list, bounds: np.ndarray, box: tuple, node_size: int=NODE_SIZE) -> np.ndarray:
+    """Indices of the items whose bounds overlap `box` = (x0, y0, x1, y1)."""
+    candidatos = np.zeros(1, dtype=np.int64)  # the root
+    for nivel in range(len(niveles) - 1, -1, -1):
+        orden, nodos = niveles[nivel]
+        candidatos = candidatos[_overlaps(nodos[candidatos], box)]
+        hijos = (candidatos[:, None] * node_size + np.arange(node_size)).ravel()
+        candidatos = orden[hijos[hijos < len(orden)]]
+    return candidatos[_overlaps(bounds[candidatos], box)]
+
+# --- Geometry ---
+def circle_polygon_area(cx: float, cy: float, r: float, a: np.ndarray, b: np.ndarray,
+                        edge_group: np.ndarray, n_groups: int) -> np.ndarray:
+    """Exact area of a disk intersected with each group of closed edges a -> b.
+
+    Sums, per edge, the signed area of disk ∩ triangle(center, a, b): straight parts inside
+    the circle count as triangles and parts outside as circular sectors.
+    """
+    if r <= 0 or len(a) == 0:
+        return np.zeros(n_groups)
+    p = a - (cx, cy)
+    q = b - (cx, cy)
+    d = q - p
+    dd = np.einsum('ij,ij->i', d, d)
+    pd = np.einsum('ij,ij->i', p, d)
+    pp = np.einsum('ij,ij->i', p, p)
+    disc = pd ** 2 - dd * (pp - r * r)
+    raiz = np.sqrt(np.maximum(disc, 0.0))
+    dd_seguro = np.where(dd > 0, dd, 1.0)
+    corta = (disc > 0) & (dd > 0)
+    t1 = np.where(corta, np.clip((-pd - raiz) / dd_seguro, 0.0, 1.0), 0.0)
+    t2 = np.where(corta, np.clip((-pd + raiz) / dd_seguro, 0.0, 1.0), 0.0)
+    u = p + t1[:, None] * d
+    v = p + t2[:, None] * d
+
+    def cruz(s, t):
+        return s[:, 0] * t[:, 1] - s[:, 1] * t[:, 0]
+
+    def punto(s, t):
+        return s[:, 0] * t[:, 0] + s[:, 1] * t[:, 1]
+
+    def sector(s, t):
+        return 0.5 * r * r * np.arctan2(cruz(s, t), punto(s, t))
+
+    area = sector(p, u) + 0.5 * cruz(u, v) + sector(v, q)
+    return np.bincount(edge_group, area, minlength=n_groups)
+
+# --- Engine ---
+def build_county_engine(table: dict, index: bool=True) -> dict:
+    """Table plus its STR tree (index=False scans every unit; kept for benchmarking the pruning)."""
+    return {
+        "table": table,
+        "tree": build_str_tree(table["bounds"]) if index else None,
+        "poblacion_total": int(table["poblacion"].sum()),
+    }
+
+def engine_nbytes(engine: dict) -> int:
+    """Bytes held by the engine's arrays."""
+    arrays = list(engine["table"].values())
+    for orden, nodos in engine["tree"] or []:
+        arrays += [orden, nodos]
+    return sum(a.nbytes for a in arrays if isinstance(a, np.ndarray))
+
+def nearby_units(engine: dict, ix: float, iy: float, radius: float) -> np.ndarray:
+    """Units whose bounding box meets the square around the disk of `radius`."""
+    table = engine["table"]
+    box = (ix - radius, iy - radius, ix + radius, iy + radius)
+    if engine["tree"] is None:
+        return np.flatnonzero(_overlaps(table["bounds"], box))
+    raiz = engine["tree"][-1][1][0]
+    if box[0] <= raiz[0] and box[1] <= raiz[1] and box[2] >= raiz[2] and box[3] >= raiz[3]:
+        return np.arange(len(table["bounds"]))  # the box covers the whole layer
+    return np.sort(query_str_tree(engine["tree"], table["bounds"], box))
+
+def _disk_area(table: dict, unidades: np.ndarray, ix: float, iy: float, r: float) -> np.ndarray:
+    """Area of each unit inside the disk; exact edge geometry only for boxes the circle crosses.
+
+    (why: a box with every corner inside lies in the disk, one with its nearest point outside misses it)
+    """
+    caja = table["bounds"][unidades]
+    lejos = np.hypot(np.maximum(ix - caja[:, 0], caja[:, 2] - ix), np.maximum(iy - caja[:, 1], caja[:, 3] - iy))
+    cerca = np.hypot(np.maximum(0, np.maximum(caja[:, 0] - ix, ix - caja[:, 2])),
+                     np.maximum(0, np.maximum(caja[:, 1] - iy, iy - caja[:, 3])))
+    area = np.where(lejos <= r, table["area"][unidades], 0.0)
+    borde = np.flatnonzero((lejos > r) & (cerca < r))
+    if len(borde):
+        cruzadas = unidades[borde]
+        inicio = table["edge_offsets"][cruzadas]
+        longitud = table["edge_offsets"][cruzadas + 1] - inicio
+        # Concatenated edge ranges of the crossed units (why: one vectorized pass over all their edges)
+        aristas = np.repeat(inicio - np.cumsum(longitud) + longitud, longitud) + np.arange(longitud.sum())
+        grupo = np.repeat(np.arange(len(cruzadas)), longitud)
+        a = table["vertices"][aristas]
+        b = table["vertices"][table["siguiente"][aristas]]
+        area[borde] = circle_polygon_area(ix, iy, r, a, b, grupo, len(cruzadas))
+    return area
+
+def county_overlap(engine: dict, ix: float, iy: float, r_total: float, r_partial: float) -> tuple:
+    """(units, total-disk area, partial-disk area) for the units near the impact."""
+    table = engine["table"]
+    unidades = nearby_units(engine, ix, iy, max(r_total, r_partial))
+    return (unidades, _disk_area(table, unidades, ix, iy, r_total),
+            _disk_area(table, unidades, ix, iy, r_partial))
+
+def county_affected(engine: dict, ix: float, iy: float, r_total: float, r_partial: float) -> tuple:
+    """(units, affected people per unit, total affected) with area-weighted damage factors.
+
+    Units outside the candidates are untouched and count FACTOR_OUTSIDE of their people.
+    """
+    table = engine["table"]
+    unidades, area_total, area_parcial = county_overlap(engine, ix, iy, r_total, r_partial)
+    area = np.where(table["area"][unidades] > 0, table["area"][unidades], 1.0)
+    f_total = np.clip(area_total / area, 0.0, 1.0)
+    f_parcial = np.clip(area_parcial / area, f_total, 1.0)
+    factor = FACTOR_TOTAL * f_total + FACTOR_PARTIAL * (f_parcial - f_total) + FACTOR_OUTSIDE * (1 - f_parcial)
+    afectada = (table["poblacion"][unidades] * factor).astype(np.int64)
+    resto = engine["poblacion_total"] - int(table["poblacion"][unidades].sum())
+    return unidades, afectada, int(afectada.sum()) + int(resto * FACTOR_OUTSIDE)
+
+def simulate_impact_counties(engine: dict, diameter: float, speed_kms: float, ix: float, iy: float,
+                             defenses: dict, entry: dict|None=None) -> dict:
+    """Same result layout as simulate_impact_china, one row per unit the blast reaches."""
+    batch = simulate_impact_batch(diameter, speed_kms, ix, iy, defense_mask(defenses), PROVINCE_TABLE, entry)
+    r_total = float(batch["radio_destruccion_total"][0])
+    r_partial = float(batch["radio_destruccion_parcial"][0])
+    table = engine["table"]
+    unidades, afectada, total = county_affected(engine, ix, iy, r_total, r_partial)
+
+    alcanzadas = afectada > (table["poblacion"][unidades] * FACTOR_OUTSIDE).astype(np.int64)
+    n, personas = unidades[alcanzadas], afectada[alcanzadas]
+    poblacion = table["poblacion"][n]
+    cuota = np.round(100 * personas / np.where(poblacion > 0, poblacion, 1), 1) * (poblacion > 0)
+    distancia = np.round(np.hypot(table["cx"][n] - ix, table["cy"][n] - iy), 2)
+    # Rows from plain lists (why: per-element numpy indexing dominated at tens of thousands of units)
+    provincias_afectadas = {
+        str(uid): {
+            'province': str(nombre),
+            'affected_population': p,
+            'impact_share_%': c,
+            'distance_to_impact': d,
+            'total_population': t,
+            'description': str(provincia),
+        }
+        for uid, nombre, p, c, d, t, provincia in zip(
+            table["ids"][n].tolist(), table["nombres"][n].tolist(), personas.tolist(), cuota.tolist(),
+            distancia.tolist(), poblacion.tolist(), table["provincias"][n].tolist())
+    }
+    fuera = engine["poblacion_total"] - int(poblacion.sum())
+    provincias_afectadas[REST_ID] = {
+        'province': REST_NAME,
+        'affected_population': total - sum(p['affected_population'] for p in provincias_afectadas.values()),
+        'impact_share_%': round(100 * FACTOR_OUTSIDE, 1),
+        'distance_to_impact': float('nan'),
+        'total_population': fuera,
+        'description': REST_DESCRIPTION,
+    }
+
+    return {
+        "energia_megatones": float(batch["energia_megatones"][0]),
+        "energia_final": float(batch["energia_final"][0]),
+        "energia_mitigada": float(batch["energia_mitigada"][0]),
+        "reduccion": float(batch["reduccion"][0]),
+        "radio_destruccion_total": r_total,
+        "radio_destruccion_parcial": r_partial,
+        "poblacion_total_afectada": total,
+        "provincias_afectadas": provincias_afectadas,
+        "punto_impacto": (ix, iy),
+        "entrada": entry_summary(batch, entry),
+    }
+
+# --- Synthetic layer ---
+def synthetic_counties(n_units: int, seed: int=0, edge_points: int=8) -> dict:
+    """FeatureCollection of about `n_units` wiggly quadrilaterals tiling the map, peopled from the density raster.
+
+    (why: no county file ships with the app; benchmarks need realistic vertex counts at any size)
+    """
+    from density_model import DENSITY_EXTENT, load_density
+
+    x0, x1, y0, y1 = DENSITY_EXTENT
+    nx = max(1, round(np.sqrt(n_units * (x1 - x0) / (y1 - y0))))
+    ny = max(1, round(n_units / nx))
+    rng = np.random.default_rng(seed)
+    dx, dy = (x1 - x0) / nx, (y1 - y0) / ny
+
+    # Corners jittered inside their cell; the outer border stays straight
+    esquinas = np.stack(np.meshgrid(x0 + dx * np.arange(nx + 1), y0 + dy * np.arange(ny + 1), indexing='ij'), axis=-1)
+    esquinas[1:-1, :, 0] += rng.uniform(-0.25, 0.25, (nx - 1, ny + 1)) * dx
+    esquinas[:, 1:-1, 1] += rng.uniform(-0.25, 0.25, (nx + 1, ny - 1)) * dy
+
+    # Shared edges with `edge_points` inner points bent sideways, tapering to the corners
+    t = np.arange(1, edge_points + 1) / (edge_points + 1)
+    curva = np.sin(np.pi * t)
+
+    def aristas(a: np.ndarray, b: np.ndarray, borde: np.ndarray, escala: float) -> np.ndarray:
+        puntos = a[..., None, :] + (b - a)[..., None, :] * t[:, None]
+        normal = (b - a)[..., ::-1] * (1, -1)
+        normal = normal / np.linalg.norm(normal, axis=-1, keepdims=True)
+        desvio = rng.uniform(-0.12, 0.12, a.shape[:-1] + (1,)) * escala * ~borde[..., None]
+        return puntos + (desvio * curva)[..., None] * normal[..., None, :]
+
+    horizontales = aristas(esquinas[:-1, :], esquinas[1:, :],
+                           np.zeros((nx, ny + 1), bool) | (np.arange(ny + 1) % ny == 0), dy)
+    verticales = aristas(esquinas[:, :-1], esquinas[:, 1:],
+                         np.zeros((nx + 1, ny), bool) | (np.arange(nx + 1) % nx == 0)[:, None], dx)
+
+    densidad = np.asarray(load_density())
+    celda = ((x1 - x0) / densidad.shape[1]) * ((y1 - y0) / densidad.shape[0])
+    anillos, pesos = [], []
+    for i in range(nx):
+        for j in range(ny):
+            anillo = np.concatenate([
+                esquinas[i, j][None], horizontales[i, j],
+                esquinas[i + 1, j][None], verticales[i + 1, j],
+                esquinas[i + 1, j + 1][None], horizontales[i, j + 1][::-1],
+                esquinas[i, j + 1][None], verticales[i, j][::-1],
+            ])
+            cx, cy = anillo.mean(axis=0)
+            fila = min(int((y1 - cy) / (y1 - y0) * densidad.shape[0]), densidad.shape[0] - 1)
+            columna = min(int((cx - x0) / (x1 - x0) * densidad.shape[1]), densidad.shape[1] - 1)
+            anillos.append(anillo)
+            pesos.append(densidad[fila, columna] * abs(_signed_area(anillo)) / celda)
+    pesos = np.array(pesos) + 1.0  # nobody-lands still get a few people
+    poblacion = np.round(pesos * (densidad.sum() / pesos.sum())).astype(np.int64)
+
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature",
+         "properties": {"id": f"u{n}", "name": f"County {n}", "province": f"Region {n // 100}",
+                        "population": int(poblacion[n])},
+         "geometry": {"type": "Polygon",
+                      "coordinates": [np.round(np.vstack([anillo, anillo[:1]]), 5).tolist()]}}
+        for n, anillo in enumerate(anillos)]}
+
+def main(argv: list|None=None) -> int:
+    parser = argparse.ArgumentParser(description="County polygon layer tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    synth = sub.add_parser("synth", help="write a synthetic county layer")
+    synth.add_argument("output", help="GeoJSON file to write")
+    synth.add_argument("--units", type=int, default=3000, help="approximate number of units")
+    synth.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    capa = synthetic_counties(args.units, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(capa, f)
+    print(f"{len(capa['features']):,} units -> {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
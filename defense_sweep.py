@@ -0,0 +1,55 @@
+# defense_sweep.py
+"""All 16 defense combinations over a diameter x speed grid, in one vectorized model pass.
+
+Combinations are rows of a (16, 4) mask in DEFENSE_NAMES order. The minimum defense set for a
+casualty limit is the one with the fewest defenses, ties going to the larger reduction.
+"""
+import itertools
+
+import numpy as np
+
+from impact_model import DEFENSE_NAMES, PROVINCE_TABLE, defense_reduction, simulate_impact_batch
+
+DIAMETER_GRID = np.arange(100, 5001, 100)  # meters, the sidebar slider's range
+SPEED_GRID = np.arange(10, 101, 5)  # km/s
+DEFENSE_COMBINATIONS = np.array(list(itertools.product((False, True), repeat=len(DEFENSE_NAMES))))
+
+# Combination indices from cheapest to strongest: fewer defenses first, then larger reduction
+_ORDER = np.lexsort((-defense_reduction(DEFENSE_COMBINATIONS), DEFENSE_COMBINATIONS.sum(axis=1)))
+
+def combination_label(n: int) -> str:
+    """'Laser + Tractor' style name of combination n ('None' when empty)."""
+    nombres = [name.capitalize() for name, on in zip(DEFENSE_NAMES, DEFENSE_COMBINATIONS[n]) if on]
+    return " + ".join(nombres) or "None"
+
+def sweep_defenses(ix: float, iy: float, diameters=DIAMETER_GRID, speeds=SPEED_GRID,
+                   table: dict=PROVINCE_TABLE) -> dict:
+    """(combinations, diameters, speeds) arrays of affected people and residual energy (MT)."""
+    diameters = np.atleast_1d(np.asarray(diameters, dtype=np.float64))
+    speeds = np.atleast_1d(np.asarray(speeds, dtype=np.float64))
+    c, d, s = np.meshgrid(np.arange(len(DEFENSE_COMBINATIONS)), diameters, speeds, indexing='ij')
+    batch = simulate_impact_batch(d.ravel(), s.ravel(), ix, iy, DEFENSE_COMBINATIONS[c.ravel()], table)
+    return {
+        "diameters": diameters,
+        "speeds": speeds,
+        "affected": batch["poblacion_total_afectada"].reshape(c.shape),
+        "residual_energy": batch["energia_final"].reshape(c.shape),
+        "reduction": defense_reduction(DEFENSE_COMBINATIONS) * 100,
+        "n_defenses": DEFENSE_COMBINATIONS.sum(axis=1),
+    }
+
+def minimum_defenses(sweep: dict, max_affected: float) -> np.ndarray:
+    """(diameters, speeds) index of the minimum combination keeping affected below `max_affected`.
+
+    -1 where even every defense together is not enough.
+    """
+    suficiente = sweep["affected"][_ORDER] < max_affected
+    primera = _ORDER[np.argmax(suficiente, axis=0)]
+    return np.where(suficiente.any(axis=0), primera, -1)
+
+def pareto_front(n_defenses: np.ndarray, residual_energy: np.ndarray) -> np.ndarray:
+    """Mask of combinations no other beats on both defense count and residual energy."""
+    menos = n_defenses[None, :] <= n_defenses[:, None]
+    menor = residual_energy[None, :] <= residual_energy[:, None]
+    estricto = (n_defenses[None, :] < n_defenses[:, None]) | (residual_energy[None, :] < residual_energy[:, None])
+    return ~(menos & menor & estricto).any(axis=1)
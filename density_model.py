@@ -0,0 +1,189 @@
+# density_model.py
+"""Raster population engine driven by mapa_densidad.png.
+
+The density map is decoded once into people per cell, cached as .npy next to the app and
+memory-mapped on later loads. Disk sums use per-row prefix sums (one integral image per
+province label), so a query costs O(rows crossed by the disk) at any raster resolution.
+"""
+import hashlib
+import os
+
+import numpy as np
+from PIL import Image
+
+from impact_model import (FACTOR_OUTSIDE, FACTOR_PARTIAL, FACTOR_TOTAL, PROVINCE_TABLE,
+                          defense_mask, entry_summary, simulate_impact_batch)
+from map_style import MAP_EXTENT
+
+DENSITY_FILE = "mapa_densidad.png"
+CACHE_DIR = ".cache"
+
+DENSITY_EXTENT = MAP_EXTENT  # the density map is drawn over the China base map
+
+# Legend ramp of the density map, low to high (why: the PNG stores colors, not values)
+DENSITY_RAMP = np.array([
+    [255, 255, 117],
+    [146, 240, 67],
+    [61, 209, 59],
+    [47, 161, 144],
+    [22, 48, 133],
+], dtype=np.float64)
+RAMP_MAX_DISTANCE = 60.0  # colors further than this from the ramp (white sea, labels) hold nobody
+DENSITY_DECADES = 3.0  # the ramp spans 1 to 1000 relative density on a log scale
+CHINA_POPULATION = 1_411_778_724  # 2020 census; the raster is scaled to sum to this
+DECODER_VERSION = 1  # bump when the decoding above changes (invalidates cached .npy files)
+
+# Result row for cells outside every province rectangle
+REST_ID = 'resto'
+REST_NAME = 'Rest of China'
+REST_DESCRIPTION = 'Cells outside the ten modeled provinces'
+
+def _ramp_samples(n: int=256) -> np.ndarray:
+    t = np.linspace(0, len(DENSITY_RAMP) - 1, n)
+    lo = np.floor(t).astype(int).clip(max=len(DENSITY_RAMP) - 2)
+    frac = (t - lo)[:, None]
+    return DENSITY_RAMP[lo] * (1 - frac) + DENSITY_RAMP[lo + 1] * frac
+
+def decode_density(rgb: np.ndarray) -> np.ndarray:
+    """Map ramp colors to people per cell, scaled to CHINA_POPULATION."""
+    samples = _ramp_samples()
+    colors, inverse = np.unique(rgb.reshape(-1, 3), axis=0, return_inverse=True)
+    dist = np.linalg.norm(colors[:, None, :].astype(np.float64) - samples[None, :, :], axis=2)
+    nearest = dist.argmin(axis=1)
+    level = np.where(dist[np.arange(len(colors)), nearest] <= RAMP_MAX_DISTANCE,
+                     10 ** (DENSITY_DECADES * nearest / (len(samples) - 1)), 0.0)
+    density = level[inverse.ravel()].reshape(rgb.shape[:2])
+    return density * (CHINA_POPULATION / density.sum())
+
+def load_density(path: str=DENSITY_FILE, cache_dir: str=CACHE_DIR) -> np.ndarray:
+    """Calibrated density raster, memory-mapped from a cache keyed by the source file hash."""
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+    cache_file = os.path.join(cache_dir, f"densidad_{digest}_v{DECODER_VERSION}.npy")
+    if not os.path.exists(cache_file):
+        rgb = np.asarray(Image.open(path).convert('RGB'))
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{cache_file}.{os.getpid()}.tmp.npy"
+        np.save(tmp, decode_density(rgb))
+        os.replace(tmp, cache_file)  # atomic (why: concurrent sessions may build at once)
+    return np.load(cache_file, mmap_mode='r')
+
+def data_version(path: str=DENSITY_FILE, table: dict=PROVINCE_TABLE) -> str:
+    """Tag of what density results depend on: raster content, decoder and province table."""
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+    return f"{digest}:v{DECODER_VERSION}:{table['version']}"
+
+def downsample(density: np.ndarray, factor: int) -> np.ndarray:
+    """Sum-pool by an integer factor; edges are zero-padded so totals are preserved."""
+    if factor == 1:
+        return np.asarray(density)
+    h, w = density.shape
+    padded = np.zeros((-(-h // factor) * factor, -(-w // factor) * factor))
+    padded[:h, :w] = density
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).sum(axis=(1, 3))
+
+def province_labels(shape: tuple, cell: tuple, table: dict=PROVINCE_TABLE) -> np.ndarray:
+    """Province index per cell (len(ids) = outside every province).
+
+    Rectangles overlap, so a cell inside several goes to the one with the nearest centroid.
+    """
+    dx, dy = cell
+    xc = DENSITY_EXTENT[0] + (np.arange(shape[1]) + 0.5) * dx
+    yc = DENSITY_EXTENT[3] - (np.arange(shape[0]) + 0.5) * dy
+    x, y = np.meshgrid(xc, yc)
+    b = table["bounds"]
+    inside = ((x[..., None] >= b[:, 0]) & (x[..., None] <= b[:, 1]) &
+              (y[..., None] >= b[:, 2]) & (y[..., None] <= b[:, 3]))
+    dist = (x[..., None] - table["cx"]) ** 2 + (y[..., None] - table["cy"]) ** 2
+    labels = np.where(inside, dist, np.inf).argmin(axis=-1)
+    return np.where(inside.any(axis=-1), labels, len(table["ids"]))
+
+def build_density_engine(density: np.ndarray, factor: int=1, table: dict=PROVINCE_TABLE) -> dict:
+    """Row prefix sums per province label at 1/factor of the raster resolution."""
+    grid = downsample(density, factor)
+    h, w = grid.shape
+    # Cell size from the native raster (why: padding adds cells, it doesn't stretch them)
+    cell = ((DENSITY_EXTENT[1] - DENSITY_EXTENT[0]) / density.shape[1] * factor,
+            (DENSITY_EXTENT[3] - DENSITY_EXTENT[2]) / density.shape[0] * factor)
+    labels = province_labels(grid.shape, cell, table)
+    n_labels = len(table["ids"]) + 1
+
+    row_sat = np.zeros((n_labels, h, w + 1))
+    for p in range(n_labels):
+        np.cumsum(np.where(labels == p, grid, 0.0), axis=1, out=row_sat[p, :, 1:])
+    row_sat.flags.writeable = False
+    return {
+        "table": table,
+        "factor": factor,
+        "shape": grid.shape,
+        "cell": cell,
+        "y_centers": DENSITY_EXTENT[3] - (np.arange(h) + 0.5) * cell[1],
+        "row_sat": row_sat,
+        "poblacion": row_sat[:, :, -1].sum(axis=1),  # people per label
+    }
+
+def disk_population(engine: dict, ix, iy, radius) -> np.ndarray:
+    """(M, labels) people inside disks of `radius` (map units) around (ix, iy)."""
+    ix, iy, radius = (np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in np.broadcast_arrays(ix, iy, radius))
+    dx, _ = engine["cell"]
+    h, w = engine["shape"]
+
+    # Only rows some disk in the batch can reach (why: small disks touch a few rows)
+    dy_cell = engine["cell"][1]
+    top = int(np.clip(np.floor((DENSITY_EXTENT[3] - (iy + radius).max()) / dy_cell), 0, h))
+    bottom = int(np.clip(np.ceil((DENSITY_EXTENT[3] - (iy - radius).min()) / dy_cell) + 1, top, h))
+
+    dy = engine["y_centers"][None, top:bottom] - iy[:, None]
+    crosses = np.abs(dy) <= radius[:, None]
+    half = np.sqrt(np.maximum(radius[:, None] ** 2 - dy ** 2, 0.0))
+    # Columns whose centers fall inside [ix - half, ix + half], as a half-open span
+    c0 = np.clip(np.ceil((ix[:, None] - half - DENSITY_EXTENT[0]) / dx - 0.5), 0, w).astype(np.intp)
+    c1 = np.clip(np.floor((ix[:, None] + half - DENSITY_EXTENT[0]) / dx - 0.5) + 1, 0, w).astype(np.intp)
+    c1 = np.maximum(c1, c0)
+
+    rows = np.arange(top, bottom)[None, :]
+    sat = engine["row_sat"]
+    spans = sat[:, rows, c1] - sat[:, rows, c0]
+    return np.where(crosses[None], spans, 0.0).sum(axis=2).T
+
+def density_affected_batch(engine: dict, r_total, r_partial, ix, iy) -> np.ndarray:
+    """(M, labels) affected people using the centroid model's zone factors per cell."""
+    total = disk_population(engine, ix, iy, r_total)
+    partial = disk_population(engine, ix, iy, r_partial)
+    return (FACTOR_TOTAL * total + FACTOR_PARTIAL * (partial - total) +
+            FACTOR_OUTSIDE * (engine["poblacion"][None, :] - partial))
+
+def simulate_impact_density(engine: dict, diameter: float, speed_kms: float, ix: float, iy: float,
+                            defenses: dict, entry: dict|None=None) -> dict:
+    """Same result layout as simulate_impact_china, with populations summed from the raster."""
+    table = engine["table"]
+    batch = simulate_impact_batch(diameter, speed_kms, ix, iy, defense_mask(defenses), table, entry)
+    afectada = density_affected_batch(engine, batch["radio_destruccion_total"],
+                                      batch["radio_destruccion_parcial"], ix, iy)[0]
+
+    provincias_afectadas = {}
+    for j, provincia_id in enumerate(table["ids"] + (REST_ID,)):
+        poblacion = int(engine["poblacion"][j])
+        es_resto = provincia_id == REST_ID
+        provincias_afectadas[provincia_id] = {
+            'province': REST_NAME if es_resto else table["nombres"][j],
+            'affected_population': int(afectada[j]),
+            'impact_share_%': round(100 * afectada[j] / poblacion, 1) if poblacion else 0.0,
+            'distance_to_impact': float('nan') if es_resto else round(float(batch["distancia"][0, j]), 2),
+            'total_population': poblacion,
+            'description': REST_DESCRIPTION if es_resto else table["descripciones"][j],
+        }
+
+    return {
+        "energia_megatones": float(batch["energia_megatones"][0]),
+        "energia_final": float(batch["energia_final"][0]),
+        "energia_mitigada": float(batch["energia_mitigada"][0]),
+        "reduccion": float(batch["reduccion"][0]),
+        "radio_destruccion_total": float(batch["radio_destruccion_total"][0]),
+        "radio_destruccion_parcial": float(batch["radio_destruccion_parcial"][0]),
+        "poblacion_total_afectada": int(afectada.sum()),
+        "provincias_afectadas": provincias_afectadas,
+        "punto_impacto": (ix, iy),
+        "entrada": entry_summary(batch, entry),
+    }
@@ -0,0 +1,140 @@
+# ensemble.py
+"""Monte Carlo ensemble runs of the impact model, chunked across a process pool."""
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+import multiprocessing
+import os
+
+import numpy as np
+
+from impact_model import DEFENSE_NAMES, PROVINCE_TABLE, simulate_impact_batch
+
+DEFAULT_CHUNK_SIZE = 20000
+PERCENTILES = (5, 50, 95)
+
+def make_executor(workers: int|None=None) -> Executor|None:
+    """Process pool for ensemble chunks, or None to run in-process on a single core."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        return None
+    # spawn, not fork (why: forking a threaded Streamlit server can deadlock the child)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def sample_inputs(rng: np.random.Generator, n: int, config: dict) -> tuple:
+    """Draw n (diameter, speed, ix, iy) samples.
+
+    Diameter and speed are uniform over their ranges; the impact point is Gaussian with an
+    error ellipse of std devs `sigma` = (major, minor) rotated by `angle_deg` around `impact`.
+    """
+    diameter = rng.uniform(*config["diameter_range"], size=n)
+    speed = rng.uniform(*config["speed_range"], size=n)
+
+    major, minor = config["sigma"]
+    theta = np.deg2rad(config.get("angle_deg", 0.0))
+    u = rng.standard_normal(n) * major
+    v = rng.standard_normal(n) * minor
+    ix = config["impact"][0] + u * np.cos(theta) - v * np.sin(theta)
+    iy = config["impact"][1] + u * np.sin(theta) + v * np.cos(theta)
+    return diameter, speed, ix, iy
+
+def _value_counts(values: np.ndarray) -> dict:
+    uniq, counts = np.unique(values, return_counts=True)
+    return dict(zip(uniq.tolist(), counts.tolist()))
+
+def run_chunk(config: dict, seed: np.random.SeedSequence, n: int) -> dict:
+    """Evaluate one chunk and reduce it to sparse value->count histograms (why: tiny IPC payload).
+
+    With config["entry"] = {"density": kg/m³} the chunk goes through the atmospheric entry
+    model in one batch, entry angles drawn from an isotropic flux after the other inputs.
+    """
+    rng = np.random.default_rng(seed)
+    diameter, speed, ix, iy = sample_inputs(rng, n, config)
+    mask = np.array([bool(config.get("defenses", {}).get(name)) for name in DEFENSE_NAMES])
+    entry = None
+    if config.get("entry"):
+        from entry_model import isotropic_angles, simulate_entry_batch
+        entry = simulate_entry_batch(diameter, speed, isotropic_angles(rng, n), config["entry"]["density"])
+    batch = simulate_impact_batch(diameter, speed, ix, iy, mask, PROVINCE_TABLE, entry)
+    afectada = batch["poblacion_afectada"]
+    return {
+        "n": n,
+        "provincias": [_value_counts(afectada[:, j]) for j in range(afectada.shape[1])],
+        "total": _value_counts(batch["poblacion_total_afectada"]),
+        "airbursts": int(entry["airburst"].sum()) if entry is not None else 0,
+    }
+
+def _merge_counts(acc: dict, counts: dict):
+    for value, count in counts.items():
+        acc[value] = acc.get(value, 0) + count
+
+def _percentile(counts: dict, q: float) -> int:
+    """Inverted-CDF percentile of a sparse histogram."""
+    values = np.array(sorted(counts))
+    cum = np.cumsum([counts[v] for v in values])
+    return int(values[np.searchsorted(cum, q / 100 * cum[-1])])
+
+def summarize(acc: dict, percentiles: tuple=PERCENTILES) -> dict:
+    """Percentile bands per province and the exceedance curve of total affected population."""
+    table = PROVINCE_TABLE
+    provincias = {}
+    for j, provincia_id in enumerate(table["ids"]):
+        counts = acc["provincias"][j]
+        n = sum(counts.values())
+        provincias[provincia_id] = {
+            'province': table["nombres"][j],
+            'mean': sum(v * c for v, c in counts.items()) / n,
+            **{f'p{q}': _percentile(counts, q) for q in percentiles},
+        }
+
+    values = np.array(sorted(acc["total"]), dtype=np.int64)
+    counts = np.array([acc["total"][v] for v in values], dtype=np.int64)
+    # P(total >= value): reverse cumulative count over all samples
+    exceed = np.cumsum(counts[::-1])[::-1] / acc["n"]
+    return {
+        "n": acc["n"],
+        "provincias": provincias,
+        "exceedance": {"poblacion": values, "probabilidad": exceed},
+        "airburst_fraction": acc["airbursts"] / acc["n"],
+    }
+
+def exceedance_probability(summary: dict, threshold: float) -> float:
+    """P(total affected population >= threshold) from a summary."""
+    curve = summary["exceedance"]
+    idx = np.searchsorted(curve["poblacion"], threshold)
+    return float(curve["probabilidad"][idx]) if idx < len(curve["poblacion"]) else 0.0
+
+def run_ensemble(config: dict, n_samples: int, seed: int=0, chunk_size: int=DEFAULT_CHUNK_SIZE,
+                 executor: Executor|None=None):
+    """Yield an updated summary after each finished chunk.
+
+    Chunk i always draws from SeedSequence(seed).spawn(...)[i] and chunks merge by counting,
+    so the final summary depends only on (config, n_samples, seed, chunk_size), not on the
+    number of workers or the order chunks finish in.
+    """
+    sizes = [chunk_size] * (n_samples // chunk_size)
+    if n_samples % chunk_size:
+        sizes.append(n_samples % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    acc = {"n": 0, "provincias": [{} for _ in PROVINCE_TABLE["ids"]], "total": {}, "airbursts": 0}
+
+    def merge(part: dict):
+        acc["n"] += part["n"]
+        acc["airbursts"] += part["airbursts"]
+        for j, counts in enumerate(part["provincias"]):
+            _merge_counts(acc["provincias"][j], counts)
+        _merge_counts(acc["total"], part["total"])
+
+    if executor is None:
+        for s, size in zip(seeds, sizes):
+            merge(run_chunk(config, s, size))
+            yield summarize(acc)
+        return
+
+    futures = [executor.submit(run_chunk, config, s, size) for s, size in zip(seeds, sizes)]
+    try:
+        for future in as_completed(futures):
+            merge(future.result())
+            yield summarize(acc)
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,149 @@
+# entry_model.py
+"""Atmospheric entry: deceleration, ablation and pancake fragmentation of a batch of meteors.
+
+Every meteor is integrated in one scipy solve_ivp call with altitude, not time, as the
+independent variable, so the whole batch shares one integration domain (ENTRY_ALTITUDE down to
+the ground). A meteor breaks up once the ram pressure exceeds its strength, spreads as a pancake
+(Chyba et al. 1993) and airbursts when it has spread PANCAKE_FACTOR times its initial radius
+(Collins et al. 2005); otherwise it reaches the ground. Importing this module imports scipy.
+"""
+import numpy as np
+from scipy.integrate import solve_ivp
+
+# --- Constants ---
+ENTRY_ALTITUDE = 100e3  # m, where integration starts
+SCALE_HEIGHT = 8e3  # m, exponential atmosphere
+SURFACE_DENSITY = 1.225  # kg/m³, air at sea level
+EARTH_RADIUS = 6371e3  # m
+GRAVITY = 9.81  # m/s²
+DRAG_COEFF = 2.0
+ABLATION_COEFF = 1.4e-8  # s²/m², σ = C_H / (Q C_D)
+PANCAKE_FACTOR = 7.0  # radius growth at which the fragments count as dispersed (airburst)
+MIN_SPEED = 300.0  # m/s; slower bodies have deposited their energy and fall at terminal speed
+MIN_MASS = 1e-3  # fraction of the initial mass below which the body counts as ablated away
+MIN_SIN_ANGLE = np.sin(np.deg2rad(2.0))  # (why: altitude stops being monotonic in a grazing pass)
+RTOL, ATOL = 1e-3, 1e-5  # on the normalized state
+JOULES_PER_MEGATON = 4.184e15
+
+# Blast radii scale with the cube root of the energy. Map radii are calibrated on the simple
+# model (20 map units for a 1 km meteor of its mass at 20 km/s reaching the ground); the real
+# sizes, which set how high a burst still reaches the ground, are ~5 and ~1 psi overpressure.
+_REFERENCE_MT = 0.5 * 800 * 1000.0 ** 3 * 20e3 ** 2 / JOULES_PER_MEGATON
+BLAST_RADIUS_SCALE = 20 / _REFERENCE_MT ** (1 / 3)  # map units per MT^(1/3)
+BLAST_TOTAL_KM = 7.0  # km per MT^(1/3)
+PARTIAL_RADIUS_FACTOR = 3  # partial destruction radius over total, as in the simple model
+
+def strength(density):
+    """Yield strength (Pa) from bulk density (Collins et al. 2005, eq. 10)."""
+    return 10 ** (2.107 + 0.0624 * np.sqrt(density))
+
+def air_density(z):
+    return SURFACE_DENSITY * np.exp(-z / SCALE_HEIGHT)
+
+def isotropic_angles(rng: np.random.Generator, n: int) -> np.ndarray:
+    """Entry angles (degrees above the horizon) of an isotropic flux: P(θ) ∝ sin 2θ, mode 45°."""
+    return np.rad2deg(np.arcsin(np.sqrt(rng.uniform(0.0, 1.0, n))))
+
+def blast_radii(energy_mt, altitude_km) -> tuple:
+    """(total, partial) destruction radii on the ground, in map units, of blasts at an altitude.
+
+    A burst reaches less far along the ground the higher it is, and not at all once it is
+    higher than the blast's own radius.
+    """
+    escala = np.cbrt(np.maximum(energy_mt, 0.0))
+    radios = []
+    for factor in (1, PARTIAL_RADIUS_FACTOR):
+        alcance = BLAST_TOTAL_KM * factor * escala
+        suelo = np.sqrt(np.clip(1 - (altitude_km / np.maximum(alcance, 1e-9)) ** 2, 0.0, 1.0))
+        radios.append(BLAST_RADIUS_SCALE * factor * escala * suelo)
+    return tuple(radios)
+
+# --- Integration ---
+def _smoothstep(x):
+    """0 below 0, 1 above 1, C1 in between."""
+    x = np.clip(x, 0.0, 1.0)
+    return x * x * (3 - 2 * x)
+
+def _derivatives(z: float, y: np.ndarray, arrastre: np.ndarray, ablacion: np.ndarray, v0: np.ndarray,
+                 expansion: np.ndarray, resistencia: np.ndarray) -> np.ndarray:
+    """d/dz of the (6, M) state v/v0, m/m0, sin θ, r/r0, d(r/r0)/dt and the altitude while active.
+
+    Every switch is continuous (why: a jump in any meteor's derivatives makes the shared step
+    size collapse for the whole batch): fragments spread with the ram pressure in excess of the
+    strength, and a meteor that is dispersed, halted or ablated away freezes over a short taper,
+    keeping its state (and the altitude it froze at) down to the ground.
+    """
+    v_rel, m_rel, seno, r_rel, u_rel, _ = y.reshape(6, -1)
+    # Physics on the state clamped to where it is valid (why: a step may overshoot a taper)
+    v = np.maximum(v_rel * v0, MIN_SPEED / 2)
+    m_rel = np.maximum(m_rel, MIN_MASS / 2)
+    r_rel = np.clip(r_rel, 1e-3, PANCAKE_FACTOR + 0.5)
+    presion = air_density(z) * v * v
+    carga = presion * r_rel * r_rel / m_rel  # ram pressure times area over mass, in initial units
+    sin_t = np.clip(seno, MIN_SIN_ANGLE, 1.0)  # sin θ as state (why: no trigonometry per step)
+    exceso = presion - resistencia
+    exceso = 0.5 * (exceso + np.sqrt(exceso * exceso + (0.1 * resistencia) ** 2))  # soft max(., 0)
+
+    # 1 while active, 0 once dispersed (r >= PANCAKE_FACTOR + 1/2), halted (v <= MIN_SPEED / 2)
+    # or ablated away (m <= MIN_MASS)
+    activo = (_smoothstep((PANCAKE_FACTOR + 0.5 - r_rel) * 2) * _smoothstep(v / (MIN_SPEED / 2) - 1)
+              * _smoothstep(m_rel / MIN_MASS - 1))
+    por_altura = -activo / (v * sin_t)  # dt/dz
+
+    dm = -ablacion * carga * m_rel * v
+    d = np.empty((6, len(v)))
+    d[0] = (GRAVITY * sin_t / v0 - arrastre * carga) * por_altura
+    d[1] = dm * por_altura
+    d[2] = (1 - sin_t * sin_t) * (GRAVITY / v - v / (EARTH_RADIUS + z)) * por_altura  # cos θ dθ/dt
+    d[3] = (u_rel + r_rel * dm / (3 * m_rel)) * por_altura  # ablation shrinks what is left
+    d[4] = expansion * exceso / r_rel * por_altura
+    d[5] = activo
+    return d.ravel()
+
+def simulate_entry_batch(diameter, speed_kms, angle_deg, density) -> dict:
+    """Vectorized entry of M meteors; scalar or (M,) inputs broadcast together.
+
+    Returns (M,) arrays: whether each airbursts, the burst altitude (km, 0 on the ground), the
+    speed and mass fraction left there, the initial, ground and blast energies in megatons, and
+    the blast radii (before defenses) that simulate_impact_batch draws with.
+    """
+    diameter, speed_kms, angle_deg, density = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (diameter, speed_kms, angle_deg, density)))
+    radio = diameter / 2
+    area = np.pi * radio ** 2
+    masa = density * np.pi / 6 * diameter ** 3
+    v0 = speed_kms * 1000
+    unos = np.ones_like(radio)
+    y0 = np.concatenate([unos, unos, np.sin(np.deg2rad(angle_deg)), unos, np.zeros_like(radio),
+                         np.full_like(radio, ENTRY_ALTITUDE)])
+    constantes = (0.5 * DRAG_COEFF * area / (masa * v0), 0.5 * ABLATION_COEFF * DRAG_COEFF * area / masa,
+                  v0, 0.5 * DRAG_COEFF / (density * radio ** 2), strength(density))
+
+    # Only the final state is kept (why: frozen meteors carry their burst state to the ground)
+    sol = solve_ivp(_derivatives, (ENTRY_ALTITUDE, 0.0), y0, t_eval=[0.0], rtol=RTOL, atol=ATOL,
+                    args=constantes)
+    if not sol.success:
+        raise RuntimeError(f"entry integration failed: {sol.message}")
+    v_rel, m_rel, _, r_rel, _, altitud = sol.y[:, -1].reshape(6, -1)
+
+    airburst = (r_rel >= PANCAKE_FACTOR) | (v_rel * v0 <= MIN_SPEED) | (m_rel <= 2 * MIN_MASS)
+    v_fin = v_rel * v0
+    m_fin = np.maximum(m_rel, 0.0) * masa
+    energia = 0.5 * masa * v0 ** 2 / JOULES_PER_MEGATON
+    energia_final = 0.5 * m_fin * v_fin ** 2 / JOULES_PER_MEGATON
+    # Airbursts release what they deposited; ground impacts what they still carry
+    explosion = np.where(airburst, energia - energia_final, energia_final)
+    altitud_km = np.where(airburst, np.maximum(altitud, 0.0) / 1000, 0.0)
+    r_total, r_partial = blast_radii(explosion, altitud_km)
+    return {
+        "airburst": airburst,
+        "altitud_km": altitud_km,
+        "velocidad_final": v_fin / 1000,
+        "masa_final": m_fin / masa,
+        "energia_megatones": energia,
+        "energia_suelo": np.where(airburst, 0.0, energia_final),
+        "energia_explosion": explosion,
+        "radio_total": r_total,
+        "radio_parcial": r_partial,
+        "evaluaciones": sol.nfev,
+    }
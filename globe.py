@@ -0,0 +1,236 @@
+# globe.py
+"""3D globe view: the Earth.stl mesh colored from earth_texture.jpg at several levels of detail.
+
+Levels are built once per (mesh, texture) content hash and cached in .cache as one .npz, so
+later processes load them in milliseconds instead of re-parsing and re-meshing. The finest
+levels are the source mesh subdivided onto the sphere; the coarsest is vertex-clustered from it.
+Figures carry NumPy arrays, which plotly ships to the browser as compact binary blocks.
+"""
+import hashlib
+import os
+
+import numpy as np
+from PIL import Image
+
+from assets import image_at
+from impact_model import PROVINCE_TABLE
+
+GLOBE_MESH_FILE = "Earth.stl"
+GLOBE_TEXTURE_FILE = "earth_texture.jpg"
+CACHE_DIR = ".cache"
+LOD_VERSION = 2  # bump when the level building below changes (invalidates cached .npz files)
+
+LOD_SUBDIVISIONS = 2  # finest level: the source mesh subdivided this many times (x4 faces each)
+LOD_COARSE_FACTOR = 4  # the extra coarsest level has this many times fewer faces than the source
+PALETTE_COLORS = 64  # texture colors (why: a uint8 index per face instead of a color string)
+TEXTURE_SIZE = (1024, 512)  # texels used for face colors; ~3 per finest-level face edge
+
+MAX_EDGE_PX = 16.0  # a level fits the view when its mean edge spans at most this many pixels
+GLOBE_SCREEN_FRACTION = 0.4  # globe radius / view height at the default camera
+SURFACE_LIFT = 1.004  # overlays float just above the mesh so they are not z-fought
+CHINA_VIEW = (100.0, 32.0)  # (lon, lat) the camera starts over
+UI_REVISION = "globe"  # constant so rotation and zoom survive figure updates
+
+def _digest(*paths: str) -> str:
+    digest = hashlib.sha1(f"v{LOD_VERSION}:{LOD_SUBDIVISIONS}:{LOD_COARSE_FACTOR}:{PALETTE_COLORS}:{TEXTURE_SIZE}".encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+def _to_sphere(vertices: np.ndarray) -> np.ndarray:
+    return vertices / np.linalg.norm(vertices, axis=1, keepdims=True)
+
+def load_source_mesh(path: str=GLOBE_MESH_FILE) -> tuple:
+    """(vertices, faces) of the mesh, centered and scaled onto the unit sphere."""
+    import trimesh  # only needed on a cold build
+
+    mesh = trimesh.load(path, force='mesh')
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    return _to_sphere(vertices - mesh.bounds.mean(axis=0)), np.asarray(mesh.faces, dtype=np.int64)
+
+def cluster_decimate(vertices: np.ndarray, faces: np.ndarray, target_faces: int) -> tuple:
+    """Vertex-clustering decimation to about `target_faces`, re-projected onto the sphere."""
+    def cluster(cell: float) -> tuple:
+        keys = np.floor((vertices + 1) / cell).astype(np.int64)
+        _, label, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        label = label.ravel()
+        centros = np.zeros((len(counts), 3))
+        np.add.at(centros, label, vertices)
+        f = label[faces]
+        f = f[(f[:, 0] != f[:, 1]) & (f[:, 1] != f[:, 2]) & (f[:, 0] != f[:, 2])]
+        _, primeras = np.unique(np.sort(f, axis=1), axis=0, return_index=True)
+        return _to_sphere(centros / counts[:, None]), f[np.sort(primeras)]
+
+    low, high = 1e-4, 2.0  # cell sizes giving more / fewer faces than the target
+    for _ in range(30):
+        mid = (low * high) ** 0.5
+        if len(cluster(mid)[1]) > target_faces:
+            low = mid
+        else:
+            high = mid
+    v, f = cluster(high)
+    usados, f = np.unique(f, return_inverse=True)  # drop vertices no face references
+    return v[usados], f.reshape(-1, 3)
+
+def _lonlat(points: np.ndarray) -> tuple:
+    lon = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+    lat = np.degrees(np.arcsin(np.clip(points[:, 2], -1, 1)))
+    return lon, lat
+
+def texture_palette(path: str=GLOBE_TEXTURE_FILE) -> tuple:
+    """(H, W) palette indices and (P, 3) palette of the equirectangular texture at TEXTURE_SIZE."""
+    indexada = Image.fromarray(image_at(path, TEXTURE_SIZE)).convert('RGB').quantize(
+        PALETTE_COLORS, method=Image.Quantize.FASTOCTREE)  # median cut: ~30x slower, same look at 64 colors
+    paleta = np.array(indexada.getpalette()[:3 * PALETTE_COLORS], dtype=np.uint8).reshape(-1, 3)
+    return np.asarray(indexada), paleta
+
+def _face_colors(vertices: np.ndarray, faces: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    lon, lat = _lonlat(_to_sphere(vertices[faces].mean(axis=1)))
+    h, w = indices.shape
+    col = np.clip(((lon + 180) / 360 * w).astype(np.intp), 0, w - 1)
+    row = np.clip(((90 - lat) / 180 * h).astype(np.intp), 0, h - 1)
+    return indices[row, col].astype(np.uint8)
+
+def _mean_edge(vertices: np.ndarray, faces: np.ndarray) -> float:
+    tri = vertices[faces]
+    return float(np.linalg.norm(tri - np.roll(tri, 1, axis=1), axis=2).mean())
+
+def build_lods(mesh_path: str=GLOBE_MESH_FILE, texture_path: str=GLOBE_TEXTURE_FILE) -> dict:
+    """Levels of detail, finest first, each with compact vertex/face/color arrays."""
+    import trimesh.remesh
+
+    vertices, faces = load_source_mesh(mesh_path)
+    niveles = [(vertices, faces)]
+    for _ in range(LOD_SUBDIVISIONS):
+        v, f = trimesh.remesh.subdivide(*niveles[0])
+        niveles.insert(0, (_to_sphere(v), f))
+    niveles.append(cluster_decimate(vertices, faces, len(faces) // LOD_COARSE_FACTOR))
+
+    indices, paleta = texture_palette(texture_path)
+    lods = []
+    for v, f in niveles:
+        lods.append({
+            "vertices": v.astype(np.float32),
+            "faces": f.astype(np.uint16 if len(v) <= np.iinfo(np.uint16).max else np.uint32),
+            "colors": _face_colors(v, f, indices),
+            "edge": _mean_edge(v, f),
+        })
+    return {"lods": lods, "palette": paleta}
+
+def load_globe(mesh_path: str=GLOBE_MESH_FILE, texture_path: str=GLOBE_TEXTURE_FILE,
+               cache_dir: str=CACHE_DIR) -> dict:
+    """Levels of detail from the disk cache, building and saving them on the first call."""
+    cache_file = os.path.join(cache_dir, f"globo_{_digest(mesh_path, texture_path)}.npz")
+    if not os.path.exists(cache_file):
+        globo = build_lods(mesh_path, texture_path)
+        arrays = {"palette": globo["palette"]}
+        for n, lod in enumerate(globo["lods"]):
+            for key in ("vertices", "faces", "colors"):
+                arrays[f"lod{n}_{key}"] = lod[key]
+            arrays[f"lod{n}_edge"] = np.array(lod["edge"])
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{cache_file}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, cache_file)  # atomic (why: concurrent sessions may build at once)
+
+    with np.load(cache_file) as data:
+        n_lods = sum(1 for key in data.files if key.endswith("_edge"))
+        lods = [{"vertices": data[f"lod{n}_vertices"], "faces": data[f"lod{n}_faces"],
+                 "colors": data[f"lod{n}_colors"], "edge": float(data[f"lod{n}_edge"])}
+                for n in range(n_lods)]
+        return {"lods": lods, "palette": data["palette"]}
+
+def select_lod(globo: dict, view_px: int) -> int:
+    """Index of the lightest level whose edges stay under MAX_EDGE_PX at this view height."""
+    radio_px = view_px * GLOBE_SCREEN_FRACTION
+    for n in range(len(globo["lods"]) - 1, -1, -1):
+        if globo["lods"][n]["edge"] * radio_px <= MAX_EDGE_PX:
+            return n
+    return 0
+
+# --- Figure ---
+def lonlat_to_xyz(lon, lat, radius: float=1.0) -> np.ndarray:
+    lon, lat = np.radians(lon), np.radians(lat)
+    return radius * np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+def small_circle(lon: float, lat: float, radius_deg: float, n: int=96) -> np.ndarray:
+    """(n, 3) points at angular distance `radius_deg` around (lon, lat), lifted off the surface."""
+    centro = lonlat_to_xyz(lon, lat)
+    e1 = np.cross([0.0, 0.0, 1.0], centro)
+    e1 = e1 / np.linalg.norm(e1) if np.linalg.norm(e1) > 1e-9 else np.array([1.0, 0.0, 0.0])
+    e2 = np.cross(centro, e1)
+    r = np.radians(min(radius_deg, 180.0))
+    theta = np.linspace(0, 2 * np.pi, n)[:, None]
+    return SURFACE_LIFT * (np.cos(r) * centro + np.sin(r) * (np.cos(theta) * e1 + np.sin(theta) * e2))
+
+def _line_trace(points: np.ndarray, name: str, color: str, width: int=4, **extra) -> dict:
+    return {"type": "scatter3d", "mode": "lines", "name": name,
+            "x": points[:, 0], "y": points[:, 1], "z": points[:, 2],
+            "line": {"color": color, "width": width}, **extra}
+
+def _province_outlines(table: dict) -> dict:
+    """All province rectangles in one trace, separated by NaN breaks."""
+    partes = []
+    for x0, x1, y0, y1 in table["bounds"]:
+        lon = np.concatenate([np.linspace(x0, x1, 16), np.full(16, x1), np.linspace(x1, x0, 16), np.full(16, x0)])
+        lat = np.concatenate([np.full(16, y0), np.linspace(y0, y1, 16), np.full(16, y1), np.linspace(y1, y0, 16)])
+        partes += [lonlat_to_xyz(lon, lat, SURFACE_LIFT), np.full((1, 3), np.nan)]
+    return _line_trace(np.concatenate(partes).astype(np.float32), "Provinces", "white", width=2,
+                       opacity=0.7, hoverinfo="skip")
+
+def globe_figure(globo: dict, lod: int, result: dict|None=None, view_px: int=600,
+                 table: dict=PROVINCE_TABLE) -> dict:
+    """Globe mesh, province outlines and, for a result, the impact point and destruction radii."""
+    nivel = globo["lods"][lod]
+    paleta = globo["palette"]
+    n = len(paleta)
+    # Stepped colorscale so each palette index maps to exactly its own color
+    escala = []
+    for c, (r, g, b) in enumerate(paleta):
+        color = f"rgb({r},{g},{b})"
+        escala += [[c / n, color], [(c + 1) / n, color]]
+    vertices, faces = nivel["vertices"], nivel["faces"]
+    data = [{
+        "type": "mesh3d", "name": "Earth",
+        "x": vertices[:, 0], "y": vertices[:, 1], "z": vertices[:, 2],
+        "i": faces[:, 0], "j": faces[:, 1], "k": faces[:, 2],
+        "intensity": nivel["colors"], "intensitymode": "cell",
+        "colorscale": escala, "cmin": 0, "cmax": n, "showscale": False,
+        "lighting": {"ambient": 0.85, "diffuse": 0.3, "specular": 0.05},
+        "hoverinfo": "skip",
+    }, _province_outlines(table)]
+
+    if result is not None:
+        ix, iy = result["punto_impacto"]
+        for radio, nombre, color in ((result["radio_destruccion_parcial"], "Partial destruction", "orange"),
+                                     (result["radio_destruccion_total"], "Total destruction", "red")):
+            data.append(_line_trace(small_circle(ix, iy, radio), nombre, color,
+                                    hovertemplate=f"{nombre}: radius {radio:.2f}°<extra></extra>"))
+        trayectoria = np.stack([lonlat_to_xyz(ix, iy, 1.3), lonlat_to_xyz(ix, iy, SURFACE_LIFT)])
+        data.append(_line_trace(trayectoria, "Meteor Path", "red", width=5, hoverinfo="skip"))
+        punto = lonlat_to_xyz(ix, iy, SURFACE_LIFT)
+        data.append({"type": "scatter3d", "mode": "markers", "name": "Impact Point",
+                     "x": [punto[0]], "y": [punto[1]], "z": [punto[2]],
+                     "marker": {"size": 6, "color": "red", "symbol": "x"},
+                     "hovertemplate": (f"Impact ({ix}, {iy})<br>Total affected: "
+                                       f"{result['poblacion_total_afectada']:,}<extra></extra>")})
+
+    ojo = lonlat_to_xyz(*CHINA_VIEW, 1.9)
+    sin_ejes = {"visible": False, "showspikes": False}
+    return {
+        "data": data,
+        "layout": {
+            "height": view_px,
+            "margin": {"l": 0, "r": 0, "t": 0, "b": 0},
+            "paper_bgcolor": "#0b0f1a",
+            "showlegend": result is not None,
+            "legend": {"font": {"color": "white"}},
+            "uirevision": UI_REVISION,
+            "scene": {
+                "xaxis": sin_ejes, "yaxis": sin_ejes, "zaxis": sin_ejes,
+                "aspectmode": "data",
+                "camera": {"eye": {"x": ojo[0], "y": ojo[1], "z": ojo[2]}},
+            },
+        },
+    }
@@ -0,0 +1,225 @@
+# impact_model.py
+"""Impact model and province data, importable without Streamlit.
+
+Province data and PROVINCE_TABLE are shared by every session and frozen (shared_state.freeze).
+"""
+import hashlib
+
+import numpy as np
+
+from shared_state import freeze
+
+# --- Provinces population (thousands) ---
+poblacion_china = freeze({
+    'guangdong': {
+        'nombre': 'Guangdong',
+        'poblacion': 126012,  # thousands (126M)
+        'coordenadas': {'x_min': 80, 'x_max': 95, 'y_min': 15, 'y_max': 25},
+        'descripcion': 'Most populous province in China'
+    },
+    'shandong': {
+        'nombre': 'Shandong',
+        'poblacion': 101527,
+        'coordenadas': {'x_min': 90, 'x_max': 105, 'y_min': 20, 'y_max': 30},
+        'descripcion': 'Eastern coastal province'
+    },
+    'henan': {
+        'nombre': 'Henan',
+        'poblacion': 99365,
+        'coordenadas': {'x_min': 75, 'x_max': 90, 'y_min': 25, 'y_max': 35},
+        'descripcion': 'Heart of Central China'
+    },
+    'jiangsu': {
+        'nombre': 'Jiangsu',
+        'poblacion': 84748,
+        'coordenadas': {'x_min': 95, 'x_max': 110, 'y_min': 10, 'y_max': 20},
+        'descripcion': 'Developed economic zone'
+    },
+    'sichuan': {
+        'nombre': 'Sichuan',
+        'poblacion': 83675,
+        'coordenadas': {'x_min': 55, 'x_max': 75, 'y_min': 20, 'y_max': 35},
+        'descripcion': 'Southwestern province'
+    },
+    'hebei': {
+        'nombre': 'Hebei',
+        'poblacion': 75919,
+        'coordenadas': {'x_min': 80, 'x_max': 95, 'y_min': 10, 'y_max': 20},
+        'descripcion': 'Surrounds Beijing'
+    },
+    'hunan': {
+        'nombre': 'Hunan',
+        'poblacion': 69185,
+        'coordenadas': {'x_min': 70, 'x_max': 85, 'y_min': 20, 'y_max': 30},
+        'descripcion': 'Central province'
+    },
+    'anhui': {
+        'nombre': 'Anhui',
+        'poblacion': 63236,
+        'coordenadas': {'x_min': 90, 'x_max': 105, 'y_min': 10, 'y_max': 20},
+        'descripcion': 'Eastern China'
+    },
+    'hubei': {
+        'nombre': 'Hubei',
+        'poblacion': 59172,
+        'coordenadas': {'x_min': 75, 'x_max': 90, 'y_min': 20, 'y_max': 30},
+        'descripcion': 'Central China'
+    },
+    'zhejiang': {
+        'nombre': 'Zhejiang',
+        'poblacion': 58500,
+        'coordenadas': {'x_min': 100, 'x_max': 115, 'y_min': 30, 'y_max': 40},
+        'descripcion': 'Developed east coast'
+    }
+})
+
+# Defense systems in mask column order, with the reduction each one contributes
+DEFENSE_NAMES = ("laser", "nuclear", "tractor", "shield")
+DEFENSE_REDUCTION = (0.3, 0.4, 0.2, 0.1)
+MAX_REDUCTION = 0.95
+
+# Share of a province's population affected per damage zone (total, partial, outside)
+FACTOR_TOTAL = 0.8
+FACTOR_PARTIAL = 0.4
+FACTOR_OUTSIDE = 0.1
+
+def build_province_table(provincias: dict) -> dict:
+    """Columnar view of a province dict: ids/names plus NumPy arrays of bounds, centroids and population.
+
+    `version` hashes ids, bounds and population so caches can key on the data they were built from.
+    """
+    ids = tuple(provincias)
+    bounds = np.array([
+        [p['coordenadas']['x_min'], p['coordenadas']['x_max'],
+         p['coordenadas']['y_min'], p['coordenadas']['y_max']]
+        for p in provincias.values()
+    ], dtype=np.float64).reshape(len(ids), 4)
+    poblacion = np.array([int(p['poblacion'] * 1000) for p in provincias.values()], dtype=np.int64)
+    table = {
+        "ids": ids,
+        "nombres": tuple(p['nombre'] for p in provincias.values()),
+        "descripciones": tuple(p['descripcion'] for p in provincias.values()),
+        "bounds": bounds,
+        "cx": (bounds[:, 0] + bounds[:, 1]) / 2,
+        "cy": (bounds[:, 2] + bounds[:, 3]) / 2,
+        "poblacion": poblacion,  # people, not thousands
+    }
+    for key in ("bounds", "cx", "cy", "poblacion"):
+        table[key].flags.writeable = False
+    digest = hashlib.sha1(repr(ids).encode())
+    digest.update(bounds.tobytes())
+    digest.update(poblacion.tobytes())
+    table["version"] = digest.hexdigest()[:16]
+    return table
+
+PROVINCE_TABLE = freeze(build_province_table(poblacion_china))
+
+def defense_mask(defenses: dict) -> np.ndarray:
+    """Boolean row in DEFENSE_NAMES order from a {'laser': bool, ...} dict."""
+    return np.array([bool(defenses.get(name)) for name in DEFENSE_NAMES], dtype=bool)
+
+def defense_reduction(mask) -> np.ndarray:
+    """Capped reduction fraction for a (..., 4) defense mask."""
+    mask = np.asarray(mask, dtype=bool)
+    # Summed in the same order as the scalar model (why: identical float results at zone edges)
+    reduccion = np.zeros(mask.shape[:-1])
+    for col, amount in enumerate(DEFENSE_REDUCTION):
+        reduccion = reduccion + np.where(mask[..., col], amount, 0.0)
+    return np.minimum(reduccion, MAX_REDUCTION)
+
+def simulate_impact_batch(diameter, speed_kms, ix, iy, defenses=None, table: dict=PROVINCE_TABLE,
+                          entry: dict|None=None) -> dict:
+    """Vectorized impact model over M impacts and N provinces in one pass.
+
+    Scalar or (M,) inputs broadcast together; `defenses` is a bool mask of shape (4,) or (M, 4)
+    in DEFENSE_NAMES order. Returns (M,) arrays per impact and (M, N) arrays per province.
+    `entry` (entry_model.simulate_entry_batch of the same meteors) replaces the fixed-density
+    energy and diameter-scaled radii with the atmospheric entry's.
+    """
+    diameter, speed_kms, ix, iy = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (diameter, speed_kms, ix, iy)))
+    n_impacts = diameter.shape[0]
+    if defenses is None:
+        defenses = np.zeros(len(DEFENSE_NAMES), dtype=bool)
+    mask = np.broadcast_to(np.asarray(defenses, dtype=bool), (n_impacts, len(DEFENSE_NAMES)))
+
+    if entry is None:
+        masa = diameter ** 3 * 800
+        energia_joules = 0.5 * masa * (speed_kms * 1000) ** 2
+        energia_megatones = energia_joules / (4.184e15)
+
+        r_total = diameter * 20 / 1000
+        r_partial = r_total * 3
+    else:
+        energia_megatones = np.broadcast_to(entry["energia_megatones"], diameter.shape)
+        r_total = np.broadcast_to(entry["radio_total"], diameter.shape)
+        r_partial = np.broadcast_to(entry["radio_parcial"], diameter.shape)
+
+    reduccion = defense_reduction(mask)
+
+    r_total = r_total * (1 - reduccion)
+    r_partial = r_partial * (1 - reduccion)
+    energia_final = energia_megatones * (1 - reduccion)
+
+    distancia = np.sqrt((table["cx"] - ix[:, None]) ** 2 + (table["cy"] - iy[:, None]) ** 2)
+    factor = np.where(distancia <= r_total[:, None], FACTOR_TOTAL,
+                      np.where(distancia <= r_partial[:, None], FACTOR_PARTIAL, FACTOR_OUTSIDE))
+    afectada = (table["poblacion"] * factor).astype(np.int64)
+
+    return {
+        "energia_megatones": energia_megatones,
+        "energia_final": energia_final,
+        "energia_mitigada": energia_megatones - energia_final,
+        "reduccion": reduccion * 100,
+        "radio_destruccion_total": r_total,
+        "radio_destruccion_parcial": r_partial,
+        "distancia": distancia,
+        "factor": factor,
+        "poblacion_afectada": afectada,
+        "poblacion_total_afectada": afectada.sum(axis=1),
+    }
+
+def entry_summary(batch: dict, entry: dict|None) -> dict|None:
+    """Airburst or ground impact of the first meteor, for a result dict (None without entry)."""
+    if entry is None:
+        return None
+    return {
+        "airburst": bool(entry["airburst"][0]),
+        "altitud_km": float(entry["altitud_km"][0]),
+        "velocidad_final": float(entry["velocidad_final"][0]),
+        "energia_explosion": float(entry["energia_explosion"][0] * (1 - batch["reduccion"][0] / 100)),
+    }
+
+def simulate_impact_china(diameter: float, speed_kms: float, ix: float, iy: float, defenses: dict,
+                          entry: dict|None=None):
+    """Simple param model; reduction combines defenses (why: quick interactive demo, not physics-accurate).
+
+    With `entry` (see simulate_impact_batch) energy and radii come from the atmospheric entry.
+    """
+    table = PROVINCE_TABLE
+    batch = simulate_impact_batch(diameter, speed_kms, ix, iy, defense_mask(defenses), table, entry)
+
+    provincias_afectadas = {}
+    for j, provincia_id in enumerate(table["ids"]):
+        factor = float(batch["factor"][0, j])
+        provincias_afectadas[provincia_id] = {
+            'province': table["nombres"][j],
+            'affected_population': int(batch["poblacion_afectada"][0, j]),
+            'impact_share_%': round(factor * 100, 1),
+            'distance_to_impact': round(float(batch["distancia"][0, j]), 2),
+            'total_population': int(table["poblacion"][j]),
+            'description': table["descripciones"][j],
+        }
+
+    return {
+        "energia_megatones": float(batch["energia_megatones"][0]),
+        "energia_final": float(batch["energia_final"][0]),
+        "energia_mitigada": float(batch["energia_mitigada"][0]),
+        "reduccion": float(batch["reduccion"][0]),
+        "radio_destruccion_total": float(batch["radio_destruccion_total"][0]),
+        "radio_destruccion_parcial": float(batch["radio_destruccion_parcial"][0]),
+        "poblacion_total_afectada": int(batch["poblacion_total_afectada"][0]),
+        "provincias_afectadas": provincias_afectadas,
+        "punto_impacto": (ix, iy),
+        "entrada": entry_summary(batch, entry),
+    }
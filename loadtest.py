@@ -0,0 +1,245 @@
+# loadtest.py
+"""Concurrent-session load test: throughput, tail latency and memory as viewers are added.
+
+    python loadtest.py                              # 1, 2, 4 and 8 sessions, 30 s each
+    python loadtest.py -n 4 -n 16 --duration 60     # chosen levels
+    python loadtest.py -o load.json                 # save JSON as well as the table
+
+Every level runs in a fresh interpreter holding N headless AppTest sessions on their own
+threads, so they share one process's caches the way browser tabs share a server. Each session
+drags the diameter and impact sliders a few times, then clicks SIMULATE and waits until the
+results (and the approach clip, unless --no-animate) are on the page. RSS is sampled from
+/proc while the level runs; per-session memory is what app.py's budget check measured.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import warnings
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "app.py")
+
+DEFAULT_LEVELS = (1, 2, 4, 8)
+DEFAULT_DURATION = 30.0  # seconds of traffic per level, after every session's first page
+DRAGS_PER_SIMULATE = 3
+SIMULATE_TIMEOUT = 120.0  # seconds before a pending simulation counts as an error
+POLL_INTERVAL = 0.25  # seconds between reruns while a simulation is pending, the app's run_every
+RSS_INTERVAL = 0.25  # seconds between RSS samples
+
+def rss_bytes() -> int:
+    """Current resident set size of this process."""
+    with open("/proc/self/status") as f:
+        for linea in f:
+            if linea.startswith("VmRSS:"):
+                return int(linea.split()[1]) * 1024
+    return 0
+
+def percentiles(muestras: list) -> dict:
+    """n/p50/p95/p99/max of durations in ms."""
+    if not muestras:
+        return {"n": 0}
+    muestras = sorted(muestras)
+    n = len(muestras)
+
+    def p(q: float) -> float:
+        return muestras[min(n - 1, round(q * (n - 1)))]
+
+    return {"n": n, "p50_ms": statistics.median(muestras), "p95_ms": p(0.95), "p99_ms": p(0.99),
+            "max_ms": muestras[-1]}
+
+# --- One level (child process) ---
+class Session(threading.Thread):
+    """One headless viewer: slider drags and SIMULATE clicks until `fin`."""
+
+    def __init__(self, n: int, arranque: threading.Barrier, fin: list, animate: bool):
+        super().__init__(name=f"session-{n}", daemon=True)
+        self.rng = random.Random(n)
+        self.arranque = arranque
+        self.fin = fin
+        self.animate = animate
+        self.latencias = {"first_run": [], "drag": [], "simulate": []}
+        self.errores = []
+        self.memoria = None
+
+    def _timed(self, accion: str, fn):
+        t0 = time.perf_counter()
+        fn()
+        self.latencias[accion].append((time.perf_counter() - t0) * 1000)
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+    def _drag(self):
+        clave, bajo, alto = self.rng.choice((("diametro", 100, 5000), ("punto_impacto_x", 70, 120),
+                                            ("punto_impacto_y", 20, 45)))
+        self.at.sidebar.slider(key=clave).set_value(self.rng.randint(bajo, alto)).run()
+
+    def _simulate(self):
+        at = self.at
+        anterior = at.session_state["simulacion"] if "simulacion" in at.session_state else None
+        next(b for b in at.button if b.label.startswith("SIMULATE")).click().run()
+        if "simulacion" not in at.session_state or at.session_state["simulacion"] is anterior:
+            raise RuntimeError("SIMULATE click did not start a simulation")
+        limite = time.perf_counter() + SIMULATE_TIMEOUT
+        while not at.dataframe or at.session_state["sondeo_simulacion"]:
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+            if time.perf_counter() > limite:
+                raise TimeoutError("simulation still pending")
+            time.sleep(POLL_INTERVAL)
+            at.run()
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+        try:
+            self.at = AppTest.from_file(APP_FILE, default_timeout=SIMULATE_TIMEOUT)
+            self._timed("first_run", self.at.run)
+            if not self.animate:
+                self.at.sidebar.checkbox(key="animar_impacto").uncheck().run()
+        except Exception as e:
+            self.errores.append(repr(e))
+            return
+        finally:
+            self.arranque.wait()  # (why: traffic is timed from when every session has a page)
+        while not self.fin:
+            try:
+                for _ in range(DRAGS_PER_SIMULATE):
+                    self._timed("drag", self._drag)
+                self._timed("simulate", self._simulate)
+            except Exception as e:
+                self.errores.append(repr(e))
+                break
+        if "memoria_sesion" in self.at.session_state:
+            self.memoria = self.at.session_state["memoria_sesion"]
+
+def share_runtime():
+    """One Streamlit runtime and compiled app.py for every AppTest in this process, as a server has.
+
+    (why: each AppTest run installs a runtime and clears it when done, which pulls it out from
+    under the other sessions' scripts, and compiles the script anew, which CPython 3.11's parser
+    fails at with "AST constructor recursion depth mismatch" when threads parse at once)
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner import script_cache
+    vigente = {}
+    instance = Runtime.instance.__func__
+
+    def shared_instance(cls):
+        if cls._instance is not None:
+            vigente["runtime"] = cls._instance
+        return vigente.get("runtime") or instance(cls)
+
+    Runtime.instance = classmethod(shared_instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in vigente)
+
+    compartido = script_cache.ScriptCache()
+
+    def __init__(self):
+        self._cache, self._lock = compartido._cache, compartido._lock
+
+    script_cache.ScriptCache.__init__ = __init__
+
+def run_level(sesiones: int, duration: float, animate: bool) -> dict:
+    """N concurrent sessions in this process for `duration` seconds of traffic."""
+    logging.disable(logging.WARNING)  # "no script run context" noise outside `streamlit run`
+    warnings.filterwarnings('ignore')
+    share_runtime()
+    rss_inicial = rss_bytes()  # (why: includes the framework, so per-session RSS is the sessions' own)
+
+    fin = []
+    arranque = threading.Barrier(sesiones + 1)
+    hilos = [Session(n, arranque, fin, animate) for n in range(sesiones)]
+    for hilo in hilos:
+        hilo.start()
+    arranque.wait()
+    rss_arranque = rss_bytes()
+    t0 = time.perf_counter()
+    muestras_rss = []
+    while time.perf_counter() - t0 < duration:
+        muestras_rss.append(rss_bytes())
+        time.sleep(RSS_INTERVAL)
+    fin.append(True)
+    for hilo in hilos:
+        hilo.join(SIMULATE_TIMEOUT)
+    transcurrido = time.perf_counter() - t0
+
+    latencias = {accion: [ms for hilo in hilos for ms in hilo.latencias[accion]] for accion in ("first_run", "drag", "simulate")}
+    memorias = [hilo.memoria for hilo in hilos if hilo.memoria is not None]
+    pico = max(muestras_rss + [rss_bytes()])
+    return {
+        "sessions": sesiones,
+        "seconds": transcurrido,
+        "actions_per_s": (len(latencias["drag"]) + len(latencias["simulate"])) / transcurrido,
+        "simulations_per_s": len(latencias["simulate"]) / transcurrido,
+        "latency": {accion: percentiles(muestras) for accion, muestras in latencias.items()},
+        "rss_mb": {"baseline": rss_inicial / 2**20, "sessions_loaded": rss_arranque / 2**20,
+                   "peak": pico / 2**20, "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                   "per_session": (pico - rss_inicial) / sesiones / 2**20},
+        "session_state_mb": statistics.fmean(memorias) / 2**20 if memorias else None,
+        "errors": [error for hilo in hilos for error in hilo.errores],
+        "stuck_sessions": sum(hilo.is_alive() for hilo in hilos),
+    }
+
+# --- Driver ---
+def run_levels(levels: list, duration: float, animate: bool) -> list:
+    """One fresh interpreter per level (why: RSS of earlier levels would carry over)."""
+    niveles = []
+    for sesiones in levels:
+        comando = [sys.executable, os.path.abspath(__file__), "--child", str(sesiones),
+                   "--duration", str(duration)] + ([] if animate else ["--no-animate"])
+        salida = subprocess.run(comando, cwd=APP_DIR, capture_output=True, text=True)
+        try:
+            nivel = json.loads(salida.stdout.strip().splitlines()[-1])
+        except (IndexError, json.JSONDecodeError):
+            nivel = {"sessions": sesiones, "errors": [salida.stderr.strip()[-2000:] or f"exit {salida.returncode}"]}
+        niveles.append(nivel)
+        print_level(nivel)
+    return niveles
+
+def print_level(nivel: dict):
+    if "latency" not in nivel:
+        print(f"{nivel['sessions']:>4d}  FAILED {nivel['errors']}", file=sys.stderr)
+        return
+    if not getattr(print_level, "cabecera", False):
+        print(f"{'sess':>4s} {'act/s':>6s} {'sim/s':>6s} {'drag p50':>9s} {'p95':>7s} {'p99':>7s} "
+              f"{'sim p50':>8s} {'p95':>7s} {'p99':>7s} {'RSS MB':>7s} {'/sess':>6s} {'state MB':>8s}")
+        print_level.cabecera = True
+    drag, sim = nivel["latency"]["drag"], nivel["latency"]["simulate"]
+    estado = nivel["session_state_mb"]
+    print(f"{nivel['sessions']:4d} {nivel['actions_per_s']:6.2f} {nivel['simulations_per_s']:6.2f} "
+          f"{drag.get('p50_ms', 0):9.0f} {drag.get('p95_ms', 0):7.0f} {drag.get('p99_ms', 0):7.0f} "
+          f"{sim.get('p50_ms', 0):8.0f} {sim.get('p95_ms', 0):7.0f} {sim.get('p99_ms', 0):7.0f} "
+          f"{nivel['rss_mb']['peak']:7.0f} {nivel['rss_mb']['per_session']:6.1f} "
+          f"{estado if estado is not None else float('nan'):8.3f}")
+    for clave in ("errors", "stuck_sessions"):
+        if nivel[clave]:
+            print(f"     {clave}: {nivel[clave]}", file=sys.stderr)
+
+def main(argv: list|None=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the impact simulator with concurrent sessions.")
+    parser.add_argument("-n", "--sessions", type=int, action="append", metavar="N",
+                        help="concurrent sessions of one level (repeatable; default 1 2 4 8)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds of traffic per level")
+    parser.add_argument("--no-animate", action="store_true", help="turn the approach clip off in every session")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_level(args.child, args.duration, not args.no_animate)))
+        return 0
+    niveles = run_levels(args.sessions or list(DEFAULT_LEVELS), args.duration, not args.no_animate)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"duration": args.duration, "animate": not args.no_animate, "levels": niveles}, f, indent=2)
+    return 1 if any(nivel.get("errors") or nivel.get("stuck_sessions") for nivel in niveles) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
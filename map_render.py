@@ -0,0 +1,291 @@
+# map_render.py
+"""Matplotlib map renderer: the static base layer, impact overlays and the risk heatmap.
+
+Importing this module imports matplotlib (not pyplot); the page only does so on paths that draw.
+Every figure comes from figure_pool.FIGURES and is released when its pixels are out.
+"""
+import functools
+import io
+
+import matplotlib
+from matplotlib.lines import Line2D
+from matplotlib.offsetbox import AnnotationBbox, OffsetImage
+from matplotlib.patches import Circle, Ellipse, Polygon, Rectangle
+from matplotlib.transforms import Bbox
+import numpy as np
+from PIL import Image
+
+from figure_pool import FIGURES
+from impact_model import poblacion_china
+from map_style import MAP_EXTENT, METEOR_STYLES, critical_point_style, population_style, puntos_criticos_china
+
+# Map geometry shared by the base layer and the impact overlay
+MAP_FIGSIZE = (10, 8)
+# 1427 px wide: under st.image's 1460 px limit (why: wider PNGs are decoded, resized and
+# re-encoded by Streamlit on every display, ~0.6 s per session per rerun at 200 dpi)
+MAP_DPI = 150
+METEOR_ZOOM = 0.08  # sprite scale per unit of meteor_size
+
+def generate_fallback_map() -> Image.Image:
+    """Generate a simplified China-like map as an image (why: ensures app works without external asset)."""
+    with FIGURES.figure((10, 8)) as fig:
+        return _draw_fallback_map(fig)
+
+def _draw_fallback_map(fig) -> Image.Image:
+    ax = fig.add_subplot()
+    ax.set_facecolor('#1a1a2e')
+
+    china_outline = np.array([
+        [50, 10], [60, 15], [70, 20], [80, 25], [90, 30], [100, 35],
+        [110, 30], [115, 25], [120, 20], [115, 15], [105, 10],
+        [95, 5], [85, 10], [75, 15], [65, 20], [55, 15], [50, 10]
+    ])
+
+    polygon = Polygon(china_outline, closed=True, facecolor='#2c3e50',
+                      edgecolor='white', alpha=0.8, linewidth=2)
+    ax.add_patch(polygon)
+
+    # Rivers (decorative)
+    ax.plot([65, 85, 100], [35, 30, 25], 'b-', linewidth=3, alpha=0.6, label='Yangtze River')
+    ax.plot([55, 75, 90], [40, 35, 30], 'b-', linewidth=2, alpha=0.6, label='Yellow River')
+
+    ax.set_xlim(50, 120)
+    ax.set_ylim(5, 45)
+    ax.set_aspect('equal')
+    ax.axis('off')
+    ax.set_title('China Map - Impact Simulator', fontsize=16, color='white', pad=20)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=100, bbox_inches='tight',
+                facecolor='#1a1a2e', edgecolor='none')
+    buf.seek(0)
+    return Image.open(buf)
+
+# --- Meteor sprites ---
+def create_meteor(size: float, style: str='rocky') -> io.BytesIO:
+    """Create a small meteor image with gradient (why: better visual cue)."""
+    with FIGURES.figure((2, 2)) as fig:
+        return _draw_meteor(fig, style)
+
+def _draw_meteor(fig, style: str) -> io.BytesIO:
+    outer, mantle, crust, core, spot, trail = METEOR_STYLES[style]
+    ax = fig.add_subplot()
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+
+    ax.add_patch(Circle((0.5, 0.5), 0.4, facecolor=outer, edgecolor='#000000', linewidth=2, alpha=0.9))
+    ax.add_patch(Circle((0.5, 0.5), 0.3, facecolor=mantle, edgecolor='none', alpha=0.8))
+    ax.add_patch(Circle((0.5, 0.5), 0.2, facecolor=crust, edgecolor='none', alpha=0.9))
+    ax.add_patch(Circle((0.5, 0.5), 0.1, facecolor=core, edgecolor='none', alpha=1.0))
+    ax.add_patch(Circle((0.35, 0.35), 0.05, facecolor=spot, alpha=0.7))
+    for i in range(3):
+        ax.add_patch(Ellipse((0.8 - i*0.1, 0.5), 0.15, 0.08, angle=30, facecolor=trail, alpha=0.4 - i*0.1))
+
+    ax.set_aspect('equal')
+    ax.axis('off')
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=100, bbox_inches='tight', pad_inches=0,
+                facecolor='none', transparent=True)
+    buf.seek(0)
+    return buf
+
+@functools.lru_cache(maxsize=len(METEOR_STYLES))
+def _meteor_master(style: str) -> np.ndarray:
+    """Full-resolution sprite per style, rendered through matplotlib exactly once per process."""
+    sprite = np.asarray(Image.open(create_meteor(1.0, style)).convert('RGBA'))
+    sprite.flags.writeable = False
+    return sprite
+
+@functools.lru_cache(maxsize=64)
+def meteor_sprite(style: str, pixels: int) -> np.ndarray:
+    """RGBA sprite `pixels` wide, resampled from the cached master (LRU-bounded, shared by all sessions)."""
+    master = _meteor_master(style)
+    height = max(1, round(pixels * master.shape[0] / master.shape[1]))
+    sprite = np.asarray(Image.fromarray(master).resize((max(1, pixels), height), Image.LANCZOS))
+    sprite.flags.writeable = False
+    return sprite
+
+# --- Map ---
+def create_china_map(imagen_china: Image.Image, show_meteor: bool=False,
+                     impact_pos: tuple|None=None, meteor_size: float=1.0):
+    """Draw provinces, critical points, and optional meteor on a pooled figure.
+
+    The caller owns the figure until it hands it back with FIGURES.release(fig).
+    """
+    fig = FIGURES.acquire(MAP_FIGSIZE)
+    ax = fig.add_subplot()
+    ax.imshow(imagen_china, extent=MAP_EXTENT, alpha=0.8)
+
+    for provincia_id, provincia in poblacion_china.items():
+        coords = provincia['coordenadas']
+        ancho = coords['x_max'] - coords['x_min']
+        alto = coords['y_max'] - coords['y_min']
+
+        color, alpha = population_style(provincia['poblacion'])
+
+        rect = Rectangle((coords['x_min'], coords['y_min']), ancho, alto,
+                         facecolor=color, alpha=alpha, edgecolor=color, linewidth=2)
+        ax.add_patch(rect)
+
+        cx = (coords['x_min'] + coords['x_max']) / 2
+        cy = (coords['y_min'] + coords['y_max']) / 2
+
+        ax.text(cx, cy,
+                f"{provincia['nombre']}\n{provincia['poblacion']:,} thousand",
+                ha='center', va='center', fontsize=7, weight='bold',
+                bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.9))
+
+    for punto_id, punto in puntos_criticos_china.items():
+        marker, color = critical_point_style(punto['tipo'])
+
+        ax.plot(punto['x'], punto['y'], marker=marker, color=color,
+                markersize=10, markeredgecolor='white', linewidth=2)
+        ax.text(punto['x'], punto['y'] + 2, punto['nombre'],
+                ha='center', va='bottom', fontsize=7, weight='bold',
+                bbox=dict(boxstyle="round,pad=0.2", facecolor='white', alpha=0.8))
+
+    if show_meteor and impact_pos:
+        draw_impact_overlay(ax, impact_pos, meteor_size)
+
+    ax.set_xlim(MAP_EXTENT[0], MAP_EXTENT[1])
+    ax.set_ylim(MAP_EXTENT[2], MAP_EXTENT[3])
+    ax.set_aspect('equal')
+    ax.set_title('China Map - Impact Simulator\n(Provinces by population)', fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel('East Longitude')
+    ax.set_ylabel('North Latitude')
+    ax.grid(False)
+
+    legend_elements = [
+        Line2D([0], [0], marker='s', color='w', markerfacecolor='#e74c3c', markersize=10, label='>100M people', alpha=0.7),
+        Line2D([0], [0], marker='s', color='w', markerfacecolor='#e67e22', markersize=10, label='80–100M people', alpha=0.7),
+        Line2D([0], [0], marker='s', color='w', markerfacecolor='#f1c40f', markersize=10, label='60–80M people', alpha=0.7),
+        Line2D([0], [0], marker='s', color='w', markerfacecolor='#27ae60', markersize=10, label='<60M people', alpha=0.7),
+        Line2D([0], [0], marker='s', color='w', markerfacecolor='red', markersize=8, label='Capital'),
+        Line2D([0], [0], marker='o', color='w', markerfacecolor='blue', markersize=8, label='Economic Center'),
+    ]
+    ax.legend(handles=legend_elements, loc='upper right', bbox_to_anchor=(1.15, 1), title="Legend")
+    return fig
+
+def draw_impact_overlay(ax, impact_pos: tuple, meteor_size: float,
+                        r_total: float|None=None, r_partial: float|None=None, style: str='rocky'):
+    """Draw meteor, path, impact marker and (optionally) destruction radii on an existing axes."""
+    ix, iy = impact_pos
+    mx = ix
+    my = min(MAP_EXTENT[3], iy + 20)
+
+    # Pre-sized for MAP_DPI and drawn 1:1 (why: no per-simulation figure, PNG encode or decode)
+    pixels = round(_meteor_master(style).shape[1] * meteor_size * METEOR_ZOOM * MAP_DPI / 72)
+    imagebox = OffsetImage(meteor_sprite(style, pixels), zoom=1, dpi_cor=False)
+    ab = AnnotationBbox(imagebox, (mx, my), frameon=False, pad=0)
+    ax.add_artist(ab)
+
+    ax.plot([mx, ix], [my, iy], 'r--', alpha=0.7, linewidth=2, label='Meteor Path')
+    ax.plot(ix, iy, 'X', color='red',
+            markersize=15, markeredgecolor='white', linewidth=2, label='Impact Point')
+
+    if r_total is not None and r_partial is not None:
+        circ_total = Circle((ix, iy), radius=r_total,
+                            facecolor='red', alpha=0.15, edgecolor='red', linewidth=1)
+        circ_partial = Circle((ix, iy), radius=r_partial,
+                              facecolor='orange', alpha=0.12, edgecolor='orange', linewidth=1)
+        ax.add_patch(circ_partial)
+        ax.add_patch(circ_total)
+        ax.text(ix, iy - 2, "Impact", ha='center', va='top',
+                bbox=dict(boxstyle="round,pad=0.2", facecolor='white', alpha=0.8), fontsize=8)
+
+# --- Rasters ---
+def _rasterize(fig, bbox: Bbox, transparent: bool=False) -> np.ndarray:
+    """Render a figure region to an (H, W, 4) uint8 RGBA array with straight alpha."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format='rgba', dpi=MAP_DPI, bbox_inches=bbox, transparent=transparent)
+    height = int(bbox.height * MAP_DPI)
+    return np.frombuffer(buf.getvalue(), dtype=np.uint8).reshape(height, -1, 4)
+
+def render_base_layer(imagen_china: Image.Image) -> dict:
+    """Rasterize the static map (image, provinces, critical points, legend).
+
+    Geometry is plain tuples, so the layer can be saved to disk and used without matplotlib.
+    """
+    fig = create_china_map(imagen_china)
+    try:
+        fig.set_dpi(MAP_DPI)
+        renderer = fig.canvas.get_renderer()
+        fig.draw(renderer)
+        bbox = fig.get_tightbbox(renderer).padded(matplotlib.rcParams['savefig.pad_inches'])
+        rgba = _rasterize(fig, bbox)
+        layer = {
+            "bbox": tuple(bbox.extents),
+            "figsize": tuple(fig.get_size_inches()),
+            "ax_position": fig.axes[0].get_position().bounds,
+        }
+    finally:
+        FIGURES.release(fig)
+    rgba.flags.writeable = False
+    return {"rgba": rgba, "png": encode_png(rgba, compress_level=6), **layer}
+
+def render_impact_map(base_layer: dict, impact_pos: tuple, meteor_size: float,
+                      r_total: float, r_partial: float, style: str='rocky') -> np.ndarray:
+    """Composite the impact overlay onto the cached base layer (why: only the overlay is drawn per simulation)."""
+    # Pooled figure, not pyplot (why: this runs on simulation worker threads)
+    with FIGURES.figure(base_layer["figsize"]) as fig:
+        ax = fig.add_axes(base_layer["ax_position"])
+        ax.set_xlim(MAP_EXTENT[0], MAP_EXTENT[1])
+        ax.set_ylim(MAP_EXTENT[2], MAP_EXTENT[3])
+        ax.axis('off')
+        draw_impact_overlay(ax, impact_pos, meteor_size, r_total, r_partial, style)
+        overlay = _rasterize(fig, Bbox.from_extents(*base_layer["bbox"]), transparent=True)
+
+    # Blend only the overlay's bounding box (why: most of the canvas is fully transparent)
+    out = base_layer["rgba"].copy()
+    alpha = overlay[..., 3]
+    rows = np.flatnonzero(alpha.any(axis=1))
+    cols = np.flatnonzero(alpha.any(axis=0))
+    if rows.size:
+        region = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+        a = alpha[region][..., None].astype(np.uint16)
+        src = overlay[region][..., :3].astype(np.uint16)
+        dst = out[region][..., :3].astype(np.uint16)
+        out[region + (slice(0, 3),)] = ((src * a + dst * (255 - a) + 127) // 255).astype(np.uint8)
+    return out
+
+def _axes_pixel_box(base_layer: dict) -> tuple:
+    """(left, top, right, bottom) of the map axes in base-layer pixels."""
+    x0, y0, w, h = base_layer["ax_position"]
+    fig_w, fig_h = base_layer["figsize"]
+    bbox_x0, bbox_y0 = base_layer["bbox"][:2]
+    height = base_layer["rgba"].shape[0]
+    left = round((x0 * fig_w - bbox_x0) * MAP_DPI)
+    right = round(((x0 + w) * fig_w - bbox_x0) * MAP_DPI)
+    top = height - round(((y0 + h) * fig_h - bbox_y0) * MAP_DPI)
+    bottom = height - round((y0 * fig_h - bbox_y0) * MAP_DPI)
+    return left, top, right, bottom
+
+def render_heatmap_map(base_layer: dict, grid: np.ndarray, opacity: float=0.55) -> np.ndarray:
+    """Blend a (lat, lon) risk grid over the map axes of the cached base layer."""
+    left, top, right, bottom = _axes_pixel_box(base_layer)
+    # Stretch over the grid's own range (why: at large diameters every cell is near the maximum)
+    low, high = grid.min(), grid.max()
+    norm = (grid - low) / (high - low) if high > low else np.zeros(grid.shape)
+    colors = (matplotlib.colormaps['inferno'](norm) * 255).astype(np.uint8)
+    heat = np.asarray(Image.fromarray(colors).resize((right - left, bottom - top), Image.BILINEAR))
+
+    out = base_layer["rgba"].copy()
+    region = out[top:bottom, left:right, :3].astype(np.float32)
+    out[top:bottom, left:right, :3] = (heat[..., :3] * opacity + region * (1 - opacity)).astype(np.uint8)
+    return out
+
+def colormap_rgba(imagen: Image.Image) -> np.ndarray:
+    """RGBA pixels of an image; single-band images get the default colormap imshow applies."""
+    if imagen.mode not in ('L', 'I', 'F'):
+        return np.asarray(imagen.convert('RGBA'))
+    valores = np.asarray(imagen, dtype=np.float64)
+    rango = valores.max() - valores.min()
+    norm = (valores - valores.min()) / rango if rango else np.zeros(valores.shape)
+    return (matplotlib.colormaps[matplotlib.rcParams['image.cmap']](norm) * 255).astype(np.uint8)
+
+def encode_png(rgba: np.ndarray, compress_level: int=1) -> bytes:
+    """Encode an RGBA array as PNG (why: a low zlib level keeps per-simulation encoding cheap)."""
+    buf = io.BytesIO()
+    Image.fromarray(rgba).save(buf, format='PNG', compress_level=compress_level)
+    return buf.getvalue()
@@ -0,0 +1,47 @@
+# map_style.py
+"""Map data and styling shared by the matplotlib and plotly renderers (read-only, see shared_state)."""
+from shared_state import freeze
+
+# Extent of the map images in map units (east longitude, north latitude)
+MAP_EXTENT = (50, 120, 5, 45)
+
+# --- Critical points (labels in English) ---
+puntos_criticos_china = freeze({
+    'beijing': {'x': 92, 'y': 45, 'nombre': 'Beijing', 'tipo': 'capital'},
+    'shanghai': {'x': 102, 'y': 28, 'nombre': 'Shanghai', 'tipo': 'economic'},
+    'guangzhou': {'x': 87, 'y': 20, 'nombre': 'Guangzhou', 'tipo': 'economic'},
+    'shenzhen': {'x': 90, 'y': 18, 'nombre': 'Shenzhen', 'tipo': 'technology'},
+    'wuhan': {'x': 82, 'y': 30, 'nombre': 'Wuhan', 'tipo': 'industrial'},
+    'xian': {'x': 70, 'y': 38, 'nombre': "Xi'an", 'tipo': 'cultural'}
+})
+
+# --- Meteor sprite styles (outer, mantle, crust, core, hot spot, trail) ---
+METEOR_STYLES = freeze({
+    'rocky': ('#2F4F4F', '#654321', '#8B4500', '#8B0000', '#FF4500', '#FF8C00'),
+    'iron': ('#3B3B3B', '#5E5E5E', '#8C8C8C', '#B0B0B0', '#FFD27F', '#FFB347'),
+    'icy': ('#2F4F6F', '#5F9EA0', '#ADD8E6', '#E0FFFF', '#FFFFFF', '#87CEFA'),
+})
+
+def population_style(poblacion: int) -> tuple[str, float]:
+    """(color, alpha) of a province by population in thousands."""
+    if poblacion > 100000:
+        return '#e74c3c', 0.4
+    elif poblacion > 80000:
+        return '#e67e22', 0.35
+    elif poblacion > 60000:
+        return '#f1c40f', 0.3
+    else:
+        return '#27ae60', 0.25
+
+def critical_point_style(tipo: str) -> tuple[str, str]:
+    """(matplotlib marker, color) of a critical point by type."""
+    if tipo == 'capital':
+        return 's', 'red'
+    elif tipo == 'economic':
+        return 'o', 'blue'
+    elif tipo == 'technology':
+        return 'D', 'green'
+    elif tipo == 'industrial':
+        return '^', 'orange'
+    else:
+        return 'v', 'purple'
@@ -0,0 +1,155 @@
+# plotly_map.py
+"""Client-side map renderer: plotly figure dicts drawn and zoomed in the browser.
+
+The static part (background image, province polygons, critical points) is built once per
+asset version; a simulation only swaps province hover text and appends the impact traces.
+Figures are plain dicts so the cached static traces are shared by reference, not copied.
+"""
+import numpy as np
+
+from impact_model import PROVINCE_TABLE
+from map_style import MAP_EXTENT, critical_point_style, population_style, puntos_criticos_china
+
+# matplotlib marker -> plotly symbol (same glyphs as the matplotlib renderer)
+PLOTLY_SYMBOLS = {'s': 'square', 'o': 'circle', 'D': 'diamond', '^': 'triangle-up', 'v': 'triangle-down'}
+CIRCLE_POINTS = 64
+UI_REVISION = "china-map"  # constant so pan/zoom survive figure updates
+
+def _province_traces(table: dict, hover: list) -> list:
+    traces = []
+    for j, (x0, x1, y0, y1) in enumerate(table["bounds"]):
+        color, alpha = population_style(int(table["poblacion"][j] // 1000))
+        traces.append({
+            "type": "scatter",
+            "x": [x0, x1, x1, x0, x0],
+            "y": [y0, y0, y1, y1, y0],
+            "mode": "lines",
+            "fill": "toself",
+            "fillcolor": color,
+            "opacity": alpha,
+            "line": {"color": color, "width": 2},
+            "name": table["nombres"][j],
+            "hoveron": "fills",
+            "text": hover[j],
+            "hoverinfo": "text",
+            "showlegend": False,
+        })
+    return traces
+
+def _province_hover(table: dict, result: dict|None) -> list:
+    filas = result["provincias_afectadas"] if result is not None else {}
+    hover = []
+    for j, provincia_id in enumerate(table["ids"]):
+        text = f"<b>{table['nombres'][j]}</b><br>{int(table['poblacion'][j]):,} people"
+        fila = filas.get(provincia_id)  # (why: county runs key their rows by unit, not province)
+        if fila is not None:
+            text += (f"<br>Affected: {fila['affected_population']:,} ({fila['impact_share_%']}%)"
+                     f"<br>Distance to impact: {fila['distance_to_impact']}")
+        hover.append(text)
+    return hover
+
+def _critical_point_traces() -> list:
+    traces = []
+    by_type = {}
+    for punto in puntos_criticos_china.values():
+        by_type.setdefault(punto['tipo'], []).append(punto)
+    for tipo, puntos in by_type.items():
+        marker, color = critical_point_style(tipo)
+        traces.append({
+            "type": "scatter",
+            "x": [p['x'] for p in puntos],
+            "y": [p['y'] for p in puntos],
+            "mode": "markers+text",
+            "text": [p['nombre'] for p in puntos],
+            "textposition": "top center",
+            "marker": {"symbol": PLOTLY_SYMBOLS[marker], "color": color, "size": 11,
+                       "line": {"color": "white", "width": 1.5}},
+            "name": tipo.capitalize(),
+            "hovertemplate": "%{text}<extra>" + tipo + "</extra>",
+        })
+    return traces
+
+def base_figure(background_source: str, table: dict=PROVINCE_TABLE) -> dict:
+    """Static map figure; `background_source` is a URL or data URI for the map image."""
+    layout = {
+        "title": {"text": "China Map - Impact Simulator<br>(Provinces by population)", "x": 0.5},
+        "xaxis": {"range": MAP_EXTENT[:2], "title": {"text": "East Longitude"},
+                  "showgrid": False, "zeroline": False},
+        "yaxis": {"range": MAP_EXTENT[2:], "title": {"text": "North Latitude"},
+                  "showgrid": False, "zeroline": False, "scaleanchor": "x", "scaleratio": 1},
+        "images": [{
+            "source": background_source, "xref": "x", "yref": "y",
+            "x": MAP_EXTENT[0], "y": MAP_EXTENT[3],
+            "sizex": MAP_EXTENT[1] - MAP_EXTENT[0], "sizey": MAP_EXTENT[3] - MAP_EXTENT[2],
+            "sizing": "stretch", "layer": "below", "opacity": 0.8,
+        }],
+        "plot_bgcolor": "white",
+        "legend": {"title": {"text": "Legend"}},
+        "margin": {"l": 50, "r": 20, "t": 70, "b": 50},
+        "height": 640,
+        "uirevision": UI_REVISION,
+    }
+    return {
+        "table": table,
+        "provinces": _province_traces(table, _province_hover(table, None)),
+        "points": _critical_point_traces(),
+        "layout": layout,
+    }
+
+def _circle(cx: float, cy: float, r: float) -> tuple:
+    theta = np.linspace(0, 2 * np.pi, CIRCLE_POINTS)
+    return (np.round(cx + r * np.cos(theta), 4).tolist(), np.round(cy + r * np.sin(theta), 4).tolist())
+
+def impact_traces(result: dict) -> list:
+    """Meteor, path, impact marker and destruction disks for one simulation result."""
+    ix, iy = result["punto_impacto"]
+    my = min(MAP_EXTENT[3], iy + 20)
+    traces = []
+    for radio, nombre, color, alpha in (
+            (result["radio_destruccion_parcial"], "Partial destruction", "orange", 0.12),
+            (result["radio_destruccion_total"], "Total destruction", "red", 0.15)):
+        x, y = _circle(ix, iy, radio)
+        traces.append({
+            "type": "scatter", "x": x, "y": y, "mode": "lines", "fill": "toself",
+            "fillcolor": f"rgba({'255,165,0' if color == 'orange' else '255,0,0'},{alpha})",
+            "line": {"color": color, "width": 1}, "name": nombre,
+            "hoverinfo": "name+text", "text": f"radius {radio:.2f}", "hoveron": "fills",
+        })
+    traces.append({
+        "type": "scatter", "x": [ix, ix], "y": [my, iy], "mode": "lines",
+        "line": {"color": "red", "dash": "dash", "width": 2}, "opacity": 0.7,
+        "name": "Meteor Path", "hoverinfo": "skip",
+    })
+    traces.append({
+        "type": "scatter", "x": [ix], "y": [my], "mode": "markers", "name": "Meteor",
+        "marker": {"symbol": "circle", "size": 14, "color": "#654321",
+                   "line": {"color": "#000000", "width": 2}},
+        "hoverinfo": "name",
+    })
+    traces.append({
+        "type": "scatter", "x": [ix], "y": [iy], "mode": "markers", "name": "Impact Point",
+        "marker": {"symbol": "x", "size": 16, "color": "red", "line": {"color": "white", "width": 1.5}},
+        "hovertemplate": f"Impact ({ix}, {iy})<br>Total affected: {result['poblacion_total_afectada']:,}<extra></extra>",
+    })
+    return traces
+
+def heatmap_trace(grid: np.ndarray, lon: np.ndarray, lat: np.ndarray) -> dict:
+    """Risk grid (lat, lon; north row first) as a translucent heatmap trace."""
+    return {
+        "type": "heatmap", "z": grid[::-1].tolist(), "x": lon.tolist(), "y": lat.tolist(),
+        "colorscale": "Inferno", "opacity": 0.5, "showscale": False,
+        "hovertemplate": "(%{x}, %{y})<br>Affected: %{z:,}<extra>risk</extra>",
+    }
+
+def china_map_figure(base: dict, result: dict|None=None, heatmap: dict|None=None) -> dict:
+    """Full figure dict: cached static layout plus per-call hover text and impact traces."""
+    table = base["table"]
+    data = [heatmap] if heatmap is not None else []
+    if result is None:
+        data += base["provinces"]
+    else:
+        data += _province_traces(table, _province_hover(table, result))
+    data += base["points"]
+    if result is not None:
+        data += impact_traces(result)
+    return {"data": data, "layout": base["layout"]}
@@ -0,0 +1,211 @@
+# result_cache.py
+"""Simulation results and impact-map PNGs shared by every session, with an optional disk tier.
+
+Keys are tuples of normalized inputs that include the version of the data they were computed
+from, so a changed province table or map never serves stale entries. Memory is an LRU bounded
+in bytes; the disk tier (one file per entry under IMPACT_RESULT_CACHE_DIR, "" to turn it off)
+survives restarts and is pruned oldest-first past its own byte bound.
+
+Values are shared by every session, so result dicts are stored frozen and in the shape JSON gives
+them back (tuples for lists, Python floats), whichever tier they come from.
+"""
+from collections import OrderedDict
+from collections.abc import Mapping
+import hashlib
+import json
+import os
+import threading
+
+from shared_state import freeze
+
+DEFAULT_DISK_DIR = os.path.join(".cache", "results")
+# IMPACT_RESULT_CACHE_MB overrides (why: 0 makes every run draw, as the soak test needs)
+MEMORY_BYTES = int(float(os.environ.get("IMPACT_RESULT_CACHE_MB", 64)) * 2**20)
+DISK_BYTES = 256 * 2**20
+CACHE_VERSION = 1  # bump when the model or the overlay drawing changes (orphans disk entries)
+
+# --- Keys ---
+def _number(valor) -> float:
+    return float(valor)  # (why: slider ints and batch floats of the same value share an entry)
+
+def result_key(modelo: str, diameter: float, speed_kms: float, ix: float, iy: float,
+               defenses: dict, data_version: str, entry: tuple|None=None) -> tuple:
+    """Key of a model run; the defense set is order-free and ignores switched-off names.
+
+    `entry` is the (angle, density) of the atmospheric entry model, None when it is off.
+    """
+    activas = tuple(sorted(name for name, on in defenses.items() if on))
+    entrada = tuple(_number(v) for v in entry) if entry else ()
+    return ("result", modelo, _number(diameter), _number(speed_kms), _number(ix), _number(iy),
+            activas, entrada, data_version)
+
+def impact_png_key(result: dict, style: str, base_version: str) -> tuple:
+    """Key of an impact map: only what is drawn, so runs that differ in speed or model share it."""
+    ix, iy = result["punto_impacto"]
+    return ("impact_png", _number(ix), _number(iy), round(result["radio_destruccion_total"], 9),
+            round(result["radio_destruccion_parcial"], 9), style, base_version)
+
+def clip_key(result: dict, style: str, base_version: str, fmt: str) -> tuple:
+    """Key of an approach animation: what the impact map draws, plus the encoding."""
+    return ("clip", fmt) + impact_png_key(result, style, base_version)[1:]
+
+# --- Cache ---
+def _thaw(valor):
+    if isinstance(valor, Mapping):
+        return dict(valor)  # (why: json cannot encode a frozen dict's read-only view)
+    if hasattr(valor, "item"):
+        return valor.item()  # NumPy scalars
+    raise TypeError(f"{type(valor).__name__} is not JSON serializable")
+
+def _encode(valor) -> tuple:
+    """(bytes, suffix) on disk: PNGs as they are, result dicts as JSON."""
+    if isinstance(valor, bytes):
+        return valor, ".bin"
+    return json.dumps(valor, default=_thaw).encode(), ".json"
+
+def _decode(datos: bytes, suffix: str):
+    """Value as every tier hands it out: bytes as they are, JSON frozen."""
+    return datos if suffix == ".bin" else freeze(json.loads(datos))
+
+class ResultCache:
+    """Thread-safe byte-bounded LRU in front of an optional directory of entries."""
+
+    def __init__(self, max_bytes: int=MEMORY_BYTES, disk_dir: str|None=None, max_disk_bytes: int=DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._counts = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._disk_bytes = None  # summed on first disk write
+
+    def _path(self, key: tuple, suffix: str) -> str:
+        digest = hashlib.sha1(repr((CACHE_VERSION, key)).encode()).hexdigest()
+        return os.path.join(self.disk_dir, digest + suffix)
+
+    def get(self, key: tuple):
+        """Cached value (read-only) or None; a disk hit is promoted to memory."""
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is not None:
+                self._entries.move_to_end(key)
+                self._counts["hits"] += 1
+                return entrada[0]
+        valor = self._read_disk(key)
+        with self._lock:
+            self._counts["disk_hits" if valor is not None else "misses"] += 1
+        if valor is not None:
+            self._remember(key, valor, len(_encode(valor)[0]))
+        return valor
+
+    def put(self, key: tuple, valor):
+        """Store `valor`; returns the read-only copy that get() will hand out."""
+        datos, suffix = _encode(valor)
+        valor = _decode(datos, suffix)
+        self._remember(key, valor, len(datos))
+        if self.disk_dir:
+            self._write_disk(key, datos, suffix)
+        return valor
+
+    def get_or_compute(self, key: tuple, compute):
+        """Cached value, or compute() stored under `key` (concurrent misses may both compute).
+
+        Both hand out the stored copy (why: the session that computed it sees what the others do).
+        """
+        valor = self.get(key)
+        if valor is None:
+            valor = self.put(key, compute())
+        return valor
+
+    def _remember(self, key: tuple, valor, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._entries.pop(key, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entries[key] = (valor, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, liberado) = self._entries.popitem(last=False)
+                self._bytes -= liberado
+                self._counts["evictions"] += 1
+
+    # --- Disk tier ---
+    def _read_disk(self, key: tuple):
+        if not self.disk_dir:
+            return None
+        for suffix in (".bin", ".json"):
+            try:
+                with open(self._path(key, suffix), 'rb') as f:
+                    datos = f.read()
+            except OSError:
+                continue
+            return _decode(datos, suffix)
+        return None
+
+    def _write_disk(self, key: tuple, datos: bytes, suffix: str):
+        ruta = self._path(key, suffix)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(datos)
+            os.replace(tmp, ruta)  # atomic (why: another process may read or write the same entry)
+        except OSError:
+            return  # the disk tier is best-effort; memory still has the entry
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk()[1]
+            else:
+                self._disk_bytes += len(datos)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._prune_disk()
+
+    def _scan_disk(self) -> tuple:
+        """([(mtime, size, path)] oldest first, total bytes) of the entry files."""
+        archivos = []
+        with os.scandir(self.disk_dir) as it:
+            for entrada in it:
+                if entrada.name.endswith((".bin", ".json")):
+                    info = entrada.stat()
+                    archivos.append((info.st_mtime, info.st_size, entrada.path))
+        archivos.sort()
+        return archivos, sum(size for _, size, _ in archivos)
+
+    def _prune_disk(self):
+        # Down to 3/4 of the bound (why: a scan per write once full would cost more than the entries)
+        archivos, total = self._scan_disk()
+        for _, size, ruta in archivos:
+            if total <= self.max_disk_bytes * 3 // 4:
+                break
+            try:
+                os.remove(ruta)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters plus current memory use."""
+        with self._lock:
+            pedidos = self._counts["hits"] + self._counts["disk_hits"] + self._counts["misses"]
+            return {**self._counts, "entries": len(self._entries), "bytes": self._bytes,
+                    "hit_rate": (pedidos - self._counts["misses"]) / pedidos if pedidos else 0.0}
+
+    def object_ids(self) -> frozenset:
+        """ids of the values in memory (why: a session referencing one of them costs no extra bytes)."""
+        with self._lock:
+            return frozenset(id(valor) for valor, _ in self._entries.values())
+
+    def clear(self):
+        """Drop the memory tier and reset the counters (disk entries stay)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._counts = dict.fromkeys(self._counts, 0)
+
+def disk_dir_from_env() -> str|None:
+    """IMPACT_RESULT_CACHE_DIR, defaulting to .cache/results; empty turns the disk tier off."""
+    return os.environ.get("IMPACT_RESULT_CACHE_DIR", DEFAULT_DISK_DIR) or None
@@ -0,0 +1,116 @@
+# risk_surface.py
+"""Precomputed risk surface over every integer slider position.
+
+For each (lon, lat) the surface stores the nearest province and, for a ladder of effective
+diameters, the damage zone of every province. Radii depend only on diameter * (1 - reduction),
+so one diameter ladder covers all defense combinations; speed only changes energy.
+
+Province data is frozen for the life of the process (see impact_model), so the surface is built
+once; a changed province table is a new deployment, and a full build takes ~0.3 s.
+"""
+import threading
+
+import numpy as np
+
+from impact_model import (DEFENSE_REDUCTION, FACTOR_OUTSIDE, FACTOR_PARTIAL, FACTOR_TOTAL,
+                          MAX_REDUCTION, PROVINCE_TABLE, simulate_impact_batch)
+from shared_state import freeze
+
+GRID_LON = np.arange(50, 121)
+GRID_LAT = np.arange(5, 46)
+DIAMETER_STEP = 25  # meters between effective-diameter buckets
+DIAMETER_BUCKETS = np.arange(0, 5000 + DIAMETER_STEP, DIAMETER_STEP)
+
+# Zone codes stored per province (0 = total, 1 = partial, 2 = outside)
+ZONE_FACTORS = np.array([FACTOR_TOTAL, FACTOR_PARTIAL, FACTOR_OUTSIDE])
+
+_lock = threading.Lock()
+_surface = None
+
+def _grid_points() -> tuple:
+    lon, lat = np.meshgrid(GRID_LON, GRID_LAT, indexing='ij')
+    return lon.ravel(), lat.ravel()
+
+def _province_zones(table: dict) -> np.ndarray:
+    """(buckets, lon, lat, provinces) uint8 zone codes for the given provinces."""
+    ix, iy = _grid_points()
+    zona = np.empty((len(DIAMETER_BUCKETS), len(GRID_LON), len(GRID_LAT), len(table["ids"])), dtype=np.uint8)
+    for b, diameter in enumerate(DIAMETER_BUCKETS):
+        factor = simulate_impact_batch(diameter, 1.0, ix, iy, None, table)["factor"]
+        code = np.where(factor == FACTOR_TOTAL, 0, np.where(factor == FACTOR_PARTIAL, 1, 2))
+        zona[b] = code.reshape(len(GRID_LON), len(GRID_LAT), -1)
+    return zona
+
+def _nearest(table: dict) -> np.ndarray:
+    ix, iy = _grid_points()
+    dist = np.sqrt((table["cx"] - ix[:, None]) ** 2 + (table["cy"] - iy[:, None]) ** 2)
+    return np.argmin(dist, axis=1).astype(np.int16).reshape(len(GRID_LON), len(GRID_LAT))
+
+def _totals(zona: np.ndarray, table: dict) -> tuple:
+    # Same int truncation per province as simulate_impact_batch
+    afectada_zona = (table["poblacion"][:, None] * ZONE_FACTORS[None, :]).astype(np.int64)
+    total = np.zeros(zona.shape[:3], dtype=np.int64)
+    for n in range(zona.shape[3]):
+        total += afectada_zona[n][zona[..., n]]
+    return afectada_zona, total
+
+def _assemble(table: dict, zona: np.ndarray) -> dict:
+    afectada_zona, total = _totals(zona, table)
+    surface = {
+        "version": table["version"],
+        "table": table,
+        "nearest": _nearest(table),
+        "zona": zona,
+        "afectada_zona": afectada_zona,
+        "total": total,
+    }
+    for key in ("nearest", "zona", "afectada_zona", "total"):
+        surface[key].flags.writeable = False
+    return surface
+
+def build_risk_surface(table: dict=PROVINCE_TABLE) -> dict:
+    """Full build of the lookup for a province table."""
+    return _assemble(table, _province_zones(table))
+
+def get_risk_surface() -> dict:
+    """Process-wide surface for PROVINCE_TABLE, built on first use."""
+    global _surface
+    with _lock:
+        if _surface is None:
+            _surface = freeze(build_risk_surface(PROVINCE_TABLE))
+        return _surface
+
+def grid_index(lon: float, lat: float) -> tuple:
+    """Grid cell of a slider position (clipped to the map)."""
+    # Plain-Python clipping (why: np.clip on scalars costs more than the old province loop)
+    i = min(max(int(round(lon)) - int(GRID_LON[0]), 0), len(GRID_LON) - 1)
+    j = min(max(int(round(lat)) - int(GRID_LAT[0]), 0), len(GRID_LAT) - 1)
+    return i, j
+
+def diameter_bucket(diameter: float, defenses=None) -> int:
+    """Bucket of the effective diameter after defenses."""
+    reduccion = 0.0
+    if defenses is not None:
+        reduccion = min(sum(a for a, on in zip(DEFENSE_REDUCTION, defenses) if on), MAX_REDUCTION)
+    return min(max(int(round(diameter * (1 - reduccion) / DIAMETER_STEP)), 0), len(DIAMETER_BUCKETS) - 1)
+
+def nearest_province(surface: dict, lon: float, lat: float) -> str:
+    """Name of the province whose centroid is closest to (lon, lat)."""
+    return surface["table"]["nombres"][surface["nearest"][grid_index(lon, lat)]]
+
+def lookup_affected(surface: dict, lon: float, lat: float, diameter: float, defenses=None) -> np.ndarray:
+    """Per-province affected population for the nearest diameter bucket."""
+    zona = surface["zona"][(diameter_bucket(diameter, defenses),) + grid_index(lon, lat)]
+    return surface["afectada_zona"][np.arange(len(zona)), zona]
+
+def lookup_total(surface: dict, lon: float, lat: float, diameter: float, defenses=None) -> int:
+    """Total affected population for the nearest diameter bucket."""
+    return int(surface["total"][(diameter_bucket(diameter, defenses),) + grid_index(lon, lat)])
+
+def risk_heatmap(surface: dict, diameter: float, defenses=None) -> np.ndarray:
+    """(lat, lon) grid of total affected population, north row first (ready for imshow)."""
+    return bucket_heatmap(surface, diameter_bucket(diameter, defenses))
+
+def bucket_heatmap(surface: dict, bucket: int) -> np.ndarray:
+    """risk_heatmap for an already-computed diameter bucket."""
+    return surface["total"][bucket].T[::-1]
@@ -0,0 +1,64 @@
+# shared_state.py
+"""Read-only process-wide data and the per-session memory budget.
+
+Province data, decoded images, sprites, base layers and model engines are built once per
+process and shared by every session, so none of them may change in place: freeze() turns
+dicts into read-only views, lists into tuples and arrays read-only. What a session holds on
+its own (widget values, its last simulation) is measured by session_nbytes() against
+SESSION_MEMORY_BYTES.
+"""
+from collections.abc import Mapping
+from concurrent.futures import Future
+import os
+import sys
+from types import MappingProxyType
+
+import numpy as np
+
+# IMPACT_SESSION_MEMORY_MB overrides (why: classroom servers trade memory per viewer for redraws)
+SESSION_MEMORY_BYTES = int(float(os.environ.get("IMPACT_SESSION_MEMORY_MB", 4)) * 2**20)
+
+def freeze(valor):
+    """Read-only copy of nested dicts and lists; arrays are flagged read-only in place."""
+    if isinstance(valor, np.ndarray):
+        valor.flags.writeable = False
+        return valor
+    if isinstance(valor, Mapping):
+        return MappingProxyType({key: freeze(v) for key, v in valor.items()})
+    if isinstance(valor, (list, tuple)):
+        return tuple(freeze(v) for v in valor)
+    return valor
+
+def deep_nbytes(valor, shared_ids: frozenset=frozenset(), _vistos: set|None=None) -> int:
+    """Bytes reachable from `valor`, each object once; objects whose id is in `shared_ids` count 0.
+
+    Finished futures count their result (why: a session's simulation is a Future in session_state).
+    """
+    vistos = set() if _vistos is None else _vistos
+    if id(valor) in vistos or id(valor) in shared_ids:
+        return 0
+    vistos.add(id(valor))
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, Future):
+        if not valor.done() or valor.exception() is not None:
+            return 0
+        return deep_nbytes(valor.result(), shared_ids, vistos)
+    total = sys.getsizeof(valor)
+    if isinstance(valor, Mapping):
+        for key, v in valor.items():
+            total += deep_nbytes(key, shared_ids, vistos) + deep_nbytes(v, shared_ids, vistos)
+    elif isinstance(valor, (list, tuple, set, frozenset)):
+        total += sum(deep_nbytes(v, shared_ids, vistos) for v in valor)
+    return total
+
+def session_nbytes(state, shared_ids: frozenset=frozenset()) -> dict:
+    """Bytes per session_state key that the session alone keeps alive."""
+    vistos = set()
+    return {key: deep_nbytes(state[key], shared_ids, vistos) for key in list(state.keys())}
+
+def done_future(valor) -> Future:
+    """A Future that already holds `valor`."""
+    futuro = Future()
+    futuro.set_result(valor)
+    return futuro
@@ -0,0 +1,154 @@
+# soak.py
+"""Soak test: thousands of reruns of one session, asserting RSS and open figures stay flat.
+
+    python soak.py                                  # 2000 reruns, a simulation every 10 actions
+    python soak.py --reruns 5000 -o soak.json       # longer, and save the samples as JSON
+    python soak.py --no-animate                     # skip the approach clips
+
+One headless AppTest session drags the sliders and clicks SIMULATE with the shared result
+cache off (IMPACT_RESULT_CACHE_MB=0, no disk tier), so every simulation draws its impact map
+and clip through figure_pool. Between actions, with nothing in flight, it samples RSS and the
+open figures. After the first WARMUP_FRACTION of the reruns, the median RSS of the second half
+of the samples may exceed the first half's by at most --max-growth-mb (why: a clip's frames
+come and go in between, so single samples swing by ~25 MB). At every sample pyplot must hold
+no figures, the pool must have none handed out and no Figure may be alive beyond the pool's
+idle ones. Exits 1 if a check fails.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import warnings
+
+from loadtest import APP_FILE, POLL_INTERVAL, SIMULATE_TIMEOUT, percentiles, rss_bytes
+
+DEFAULT_RERUNS = 2000
+SIMULATE_EVERY = 10  # actions; the others are slider drags
+SAMPLE_EVERY = 25  # reruns between samples (why: counting live figures walks the whole heap)
+WARMUP_FRACTION = 0.2  # of the reruns, while caches, pools and the allocator settle
+MAX_GROWTH_MB = 16.0
+
+def open_figures() -> dict:
+    """pyplot's figures, the pool's counters and every live matplotlib Figure."""
+    from matplotlib.figure import Figure
+    from figure_pool import FIGURES
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    return {"pyplot": len(pyplot.get_fignums()) if pyplot else 0,
+            "live": sum(isinstance(o, Figure) for o in gc.get_objects()),
+            **FIGURES.stats()}
+
+class Soak:
+    """One session's reruns, with RSS and figure samples between actions."""
+
+    def __init__(self, reruns: int, animate: bool, seed: int=0):
+        from streamlit.testing.v1 import AppTest
+        self.reruns = reruns
+        self.animate = animate
+        self.rng = random.Random(seed)
+        self.at = AppTest.from_file(APP_FILE, default_timeout=SIMULATE_TIMEOUT)
+        self.corridas = 0
+        self.latencias = {"drag": [], "simulate": []}
+        self.muestras = []
+
+    def _run(self, accion=None):
+        (accion or self.at).run()
+        self.corridas += 1
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+    def _drag(self):
+        clave, bajo, alto = self.rng.choice((("diametro", 100, 5000), ("punto_impacto_x", 70, 120),
+                                            ("punto_impacto_y", 20, 45)))
+        self._run(self.at.sidebar.slider(key=clave).set_value(self.rng.randint(bajo, alto)))
+
+    def _simulate(self):
+        at = self.at
+        self._run(next(b for b in at.button if b.label.startswith("SIMULATE")).click())
+        limite = time.perf_counter() + SIMULATE_TIMEOUT
+        while not at.dataframe or at.session_state["sondeo_simulacion"]:
+            if time.perf_counter() > limite:
+                raise TimeoutError("simulation still pending")
+            time.sleep(POLL_INTERVAL)
+            self._run()
+
+    def _sample(self):
+        self.muestras.append({"rerun": self.corridas, "rss_mb": rss_bytes() / 2**20, **open_figures()})
+
+    def run(self):
+        self._run()
+        if not self.animate:
+            self._run(self.at.sidebar.checkbox(key="animar_impacto").uncheck())
+        self._sample()
+        acciones = 0
+        siguiente = SAMPLE_EVERY
+        while self.corridas < self.reruns:
+            acciones += 1
+            accion, fn = ("simulate", self._simulate) if acciones % SIMULATE_EVERY == 0 else ("drag", self._drag)
+            t0 = time.perf_counter()
+            fn()
+            self.latencias[accion].append((time.perf_counter() - t0) * 1000)
+            if self.corridas >= siguiente:
+                self._sample()
+                siguiente = self.corridas + SAMPLE_EVERY
+        self._sample()
+
+def check(muestras: list, reruns: int, max_growth_mb: float) -> tuple:
+    """(RSS growth after warm-up in MB, failures) of a soak's samples."""
+    estables = [m["rss_mb"] for m in muestras if m["rerun"] >= reruns * WARMUP_FRACTION]
+    mitad = len(estables) // 2
+    crecimiento = statistics.median(estables[-mitad:]) - statistics.median(estables[:mitad]) if mitad else 0.0
+    fallos = []
+    if crecimiento > max_growth_mb:
+        fallos.append(f"RSS grew {crecimiento:.1f} MB after warm-up (limit {max_growth_mb:g} MB)")
+    for m in muestras:
+        if m["pyplot"] or m["in_use"] or m["live"] > m["idle"]:
+            fallos.append(f"rerun {m['rerun']}: {m['pyplot']} pyplot figures, {m['in_use']} pooled figures "
+                          f"not released, {m['live']} live figures for {m['idle']} idle in the pool")
+    return crecimiento, fallos
+
+def main(argv: list|None=None) -> int:
+    parser = argparse.ArgumentParser(description="Soak-test the impact simulator for memory and figure leaks.")
+    parser.add_argument("--reruns", type=int, default=DEFAULT_RERUNS, help="script reruns of the session")
+    parser.add_argument("--max-growth-mb", type=float, default=MAX_GROWTH_MB,
+                        help="RSS growth allowed after warm-up")
+    parser.add_argument("--no-animate", action="store_true", help="turn the approach clip off")
+    parser.add_argument("-o", "--output", help="write the samples as JSON to this file")
+    args = parser.parse_args(argv)
+
+    # Every simulation draws (why: a cache hit would never reach the renderers)
+    os.environ["IMPACT_RESULT_CACHE_MB"] = "0"
+    os.environ["IMPACT_RESULT_CACHE_DIR"] = ""
+    logging.disable(logging.WARNING)  # "no script run context" noise outside `streamlit run`
+    warnings.filterwarnings('ignore')
+
+    soak = Soak(args.reruns, not args.no_animate)
+    t0 = time.perf_counter()
+    soak.run()
+    crecimiento, fallos = check(soak.muestras, args.reruns, args.max_growth_mb)
+    primera, ultima = soak.muestras[0], soak.muestras[-1]
+    print(f"{soak.corridas} reruns in {time.perf_counter() - t0:.0f} s, "
+          f"{len(soak.latencias['simulate'])} simulations")
+    print(f"RSS {primera['rss_mb']:.0f} -> {ultima['rss_mb']:.0f} MB, {crecimiento:+.1f} MB after warm-up")
+    print(f"figures: {ultima['created']} created, {ultima['reused']} reused, {ultima['idle']} idle, "
+          f"max live {max(m['live'] for m in soak.muestras)}")
+    for accion, muestras in soak.latencias.items():
+        tramo = len(muestras) // 4
+        if tramo:
+            print(f"{accion} p50: first quarter {statistics.median(muestras[:tramo]):.0f} ms, "
+                  f"last quarter {statistics.median(muestras[-tramo:]):.0f} ms")
+    for fallo in fallos[:10]:
+        print(f"FAIL {fallo}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"reruns": soak.corridas, "growth_mb": crecimiento, "failures": fallos,
+                       "latency": {accion: percentiles(m) for accion, m in soak.latencias.items()},
+                       "samples": soak.muestras}, f, indent=2)
+    return 1 if fallos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+# tracing.py
+"""Named timing spans per rerun, aggregated per stage and exportable as trace-event JSON.
+
+Process-wide recording is off unless the server starts with IMPACT_TRACE=1. A single session
+can still record its own reruns with begin_trace(session=True): those traces go only to the
+caller, never into the shared stage stats or the export of recent traces. When nothing is
+recording, span() hands back one shared no-op context manager, so instrumented code pays a
+flag check and an empty with-block.
+"""
+import contextlib
+from collections import deque
+import functools
+import os
+import threading
+import time
+
+STATS_WINDOW = 2000  # most recent durations kept per stage for the percentiles
+RECENT_TRACES = 100  # finished traces kept for export
+
+_enabled = os.environ.get("IMPACT_TRACE", "") not in ("", "0")
+_local = threading.local()
+_lock = threading.Lock()
+_durations = {}  # stage name -> deque of durations in ms, across all sessions
+_traces = deque(maxlen=RECENT_TRACES)
+_NOOP = contextlib.nullcontext()
+_EPOCH_NS = time.perf_counter_ns()
+
+def enabled() -> bool:
+    """True when every session is recorded (IMPACT_TRACE; why: not switchable from a page)."""
+    return _enabled
+
+def _recording() -> bool:
+    return _enabled or getattr(_local, "trace", None) is not None
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+def span(name: str):
+    """Context manager timing one stage (no-op unless this thread is recording)."""
+    if not _recording():
+        return _NOOP
+    return _Span(name)
+
+def _pool(name: str, start: int, end: int):
+    with _lock:
+        durations = _durations.get(name)
+        if durations is None:
+            durations = _durations[name] = deque(maxlen=STATS_WINDOW)
+        durations.append((end - start) / 1e6)
+
+def _record(name: str, start: int, end: int):
+    actual = getattr(_local, "trace", None)
+    if actual is not None:
+        actual["spans"].append((name, start, end))
+    if _enabled:
+        _pool(name, start, end)
+
+def begin_trace(label: str, session: bool=False):
+    """Start collecting this thread's spans when tracing is on, or for this trace alone with `session`.
+
+    A trace left open by an interrupted run is closed first.
+    """
+    if getattr(_local, "trace", None) is not None:
+        end_trace(aborted=True)
+    if _enabled or session:
+        _local.trace = {"label": label, "thread": threading.current_thread().name, "tid": threading.get_ident(),
+                        "start": time.perf_counter_ns(), "spans": [], "shared": _enabled}
+
+def end_trace(aborted: bool=False) -> dict|None:
+    """Close this thread's trace and return it; None when nothing was being traced.
+
+    Only traces recorded with tracing on are pooled and kept for export_trace_events().
+    """
+    actual = getattr(_local, "trace", None)
+    if actual is None:
+        return None
+    _local.trace = None
+    actual["end"] = time.perf_counter_ns()
+    actual["aborted"] = aborted
+    if actual["shared"]:
+        if not aborted:
+            _pool(actual["label"], actual["start"], actual["end"])
+        with _lock:
+            _traces.append(actual)
+    return actual
+
+@contextlib.contextmanager
+def trace(label: str):
+    """A trace of its own on an idle thread (fragment reruns, workers); a span inside an open one."""
+    if getattr(_local, "trace", None) is not None:
+        with _Span(label):
+            yield
+        return
+    if not _enabled:
+        yield
+        return
+    begin_trace(label)
+    try:
+        yield
+    finally:
+        end_trace()
+
+def traced(label: str):
+    """Decorator form of trace()."""
+    def decorar(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            if not _recording():
+                return fn(*args, **kwargs)
+            with trace(label):
+                return fn(*args, **kwargs)
+        return envoltura
+    return decorar
+
+def waterfall(traza: dict) -> list:
+    """Spans of a trace as (name, offset_ms, duration_ms), in start order."""
+    return [(name, (start - traza["start"]) / 1e6, (end - start) / 1e6)
+            for name, start, end in sorted(traza["spans"], key=lambda s: s[1])]
+
+def _percentile(valores: list, q: float) -> float:
+    return valores[min(len(valores) - 1, int(q / 100 * len(valores)))]
+
+def stage_stats(traces: list|None=None) -> dict:
+    """{stage: {"n", "p50_ms", "p95_ms", "p99_ms"}} of `traces`, by default the pooled recent window."""
+    if traces is not None:
+        copia = {}
+        for traza in traces:
+            tramos = traza["spans"] + ([] if traza["aborted"] else [(traza["label"], traza["start"], traza["end"])])
+            for name, start, end in tramos:
+                copia.setdefault(name, []).append((end - start) / 1e6)
+        copia = {name: sorted(valores) for name, valores in copia.items()}
+    else:
+        with _lock:
+            copia = {name: sorted(durations) for name, durations in _durations.items()}
+    return {name: {"n": len(valores), **{f"p{q}_ms": _percentile(valores, q) for q in (50, 95, 99)}}
+            for name, valores in copia.items() if valores}
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _traces.clear()
+
+def export_trace_events(traces: list|None=None) -> dict:
+    """Chrome trace-event JSON (opens in Perfetto or chrome://tracing); defaults to the recent traces."""
+    if traces is None:
+        with _lock:
+            traces = list(_traces)
+    pid = os.getpid()
+    eventos = []
+    hilos = {}
+    for traza in traces:
+        hilos[traza["tid"]] = traza["thread"]
+        eventos.append({
+            "name": traza["label"], "cat": "trace", "ph": "X", "pid": pid, "tid": traza["tid"],
+            "ts": (traza["start"] - _EPOCH_NS) / 1e3, "dur": (traza["end"] - traza["start"]) / 1e3,
+            "args": {"aborted": traza["aborted"]},
+        })
+        for name, start, end in traza["spans"]:
+            eventos.append({"name": name, "cat": "stage", "ph": "X", "pid": pid, "tid": traza["tid"],
+                            "ts": (start - _EPOCH_NS) / 1e3, "dur": (end - start) / 1e3})
+    for tid, nombre in hilos.items():
+        eventos.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": nombre}})
+    return {"traceEvents": eventos, "displayTimeUnit": "ms"}